@@ -0,0 +1,201 @@
+import pandas as pd
+
+from processing.pillars.registry import STAGE_REGISTRY
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for egestion
+    pa = None
+    pq = None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Arrow egestion. Install it with 'pip install pyarrow'.")
+
+
+def _dict_string():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def aggregate_schema():
+    """Long-format schema shared by every *Agg output."""
+    _require_pyarrow()
+    return pa.schema([
+        ('userName', pa.string()),
+        ('valueGeneratedAt', pa.timestamp('s')),
+        ('s_name', _dict_string()),
+        ('date', pa.date32()),
+        ('type', _dict_string()),
+        ('unit', _dict_string()),
+        ('valueType', _dict_string()),
+        ('value', pa.float64()),
+        ('coverage', pa.float64()),
+    ])
+
+
+def stream_schemas():
+    """Schemas of the pillar dataStream outputs, keyed by stage name."""
+    _require_pyarrow()
+    record_fields = [
+        ('userName', pa.string()),
+        ('valueGeneratedAt', pa.timestamp('s')),
+        ('dataTypeName', _dict_string()),
+        ('originDataSourceId', _dict_string()),
+        ('data_source', _dict_string()),
+        ('modifiedTime', pa.timestamp('s')),
+        ('startDate', pa.timestamp('ns')),
+        ('endDate', pa.timestamp('ns')),
+        ('unit', _dict_string()),
+        ('fit_value', pa.float64()),
+    ]
+    workout_fields = [
+        ('userName', pa.string()),
+        ('valueGeneratedAt', pa.timestamp('s')),
+        ('Sport', _dict_string()),
+        ('Lap.StartTime', pa.timestamp('ns', tz='UTC')),
+        ('startDate', pa.timestamp('ns')),
+        ('endDate', pa.timestamp('ns')),
+        ('unit', _dict_string()),
+        ('duration', pa.float64()),
+    ]
+    return {
+        'V_HR': pa.schema(record_fields + [('sleep', pa.int8()), ('activity', pa.int8()), ('workout', pa.int8()), ('resting', pa.int8())]),
+        'V_TotalCalories': pa.schema(record_fields + [('activeCalories', pa.int8()), ('restingCalories', pa.int8())]),
+        'A_StepCount': pa.schema(record_fields),
+        'A_WalkingRunningDistance': pa.schema(record_fields),
+        'A_ActivityCalories': pa.schema(record_fields),
+        'B_BodyMetrics': pa.schema(record_fields + [(name, pa.float64()) for name in ('weightKg', 'heightM', 'bmrKcalPerDay',
+                                                                                    'bmrCalories', 'caloriesPerKg')]),
+        'S_SleepType': pa.schema([(name, _dict_string() if name == 'fit_value' else dtype) for name, dtype in record_fields] + [('duration', pa.float64())]),
+        'W_Duration': pa.schema(workout_fields + [('distance', pa.float64())]),
+        'W_Calories': pa.schema(workout_fields + [('caloriesBurned', pa.float64())]),
+        'W_HeartRate': pa.schema(workout_fields[:4] + [('Lap.Track.Trackpoint.Time', pa.timestamp('ns')), ('unit', _dict_string()),
+                                                       ('Lap.MaximumHeartRateBpm', pa.float64()), ('Lap.AverageHeartRateBpm', pa.float64()),
+                                                       ('HeartRateBpm', pa.float64())]),
+        'W_Route': pa.schema(workout_fields[:7] + [('points', pa.int64()), ('keptPoints', pa.int64())]
+                             + [(name, pa.float64()) for name in ('distance', 'elevationGain', 'elevationLoss', 'avgCadence')]
+                             + [('route', pa.binary())]),
+    }
+
+
+class ArrowEgestion:
+
+    def __init__(self, max_rows_per_batch=65536):
+        _require_pyarrow()
+        self.max_rows_per_batch = max_rows_per_batch
+        self.aggregate_schema = aggregate_schema()
+        self.stream_schemas = stream_schemas()
+
+    def schema_for(self, s_name=None, df=None):
+        """Pick the aggregate schema for long-format frames, otherwise the stream schema of s_name."""
+        if df is not None and 'valueType' in df.columns:
+            return self.aggregate_schema
+        if s_name in self.stream_schemas:
+            return self.stream_schemas[s_name]
+        raise KeyError(f"No egestion schema registered for stage: {s_name}")
+
+    def stage_schema(self, s_name, df=None):
+        """Schema of a stage's output, also without rows: a frame's columns decide as in schema_for, else the registry does."""
+        if df is not None and len(df.columns):
+            return self.schema_for(s_name, df)
+        if s_name in STAGE_REGISTRY and STAGE_REGISTRY[s_name]['aggregate']:
+            return self.aggregate_schema
+        return self.schema_for(s_name)
+
+    def _column_to_arrow(self, series, field):
+        # Only columns whose pandas dtype does not already match are converted; numeric
+        # columns are handed to Arrow as-is so their buffers are not copied.
+        if pa.types.is_timestamp(field.type) or pa.types.is_date32(field.type):
+            if not pd.api.types.is_datetime64_any_dtype(series) and not (pa.types.is_date32(field.type) and series.dtype == object):
+                series = pd.to_datetime(series, errors='coerce')
+            if pa.types.is_timestamp(field.type) and isinstance(series.dtype, pd.DatetimeTZDtype):
+                series = series.dt.tz_convert(field.type.tz) if field.type.tz else series.dt.tz_localize(None)
+        elif pa.types.is_floating(field.type) and not pd.api.types.is_float_dtype(series):
+            series = pd.to_numeric(series, errors='coerce')
+        return pa.array(series, type=field.type, from_pandas=True)
+
+    def to_record_batch(self, df, schema):
+        """Convert one pillar output frame to a RecordBatch with the given schema."""
+        arrays = []
+        for field in schema:
+            series = df[field.name] if field.name in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+            arrays.append(self._column_to_arrow(series, field))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def record_batches(self, frames, s_name=None):
+        """Yield bounded-size RecordBatches from an iterable of frames (e.g. one per user)."""
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+        for df in frames:
+            if df is None or df.empty:
+                continue
+            batch = self.to_record_batch(df, self.schema_for(s_name, df))
+            # slice() is zero-copy, it only moves offsets over the same buffers
+            for offset in range(0, batch.num_rows, self.max_rows_per_batch):
+                yield batch.slice(offset, self.max_rows_per_batch)
+
+    def stage_batches(self, stage_outputs):
+        """Yield (s_name, RecordBatch) pairs from a PillarRunner.process() result."""
+        for s_name, df in stage_outputs.items():
+            if s_name in self.stream_schemas or 'valueType' in df.columns:
+                for batch in self.record_batches(df, s_name):
+                    yield s_name, batch
+
+    def to_table(self, frames, s_name=None):
+        batches = list(self.record_batches(frames, s_name))
+        if not batches:
+            return None
+        return pa.Table.from_batches(batches)
+
+    def write_parquet(self, frames, path, s_name=None, compression='zstd'):
+        """Stream frames into one Parquet file without concatenating them first.
+
+        Without any row the file is still written, empty with the stage schema, so readers of the
+        path find a file whatever the window held.
+        """
+        writer = None
+        rows = 0
+        try:
+            for batch in self.record_batches(frames, s_name):
+                if writer is None:
+                    writer = pq.ParquetWriter(path, batch.schema, compression=compression)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+            if writer is None:
+                schema = self.stage_schema(s_name, frames if isinstance(frames, pd.DataFrame) else None)
+                writer = pq.ParquetWriter(path, schema, compression=compression)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def write_ipc(self, frames, path, s_name=None):
+        """Stream frames into an Arrow IPC stream file; dictionaries may change between batches.
+
+        Without any row the stream holds only the stage schema, as in write_parquet.
+        """
+        writer = None
+        rows = 0
+        try:
+            for batch in self.record_batches(frames, s_name):
+                if writer is None:
+                    writer = pa.ipc.new_stream(path, batch.schema)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+            if writer is None:
+                writer = pa.ipc.new_stream(path, self.stage_schema(s_name, frames if isinstance(frames, pd.DataFrame) else None))
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def read_ipc(self, path):
+        """Memory-map an IPC stream file written by write_ipc; buffers are not copied into RAM."""
+        # The returned table keeps the mapping alive, so the source is not closed here
+        source = pa.memory_map(path, 'r')
+        return pa.ipc.open_stream(source).read_all()
+
+    def read_parquet(self, path, columns=None, filters=None):
+        return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
@@ -0,0 +1,373 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+
+import pandas as pd
+
+from processing.pillars.registry import STAGE_REGISTRY, load_class
+from processing.rollup.dailyRollup import window_dates
+
+# Upper bounds of the latency buckets, in milliseconds; slower requests fall in the last, open bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class LatencyHistogram:
+    """Request count per latency bucket, with the total and maximum, for one endpoint."""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        elapsed_ms = seconds * 1000
+        bucket = next((position for position, bound in enumerate(self.buckets_ms) if elapsed_ms <= bound), len(self.buckets_ms))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (the maximum for the open bucket)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets_ms[position] if position < len(self.buckets_ms) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        labels = [f'<={bound}ms' for bound in self.buckets_ms] + [f'>{self.buckets_ms[-1]}ms']
+        return {
+            'count': self.count,
+            'meanMs': round(self.total_ms / self.count, 3) if self.count else None,
+            'maxMs': round(self.max_ms, 3),
+            'p50Ms': self.quantile(0.5),
+            'p95Ms': self.quantile(0.95),
+            'p99Ms': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+def query_args(params):
+    """Pillar date arguments from query parameters, in the forms the pillar classes take.
+
+    date=D (one day), date=D1,D2 or date repeated (list of days), start=S&end=E (range) or
+    date=D&offset=N&sign=+|- (offset window).
+    """
+    dates = [date for value in params.get('date', []) for date in value.split(',') if date]
+    if 'start' in params and 'end' in params:
+        return (params['start'][0], params['end'][0])
+    if len(dates) == 1 and 'offset' in params:
+        sign = params.get('sign', ['+'])[0]
+        if sign not in ('+', '-'):
+            raise ValueError(f"Unsupported sign: {sign}")
+        value = params['offset'][0]
+        try:
+            offset = int(value)
+        except ValueError as error:
+            raise ValueError(f"Invalid offset: {value}") from error
+        return (dates[0], offset, sign)
+    if len(dates) == 1:
+        return (dates[0],)
+    if dates:
+        return (dates,)
+    raise ValueError('A date window is required: date, start and end, or date, offset and sign')
+
+
+class QueryService:
+    """Local asyncio service answering pillar queries from user datasets kept resident in the process.
+
+    A user's bronze and activities frames are loaded once through `loader` (user_name -> (googleFit_df,
+    googleFit_activitiesData)) and kept in an LRU of max_users; the rows each stage reads (its registry
+    data sources and columns) are selected from them once and shared by every later query. Identical
+    queries in flight, (user, stage, view, window), are coalesced onto one computation, and results are
+    kept in an LRU of max_results together with their encoded responses, so a repeated query is a
+    lookup. Stage classes run on a thread pool, so the event loop keeps accepting requests.
+
+    Over HTTP (TCP or a Unix socket), GET /stages/<s_name>?user=...&<window> answers with JSON
+    records, an Arrow IPC stream (format=arrow) or, for clients on the same host, the path of an
+    Arrow IPC file in shared memory (format=shm) that ArrowEgestion.read_ipc memory-maps without
+    copying. GET /metrics reports per-endpoint latency histograms and cache counters; GET /users
+    lists the resident users.
+    """
+
+    VIEWS = ('aggregate', 'stream')
+    FORMATS = ('json', 'arrow', 'shm')
+
+    def __init__(self, loader, max_users=8, max_results=256, max_workers=None, shm_dir=None):
+        self.loader = loader
+        self.max_users = max_users
+        self.max_results = max_results
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        default_shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.shm_dir = shm_dir or os.path.join(default_shm, 'fh-corex')
+        # userName -> {'allData', 'activitiesData', 'stages': {s_name: selected input frame}}
+        self._datasets = OrderedDict()
+        # (user, s_name, view, args) -> {'frame': DataFrame, format: encoded response}
+        self._results = OrderedDict()
+        self._inflight = {}
+        self.histograms = {}
+        self.counters = {'requests': 0, 'computed': 0, 'coalesced': 0, 'cacheHits': 0, 'datasetLoads': 0, 'errors': 0}
+
+    # --- datasets ---------------------------------------------------------------------------
+
+    def add_user(self, user_name, googleFit_df, googleFit_activitiesData=None):
+        """Make a user's frames resident, replacing any earlier version and its cached results."""
+        self.refresh(user_name)
+        self._datasets[user_name] = {
+            'allData': googleFit_df,
+            'activitiesData': googleFit_activitiesData if googleFit_activitiesData is not None else pd.DataFrame(),
+            'stages': {},
+        }
+        while len(self._datasets) > self.max_users:
+            self._datasets.popitem(last=False)
+
+    def refresh(self, user_name):
+        """Drop a user's resident frames and cached results, e.g. after new data was ingested."""
+        self._datasets.pop(user_name, None)
+        for key in [key for key in self._results if key[0] == user_name]:
+            self._drop_result(key)
+
+    def users(self):
+        return list(self._datasets)
+
+    async def _dataset(self, user_name):
+        if user_name in self._datasets:
+            self._datasets.move_to_end(user_name)
+            return self._datasets[user_name]
+        if ('load', user_name) not in self._inflight:
+            self.counters['datasetLoads'] += 1
+        frames = await self._coalesced(('load', user_name), lambda: self.loader(user_name))
+        if user_name not in self._datasets:
+            self.add_user(user_name, *frames)
+        return self._datasets[user_name]
+
+    def _stage_input(self, dataset, s_name):
+        """The rows and columns of the resident frame one stage reads, selected on first use."""
+        entry = STAGE_REGISTRY[s_name]
+        selected = dataset['stages'].get(s_name)
+        if selected is None:
+            df = dataset[entry['source']]
+            if df is not None and not df.empty and entry['source'] == 'allData':
+                keep = df['data_source'].isin(entry['data_sources']) if entry['data_sources'] is not None else slice(None)
+                columns = list(df.columns) if entry['columns'] is None else [col for col in df.columns if col in entry['columns']]
+                # Row order and df.attrs are kept, so a frame validated at ingest stays conforming
+                df = df.loc[keep, columns]
+            selected = dataset['stages'][s_name] = df
+        return selected
+
+    # --- queries ----------------------------------------------------------------------------
+
+    async def _coalesced(self, key, func):
+        """Run func on the thread pool once per key at a time; concurrent callers share its result."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters['coalesced'] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(self.executor, func))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A caller that goes away must not cancel the computation the others are waiting on
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _key_args(args):
+        return tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+
+    async def _result(self, user_name, s_name, *args, view='aggregate'):
+        if s_name not in STAGE_REGISTRY:
+            raise KeyError(f"Unknown stage: {s_name}")
+        if view not in self.VIEWS:
+            raise ValueError(f"Unsupported view: {view}")
+        key = (user_name, s_name, view, self._key_args(args))
+        if key in self._results:
+            self.counters['cacheHits'] += 1
+            self._results.move_to_end(key)
+            return key, self._results[key]
+
+        dataset = await self._dataset(user_name)
+        entry = STAGE_REGISTRY[s_name]
+        class_path = entry['stream'] if view == 'stream' else entry['aggregate'] or entry['stream']
+
+        def run_stage():
+            return load_class(class_path)(self._stage_input(dataset, s_name), *args).process()
+
+        if key not in self._inflight:
+            self.counters['computed'] += 1
+        frame = await self._coalesced(key, run_stage)
+        if key not in self._results:
+            self._results[key] = {'frame': frame}
+            while len(self._results) > self.max_results:
+                self._drop_result(next(iter(self._results)))
+        return key, self._results[key]
+
+    async def query(self, user_name, s_name, *args, view='aggregate'):
+        """A stage's output for one user and window, computed at most once while it stays cached."""
+        _, result = await self._result(user_name, s_name, *args, view=view)
+        return result['frame']
+
+    def _drop_result(self, key):
+        result = self._results.pop(key, None)
+        if result and result.get('shm'):
+            try:
+                os.remove(json.loads(result['shm'])['path'])
+            except OSError:
+                pass
+
+    # --- encoding ---------------------------------------------------------------------------
+
+    def _arrow_batches(self, key, frame):
+        from data_egestion.arrowEgestion import ArrowEgestion
+        # Stream schemas are registered per stage; long-format frames all use the aggregate schema
+        return ArrowEgestion().record_batches(frame, key[1])
+
+    def _arrow_schema(self, key, frame):
+        from data_egestion.arrowEgestion import ArrowEgestion
+        return ArrowEgestion().stage_schema(key[1], frame)
+
+    def _encode(self, key, result, fmt):
+        frame = result['frame']
+        if fmt == 'json':
+            return frame.to_json(orient='records', date_format='iso').encode()
+        import pyarrow as pa
+        if fmt == 'arrow':
+            sink = pa.BufferOutputStream()
+            writer = None
+            for batch in self._arrow_batches(key, frame):
+                writer = writer or pa.ipc.new_stream(sink, batch.schema)
+                writer.write_batch(batch)
+            # A window without rows still answers with the stage schema
+            writer = writer or pa.ipc.new_stream(sink, self._arrow_schema(key, frame))
+            writer.close()
+            return sink.getvalue().to_pybytes()
+        # shm: written once per cached result; the file lives as long as the result stays cached
+        from data_egestion.arrowEgestion import ArrowEgestion
+        os.makedirs(self.shm_dir, exist_ok=True)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        path = os.path.join(self.shm_dir, f"{quote(str(key[0]), safe='')}-{key[1]}-{digest}.arrows")
+        rows = ArrowEgestion().write_ipc(frame, path, key[1])
+        return json.dumps({'path': path, 'rows': rows}).encode()
+
+    async def respond(self, user_name, s_name, *args, view='aggregate', fmt='json'):
+        """The encoded response body of a query; encodings are cached with the result."""
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        key, result = await self._result(user_name, s_name, *args, view=view)
+        if fmt not in result:
+            result[fmt] = await self._coalesced(key + (fmt,), lambda: self._encode(key, result, fmt))
+        return result[fmt]
+
+    # --- metrics ----------------------------------------------------------------------------
+
+    def observe(self, endpoint, seconds):
+        self.histograms.setdefault(endpoint, LatencyHistogram()).observe(seconds)
+
+    def metrics(self):
+        return {
+            'counters': dict(self.counters),
+            'residentUsers': len(self._datasets),
+            'cachedResults': len(self._results),
+            'inflight': len(self._inflight),
+            'endpoints': {endpoint: histogram.to_dict() for endpoint, histogram in sorted(self.histograms.items())},
+        }
+
+    # --- HTTP -------------------------------------------------------------------------------
+
+    def _request(self, s_name, params):
+        """(user, date args, view, format) of a stage request; KeyError for an unknown stage, ValueError for a bad parameter."""
+        if s_name not in STAGE_REGISTRY:
+            raise KeyError(f"Unknown stage: {s_name}")
+        if 'user' not in params:
+            raise ValueError('The user parameter is required')
+        view = params.get('view', ['aggregate'])[0]
+        if view not in self.VIEWS:
+            raise ValueError(f"Unsupported view: {view}")
+        fmt = params.get('format', ['json'])[0]
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        args = query_args(params)
+        try:
+            window_dates(*args)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Invalid date window: {error}") from error
+        return params['user'][0], args, view, fmt
+
+    async def _route(self, method, target):
+        """(endpoint label, status, content type, body) of one request."""
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        if method != 'GET':
+            return 'other', 405, 'application/json', json.dumps({'error': f"Unsupported method: {method}"}).encode()
+        if url.path == '/metrics':
+            return '/metrics', 200, 'application/json', json.dumps(self.metrics()).encode()
+        if url.path == '/users':
+            return '/users', 200, 'application/json', json.dumps(self.users()).encode()
+        if url.path.startswith('/stages/'):
+            s_name = url.path[len('/stages/'):]
+            endpoint = f'/stages/{s_name}' if s_name in STAGE_REGISTRY else '/stages/unknown'
+            try:
+                user_name, args, view, fmt = self._request(s_name, params)
+            except KeyError as error:
+                return endpoint, 404, 'application/json', json.dumps({'error': str(error).strip("'")}).encode()
+            except ValueError as error:
+                return endpoint, 400, 'application/json', json.dumps({'error': str(error)}).encode()
+            try:
+                body = await self.respond(user_name, s_name, *args, view=view, fmt=fmt)
+            except Exception as error:
+                # The request was validated above, so whatever the stage or loader raises is a server error
+                return endpoint, 500, 'application/json', json.dumps({'error': f'{type(error).__name__}: {error}'}).encode()
+            content_type = 'application/vnd.apache.arrow.stream' if fmt == 'arrow' else 'application/json'
+            return endpoint, 200, content_type, body
+        return 'other', 404, 'application/json', json.dumps({'error': f"Unknown path: {url.path}"}).encode()
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP/1.1 request per connection."""
+        request_start = time.perf_counter()
+        endpoint = 'other'
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request_line) < 2:
+                return
+            self.counters['requests'] += 1
+            try:
+                endpoint, status, content_type, body = await self._route(request_line[0], request_line[1])
+            except Exception as error:
+                status, content_type, body = 500, 'application/json', json.dumps({'error': repr(error)}).encode()
+            if status >= 400:
+                self.counters['errors'] += 1
+            writer.write(f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+            self.observe(endpoint, time.perf_counter() - request_start)
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """Start listening on a Unix socket when path is given, otherwise on host:port; returns the server."""
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host=host, port=port)
+
+    def serve(self, host='127.0.0.1', port=8765, path=None):
+        """Run the service until interrupted."""
+        async def main():
+            server = await self.start(host, port, path)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
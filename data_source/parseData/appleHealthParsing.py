@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
+
+from data_source.parseData.bronzeContract import BRONZE_DTYPES
+from data_source.parseData.userTimezones import UserTimezones
+from processing.pillars.dataSources import (ACTIVE_MINUTES_SOURCE, ACTIVITY_SEGMENT_SOURCE, CALORIES_SOURCE, DISTANCE_SOURCE,
+                                            HR_SOURCE, SLEEP_SOURCE, STEP_COUNT_SOURCE)
+
+# HealthKit quantity type -> (Google Fit data source, dataTypeName, unit the pillars expect)
+RECORD_TYPES = {
+    'HKQuantityTypeIdentifierHeartRate': (HR_SOURCE, 'com.google.heart_rate.bpm', 'count/min'),
+    'HKQuantityTypeIdentifierStepCount': (STEP_COUNT_SOURCE, 'com.google.step_count.delta', 'count'),
+    'HKQuantityTypeIdentifierDistanceWalkingRunning': (DISTANCE_SOURCE, 'com.google.distance.delta', 'm'),
+    'HKQuantityTypeIdentifierActiveEnergyBurned': (CALORIES_SOURCE, 'com.google.calories.expended', 'kcal'),
+    'HKQuantityTypeIdentifierBasalEnergyBurned': (CALORIES_SOURCE, 'com.google.calories.expended', 'kcal'),
+    'HKQuantityTypeIdentifierAppleExerciseTime': (ACTIVE_MINUTES_SOURCE, 'com.google.active_minutes', 'min'),
+}
+SLEEP_TYPE = 'HKCategoryTypeIdentifierSleepAnalysis'
+BASAL_ENERGY_TYPE = 'HKQuantityTypeIdentifierBasalEnergyBurned'
+
+# Factor from an export unit to the unit in RECORD_TYPES; records in any other unit are dropped
+UNIT_SCALE = {
+    'count/min': {'count/min': 1.0},
+    'count': {'count': 1.0},
+    'm': {'m': 1.0, 'km': 1000.0, 'cm': 0.01, 'mi': 1609.344, 'ft': 0.3048, 'yd': 0.9144},
+    'kcal': {'kcal': 1.0, 'Cal': 1.0, 'cal': 0.001, 'kJ': 1 / 4.184, 'J': 1 / 4184},
+    'min': {'min': 1.0, 's': 1 / 60, 'hr': 60.0},
+}
+
+# Sleep analysis values -> Google sleep stages (see SSleepType.SLEEP_STAGE_MAPPING). InBed has no
+# Google counterpart and overlaps the asleep samples, so it is not mapped
+SLEEP_VALUES = {
+    'HKCategoryValueSleepAnalysisAwake': 1,
+    'HKCategoryValueSleepAnalysisAsleep': 2,
+    'HKCategoryValueSleepAnalysisAsleepUnspecified': 2,
+    'HKCategoryValueSleepAnalysisAsleepCore': 4,
+    'HKCategoryValueSleepAnalysisAsleepDeep': 5,
+    'HKCategoryValueSleepAnalysisAsleepREM': 6,
+}
+
+# Workout types -> Google Fit activity types; others become 4 (unknown)
+WORKOUT_TYPES = {
+    'HKWorkoutActivityTypeCycling': 1,
+    'HKWorkoutActivityTypeWalking': 7,
+    'HKWorkoutActivityTypeRunning': 8,
+    'HKWorkoutActivityTypeBadminton': 10,
+    'HKWorkoutActivityTypeDance': 24,
+    'HKWorkoutActivityTypeElliptical': 25,
+    'HKWorkoutActivityTypeHiking': 35,
+    'HKWorkoutActivityTypeTraditionalStrengthTraining': 80,
+    'HKWorkoutActivityTypeFunctionalStrengthTraining': 80,
+    'HKWorkoutActivityTypeSwimming': 82,
+    'HKWorkoutActivityTypeYoga': 100,
+    'HKWorkoutActivityTypeHighIntensityIntervalTraining': 114,
+}
+UNKNOWN_ACTIVITY = 4
+
+
+
+def apple_utc_nanos(values):
+    """int64 UTC epoch nanoseconds for Apple '2024-09-16 10:17:57 +0530' strings.
+
+    The wall-clock part is parsed on pandas' fixed-format fast path and the few distinct offsets
+    are decoded once each; strptime with %z would run per row and is an order of magnitude slower.
+    """
+    values = pd.Series(values, dtype='object')
+    wall_ns = pd.to_datetime(values.str.slice(0, 19), format='%Y-%m-%d %H:%M:%S').to_numpy(dtype='datetime64[ns]').view('int64')
+    codes, offsets = pd.factorize(values.str.slice(20))
+    offset_s = np.array([(-1 if offset[0] == '-' else 1) * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+                         for offset in offsets], dtype='int64')
+    return wall_ns - offset_s[codes] * 10**9
+
+
+class AppleHealthParser:
+    """Stream an Apple Health export.xml into typed chunks of the Google Fit bronze schema.
+
+    The file is read with iterparse and every top-level element is dropped as soon as it has been
+    mapped, so memory holds one chunk of rows rather than the document tree. Records are mapped onto
+    the Google data sources the pillars read: active energy keeps its Apple origin, while basal energy
+    takes the merged calories source as origin, so VCalorieTimeline counts it as resting like Google's
+    BMR share. Workouts become activity segments carrying the Google activity type.
+    """
+
+    def __init__(self, timezones=None, chunk_rows=50_000):
+        self.timezones = timezones if timezones is not None else UserTimezones()
+        self.chunk_rows = chunk_rows
+        self._origins = {}
+
+    def _map_record(self, attrib):
+        record_type = attrib.get('type')
+        if record_type == SLEEP_TYPE:
+            stage = SLEEP_VALUES.get(attrib.get('value'))
+            if stage is None:
+                return None
+            return SLEEP_SOURCE, 'com.google.sleep.segment', float(stage), 'intVal', attrib
+        if record_type not in RECORD_TYPES:
+            return None
+        data_source, data_type_name, unit = RECORD_TYPES[record_type]
+        scale = UNIT_SCALE[unit].get(attrib.get('unit', unit))
+        try:
+            value = float(attrib['value']) * scale if scale is not None else None
+        except (KeyError, ValueError):
+            value = None
+        if value is None:
+            return None
+        return data_source, data_type_name, value, 'fpVal', attrib
+
+    def _map_workout(self, attrib):
+        activity = WORKOUT_TYPES.get(attrib.get('workoutActivityType'), UNKNOWN_ACTIVITY)
+        return ACTIVITY_SEGMENT_SOURCE, 'com.google.activity.segment', float(activity), 'intVal', attrib
+
+    def _origin(self, data_type_name, attrib):
+        if attrib.get('type') == BASAL_ENERGY_TYPE:
+            return CALORIES_SOURCE
+        # One string object per (type, source app) instead of one per buffered row
+        key = (data_type_name, attrib.get('sourceName', ''))
+        if key not in self._origins:
+            self._origins[key] = f"raw:{data_type_name}:com.apple.health:{key[1]}"
+        return self._origins[key]
+
+    def iter_chunks(self, xml_file, user_name=None, data_sources=None):
+        """Yield bronze DataFrames of at most chunk_rows rows; xml_file is a path or a binary file object.
+
+        With data_sources, elements mapped to any other source are skipped before they are buffered.
+        """
+        columns = {name: [] for name in ('start', 'end', 'created', 'origin', 'dataTypeName', 'fit_value_type',
+                                         'fit_value', 'data_source')}
+        depth, root = 0, None
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+
+            # A top-level element is complete: map it, then drop it and everything parsed before it
+            mapped = None
+            if elem.tag == 'Record':
+                mapped = self._map_record(elem.attrib)
+            elif elem.tag == 'Workout':
+                mapped = self._map_workout(elem.attrib)
+            if mapped is not None and (data_sources is None or mapped[0] in data_sources):
+                data_source, data_type_name, value, value_type, attrib = mapped
+                columns['start'].append(attrib.get('startDate'))
+                columns['end'].append(attrib.get('endDate'))
+                columns['created'].append(attrib.get('creationDate', attrib.get('endDate')))
+                columns['origin'].append(self._origin(data_type_name, attrib))
+                columns['dataTypeName'].append(data_type_name)
+                columns['fit_value_type'].append(value_type)
+                columns['fit_value'].append(value)
+                columns['data_source'].append(data_source)
+            root.clear()
+
+            if len(columns['start']) >= self.chunk_rows:
+                yield self._to_frame(columns, user_name)
+                columns = {name: [] for name in columns}
+        if columns['start']:
+            yield self._to_frame(columns, user_name)
+
+    def _to_frame(self, columns, user_name):
+        """One typed chunk: UTC epoch columns plus local wall-clock times, as ParseData.local_times derives them."""
+        start_nanos = apple_utc_nanos(columns['start'])
+        end_nanos = apple_utc_nanos(columns['end'])
+        created_nanos = apple_utc_nanos(columns['created'])
+        df = pd.DataFrame({
+            'startDate': self.timezones.to_local(start_nanos, user_name).dt.floor('s').to_numpy(),
+            'endDate': self.timezones.to_local(end_nanos, user_name).dt.floor('s').to_numpy(),
+            'modifiedTime': self.timezones.to_local(created_nanos, user_name).dt.floor('s').to_numpy(),
+            'originDataSourceId': pd.Series(columns['origin'], dtype='object'),
+            'endTimeNanos': end_nanos,
+            'dataTypeName': pd.Series(columns['dataTypeName'], dtype='object'),
+            'startTimeNanos': start_nanos,
+            'fit_value_type': pd.Series(columns['fit_value_type'], dtype='object'),
+            'fit_value': np.asarray(columns['fit_value'], dtype='float64'),
+            'data_source': pd.Series(columns['data_source'], dtype='object'),
+        })
+        return df.astype({column: dtype for column, dtype in BRONZE_DTYPES.items() if column in df.columns})
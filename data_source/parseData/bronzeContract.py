@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+BRONZE_CONTRACT_VERSION = 1
+
+# Typed bronze schema produced by ParseData.allData_json; userName is checked only when present
+BRONZE_DTYPES = {
+    'startDate': np.dtype('datetime64[ns]'),
+    'endDate': np.dtype('datetime64[ns]'),
+    'modifiedTime': np.dtype('datetime64[ns]'),
+    'startTimeNanos': np.dtype('int64'),
+    'endTimeNanos': np.dtype('int64'),
+    'fit_value': np.dtype('float64'),
+    'dataTypeName': np.dtype('object'),
+    'originDataSourceId': np.dtype('object'),
+    'data_source': np.dtype('object'),
+}
+OPTIONAL_DTYPES = {
+    'userName': np.dtype('object'),
+}
+
+CONTRACT_ATTR = 'bronzeContract'
+
+
+class BronzeContractError(ValueError):
+    pass
+
+
+def contract_violations(df):
+    """Every way df breaks the bronze contract; an empty list means it conforms."""
+    problems = []
+    for column, dtype in BRONZE_DTYPES.items():
+        if column not in df.columns:
+            problems.append(f"missing column {column}")
+        elif df[column].dtype != dtype:
+            problems.append(f"{column} is {df[column].dtype}, expected {dtype}")
+    for column, dtype in OPTIONAL_DTYPES.items():
+        if column in df.columns and df[column].dtype != dtype:
+            problems.append(f"{column} is {df[column].dtype}, expected {dtype}")
+    if problems:
+        return problems
+
+    if df['startDate'].isna().any() or df['endDate'].isna().any():
+        problems.append("startDate/endDate contain NaT")
+    elif (df['endDate'] < df['startDate']).any():
+        problems.append("endDate before startDate")
+    return problems
+
+
+def validate_bronze(df, strict=False):
+    """Check a bronze frame once and mark it as conforming.
+
+    A conforming frame is returned sorted by startDate with a fresh index and the contract recorded
+    in df.attrs, which pandas carries through row selections and copies. A frame that does not
+    conform is returned unmarked (or BronzeContractError is raised with strict=True), and the
+    pillars keep using their defensive path for it.
+    """
+    # Lossless casts only, e.g. a stream whose values were all intVal; anything else is a violation
+    for column in ('fit_value', 'startTimeNanos', 'endTimeNanos'):
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]) and df[column].dtype != BRONZE_DTYPES[column]:
+            df = df.assign(**{column: df[column].astype(BRONZE_DTYPES[column])})
+
+    problems = contract_violations(df)
+    if problems:
+        if strict:
+            raise BronzeContractError('; '.join(problems))
+        df.attrs.pop(CONTRACT_ATTR, None)
+        return df
+
+    if not df['startDate'].is_monotonic_increasing:
+        df = df.sort_values('startDate', kind='stable', ignore_index=True)
+    elif not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        df = df.reset_index(drop=True)
+    df.attrs[CONTRACT_ATTR] = {'version': BRONZE_CONTRACT_VERSION, 'sortedBy': 'startDate'}
+    return df
+
+
+def is_conforming(df):
+    """True when df was validated and is still typed and sorted as the contract says."""
+    contract = df.attrs.get(CONTRACT_ATTR)
+    if not contract or contract.get('version') != BRONZE_CONTRACT_VERSION:
+        return False
+    # Dtypes and order are cheap to re-check and catch frames mutated or concatenated after validation
+    return (all(column in df.columns and df[column].dtype == dtype for column, dtype in BRONZE_DTYPES.items())
+            and df['startDate'].is_monotonic_increasing)
+
+
+def day_window(df, start_of_day, end_of_day):
+    """Rows of a conforming frame starting in [start_of_day, end_of_day] and ending by end_of_day.
+
+    Row selections keep the startDate order, so the start bound is a binary search and only the
+    rows inside it are compared against the end bound.
+    """
+    starts = df['startDate'].to_numpy()
+    lower = np.searchsorted(starts, np.datetime64(start_of_day, 'ns'), side='left')
+    upper = np.searchsorted(starts, np.datetime64(end_of_day, 'ns'), side='right')
+    ends = df['endDate'].to_numpy()[lower:upper]
+    positions = lower + np.flatnonzero(ends <= np.datetime64(end_of_day, 'ns'))
+    return df.take(positions).reset_index(drop=True)
@@ -1,43 +1,96 @@
 import json
 import os
+import re
+import zipfile
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from data_source.parseData.appleHealthParsing import AppleHealthParser
+from data_source.parseData.bronzeContract import validate_bronze
+from data_source.parseData.userTimezones import UserTimezones
 
 class ParseData:
+
+    DEDUP_KEY = ['data_source', 'startTimeNanos', 'endTimeNanos', 'fit_value']
+
+    # Takeout writes "Data Source" before "Data Points", so it is found in the first bytes of the file
+    DATA_SOURCE_PATTERN = re.compile(rb'"Data Source"\s*:\s*"((?:[^"\\]|\\.)*)"')
+    PEEK_BYTES = 4096
+
+    # Takeout archive part -> (folder inside Takeout/Fit, member suffix)
+    TAKEOUT_PARTS = {
+        'allData': ('Fit/All Data/', '.json'),
+        'activitiesData': ('Fit/Activities/', '.tcx'),
+        'sessions': ('Fit/All Sessions/', '.json'),
+        'dailyActivityMetrics': ('Fit/Daily activity metrics/', 'Daily activity metrics.csv'),
+    }
+
+    # Trackpoint column -> element path; running cadence is written in the ActivityExtension TPX block
+    TCX_TRACKPOINT_FIELDS = {
+        'Lap.Track.Trackpoint.Position.LatitudeDegrees': 'tcx:Position/tcx:LatitudeDegrees',
+        'Lap.Track.Trackpoint.Position.LongitudeDegrees': 'tcx:Position/tcx:LongitudeDegrees',
+        'Lap.Track.Trackpoint.AltitudeMeters': 'tcx:AltitudeMeters',
+        'Lap.Track.Trackpoint.Cadence': 'tcx:Cadence',
+        'Lap.Track.Trackpoint.RunCadence': 'tcx:Extensions/ns3:TPX/ns3:RunCadence',
+    }
+
+    def __init__(self, rollup_store=None, timezones=None, bronze_store=None):
+        # Optional DailyRollupStore refreshed whenever a user's data is ingested
+        self.rollup_store = rollup_store
+        # Optional BronzeStore that keeps each user's history across repeated exports
+        self.bronze_store = bronze_store
+        # Per-user timezone history; users without one are read in the default zone
+        self.timezones = timezones if timezones is not None else UserTimezones()
+        self.dedup_report = pd.DataFrame(columns=['data_source', 'rowsIn', 'exactDuplicates', 'sameIntervalDuplicates', 'rowsOut'])
     
-    def nanos_to_datetime(self, nanos):
-        """Convert nanoseconds to IST datetime."""
-        utc_time = pd.to_datetime(nanos, unit='ns')
-        ist_time = utc_time.tz_localize('UTC').tz_convert('Asia/Kolkata')
-        return ist_time.strftime('%Y-%m-%d %H:%M:%S')
-
-    def millis_to_datetime(self, millis):
-        """Convert milliseconds to IST datetime."""
-        utc_time = pd.to_datetime(millis, unit='ms')
-        ist_time = utc_time.tz_localize('UTC').tz_convert('Asia/Kolkata')
-        return ist_time.strftime('%Y-%m-%d %H:%M:%S')
-
-    def parse_json(self, file_path):
+    def nanos_to_datetime(self, nanos, user_name=None):
+        """Convert nanoseconds to the user's local datetime string (single values; frames use local_times)."""
+        return self.timezones.to_local([int(nanos)], user_name).iloc[0].strftime('%Y-%m-%d %H:%M:%S')
+
+    def millis_to_datetime(self, millis, user_name=None):
+        """Convert milliseconds to the user's local datetime string (single values; frames use local_times)."""
+        return self.timezones.to_local([int(millis)], user_name, unit='ms').iloc[0].strftime('%Y-%m-%d %H:%M:%S')
+
+    def local_times(self, df, user_name=None):
+        """Derive the local startDate/endDate/modifiedTime columns from the UTC epoch columns in one vectorized step."""
+        local_columns = [('startDate', 'startTimeNanos', 'ns'), ('endDate', 'endTimeNanos', 'ns'), ('modifiedTime', 'modifiedTimeMillis', 'ms')]
+        df = df.drop(columns=[local for local, _, _ in local_columns if local in df.columns])
+        for position, (local, epoch, unit) in enumerate(local_columns):
+            if epoch in df.columns:
+                epoch_values = pd.to_numeric(df[epoch], errors='coerce')
+                # Second precision, as the pillars' inclusive interval comparisons have always seen it
+                df.insert(position, local, self.timezones.to_local(epoch_values, user_name, unit=unit).dt.floor('s').to_numpy())
+        return df.drop(columns=['modifiedTimeMillis'], errors='ignore')
+
+    def _data_source_in(self, head):
+        match = self.DATA_SOURCE_PATTERN.search(head)
+        return json.loads(b'"' + match.group(1) + b'"') if match else None
+
+    def peek_data_source(self, file_path):
+        """The "Data Source" of an All Data file read from its first bytes, or None when it is not there."""
+        with open(file_path, 'rb') as file:
+            return self._data_source_in(file.read(self.PEEK_BYTES))
+
+    def parse_json(self, file_path, user_name=None):
         """Parse a single JSON file and return a DataFrame."""
         with open(file_path, 'r', encoding='utf-8') as file:
             data = json.load(file)
-        
+        return self.parse_fit_data(data, user_name)
+
+    def parse_fit_data(self, data, user_name=None):
+        """Turn one decoded All Data document ({"Data Source", "Data Points"}) into a DataFrame."""
         data_source = data.get('Data Source', '')
         data_points = data.get('Data Points', [])
         
         parsed_data = []
         for point in data_points:
             parsed_row = {}
-            start_time_nanos = point.get('startTimeNanos')
-            end_time_nanos = point.get('endTimeNanos')
-            modified_time_millis = point.get('modifiedTimeMillis')
-
-            parsed_row['startDate'] = self.nanos_to_datetime(start_time_nanos) if start_time_nanos else None
-            parsed_row['endDate'] = self.nanos_to_datetime(end_time_nanos) if end_time_nanos else None
-            parsed_row['modifiedTime'] = self.millis_to_datetime(modified_time_millis) if modified_time_millis else None
 
+            # Epoch columns are kept as they are; local times are derived for the whole frame below
             for key, value in point.items():
-                if key not in ['fitValue', 'modifiedTimeMillis']:
+                if key != 'fitValue':
                     parsed_row[key] = value
 
             if 'fitValue' in point and point['fitValue']:
@@ -57,9 +110,22 @@ class ParseData:
             parsed_data.append(parsed_row)
 
         df = pd.DataFrame(parsed_data)
+        df = self.local_times(df, user_name)
         df = df.dropna(axis=1, how='all')
         return df
 
+    def parse_session_json(self, data):
+        """One row per All Sessions document: activity, UTC start/end, duration in seconds and its aggregates."""
+        row = {
+            'fitnessActivity': data.get('fitnessActivity'),
+            'startTime': data.get('startTime'),
+            'endTime': data.get('endTime'),
+            'durationSeconds': float(data['duration'].rstrip('s')) if data.get('duration') else None,
+        }
+        for metric in data.get('aggregate', []):
+            row[metric.get('metricName')] = metric.get('floatValue', metric.get('intValue'))
+        return pd.DataFrame([row])
+
     def parse_tcx_file(self, file_path):
         """Parse a single TCX file and return a DataFrame."""
         tree = ET.parse(file_path)
@@ -100,6 +166,10 @@ class ParseData:
                         'Lap.Track.Trackpoint.Time': trackpoint.find('tcx:Time', namespaces).text,
                         'HeartRateBpm': trackpoint.find('tcx:HeartRateBpm/tcx:Value', namespaces).text if trackpoint.find('tcx:HeartRateBpm/tcx:Value', namespaces) is not None else pd.NA,
                     }
+                    # Position, altitude and cadence are only present on GPS-tracked and cadence-sensing workouts
+                    for column, path in self.TCX_TRACKPOINT_FIELDS.items():
+                        element = trackpoint.find(path, namespaces)
+                        trackpoint_data[column] = element.text if element is not None else pd.NA
                     trackpoints.append(trackpoint_data)
 
                 for trackpoint in trackpoints:
@@ -107,6 +177,9 @@ class ParseData:
 
         df = pd.DataFrame(parsed_data)
         df = df.dropna(axis=1, how='all')
+        # Typed once here, so route compression reads float arrays without per-stage coercion
+        for column in [column for column in self.TCX_TRACKPOINT_FIELDS if column in df.columns]:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
         return df
 
     def parse_csv(self, file_path):
@@ -120,19 +193,184 @@ class ParseData:
             print(f"An error occurred: {e}")
         return pd.DataFrame()
 
-    def allData_json(self, folder_path):
-        """Process all JSON files in the folder and return a combined DataFrame."""
-        all_dfs = [self.parse_json(os.path.join(folder_path, filename)) 
-                   for filename in os.listdir(folder_path) if filename.endswith('.json')]
+    def deduplicate(self, df):
+        """Drop exact and same-interval duplicate points, keeping the most recently modified one.
+
+        All Data frames are deduplicated here, and TCX trackpoints of exact repeats in activities_tcx
+        and takeout_zip, so the pillars select a window's rows without a drop_duplicates of their own.
+        """
+        key_cols = [col for col in self.DEDUP_KEY if col in df.columns]
+        if df.empty or len(key_cols) < len(self.DEDUP_KEY):
+            return df
+
+        # One 64-bit hash per row for the key and one for the whole row, instead of comparing full frames
+        key_hash = pd.util.hash_pandas_object(df[key_cols], index=False)
+        row_hash = pd.util.hash_pandas_object(df, index=False)
+
+        exact_dup = row_hash.duplicated().to_numpy()
+
+        # Among points sharing a key, the most recently modified one survives
+        if 'modifiedTime' in df.columns:
+            order = df['modifiedTime'].reset_index(drop=True).sort_values(ascending=False, kind='stable', na_position='last').index.to_numpy()
+        else:
+            order = np.arange(len(df))
+        interval_dup = np.empty(len(df), dtype=bool)
+        interval_dup[order] = pd.Series(key_hash.to_numpy()[order]).duplicated().to_numpy()
+        interval_dup &= ~exact_dup
+
+        dropped = exact_dup | interval_dup
+        report = pd.DataFrame({'data_source': df['data_source'].to_numpy(), 'exact': exact_dup, 'interval': interval_dup, 'kept': ~dropped})
+        self.dedup_report = report.groupby('data_source', as_index=False).agg(
+            rowsIn=('kept', 'size'),
+            exactDuplicates=('exact', 'sum'),
+            sameIntervalDuplicates=('interval', 'sum'),
+            rowsOut=('kept', 'sum'),
+        )
+        return df[~dropped].reset_index(drop=True)
+
+    def _stage_data_sources(self, stages):
+        """Union of the data sources the given registry stages read from All Data; None means every source."""
+        if stages is None:
+            return None
+        from processing.pillars.registry import required_inputs
+        return required_inputs(stages).get('allData', {'data_sources': set()})['data_sources']
+
+    def _bronze_frame(self, all_dfs, user_name, deduplicate, stages):
         combined_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+        if deduplicate:
+            combined_df = self.deduplicate(combined_df)
+
+        if user_name is not None and not combined_df.empty:
+            combined_df.insert(0, 'userName', user_name)
+        # Checked once here so the pillars can skip their defensive conversions on this frame
+        combined_df = validate_bronze(combined_df)
+        if user_name is not None and not combined_df.empty and self.rollup_store is not None:
+            self.rollup_store.ingest(combined_df, stages=stages)
+        if user_name is not None and not combined_df.empty and self.bronze_store is not None:
+            # Only points new or modified since the user's previous export are written
+            self.bronze_store.upsert(combined_df)
         return combined_df
 
-    def activities_tcx(self, folder_path):
+    def allData_json(self, folder_path, user_name=None, deduplicate=True, stages=None):
+        """Process all JSON files in the folder and return a combined DataFrame.
+
+        With stages (stage names from the pillar registry), files holding a data source none of
+        them reads are skipped without being parsed.
+        """
+        data_sources = self._stage_data_sources(stages)
+        all_dfs = []
+        for filename in os.listdir(folder_path):
+            if not filename.endswith('.json'):
+                continue
+            file_path = os.path.join(folder_path, filename)
+            if data_sources is not None:
+                data_source = self.peek_data_source(file_path)
+                if data_source is not None and data_source not in data_sources:
+                    continue
+            all_dfs.append(self.parse_json(file_path, user_name))
+        if data_sources is not None:
+            # A file whose source could not be peeked was parsed in full; keep only what the stages read
+            all_dfs = [df[df['data_source'].isin(data_sources)] if 'data_source' in df.columns else df for df in all_dfs]
+        return self._bronze_frame(all_dfs, user_name, deduplicate, stages)
+
+    def appleHealth_xml(self, xml_file, user_name=None, deduplicate=True, stages=None, chunk_rows=50_000):
+        """Stream an Apple Health export.xml (path or binary file object) into the bronze frame.
+
+        Memory is bounded by the rows kept, not the file size: see AppleHealthParser. stages works
+        as in allData_json, dropping records no listed stage reads while the file is streamed.
+        """
+        parser = AppleHealthParser(self.timezones, chunk_rows=chunk_rows)
+        all_dfs = list(parser.iter_chunks(xml_file, user_name, data_sources=self._stage_data_sources(stages)))
+        return self._bronze_frame(all_dfs, user_name, deduplicate, stages)
+
+    def takeout_members(self, zip_paths):
+        """{part: [(zip path, member name), ...]} for the Fit members of one or more Takeout archives.
+
+        Google splits large exports over several zips (takeout-...-001.zip, -002.zip), so a user's
+        members are collected across all of them.
+        """
+        zip_paths = [zip_paths] if isinstance(zip_paths, (str, os.PathLike)) else list(zip_paths)
+        members = {part: [] for part in self.TAKEOUT_PARTS}
+        for zip_path in zip_paths:
+            with zipfile.ZipFile(zip_path) as archive:
+                for name in sorted(archive.namelist()):
+                    for part, (folder, suffix) in self.TAKEOUT_PARTS.items():
+                        if folder in name and name.endswith(suffix):
+                            members[part].append((zip_path, name))
+        return members
+
+    def _read_member(self, archive, name, part, user_name, data_sources):
+        """Decompress and parse one member; runs in a worker thread (zlib releases the GIL)."""
+        with archive.open(name) as member:
+            if part == 'allData':
+                head = member.read(self.PEEK_BYTES)
+                if data_sources is not None:
+                    data_source = self._data_source_in(head)
+                    if data_source is not None and data_source not in data_sources:
+                        return None
+                df = self.parse_fit_data(json.loads(head + member.read()), user_name)
+                return df[df['data_source'].isin(data_sources)] if data_sources is not None and 'data_source' in df.columns else df
+            if part == 'activitiesData':
+                return self.parse_tcx_file(member)
+            if part == 'sessions':
+                return self.parse_session_json(json.load(member))
+            return pd.read_csv(member)
+
+    def takeout_zip(self, zip_paths, user_name=None, stages=None, deduplicate=True, max_workers=None):
+        """Parse a user's Takeout straight from its zip archive(s), without extracting it.
+
+        Returns {'allData', 'activitiesData', 'sessions', 'dailyActivityMetrics'} frames. Members are
+        decompressed and parsed by a thread pool over one shared handle per archive. With stages
+        (registry stage names), only the parts those stages read are opened, and All Data members
+        whose "Data Source" none of them reads are skipped after decompressing their first bytes.
+        """
+        members = self.takeout_members(zip_paths)
+        if stages is None:
+            parts = list(self.TAKEOUT_PARTS)
+            data_sources = None
+        else:
+            from processing.pillars.registry import required_inputs
+            parts = [part for part in required_inputs(stages) if part in self.TAKEOUT_PARTS]
+            data_sources = self._stage_data_sources(stages)
+
+        archives = {zip_path: zipfile.ZipFile(zip_path) for zip_path in {path for part in parts for path, _ in members[part]}}
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {part: [executor.submit(self._read_member, archives[zip_path], name, part, user_name, data_sources)
+                                  for zip_path, name in members[part]]
+                           for part in parts}
+                frames = {part: [future.result() for future in part_futures] for part, part_futures in futures.items()}
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+        result = {}
+        for part in self.TAKEOUT_PARTS:
+            part_dfs = [df for df in frames.get(part, []) if df is not None]
+            if part == 'allData':
+                result[part] = self._bronze_frame(part_dfs, user_name, deduplicate, stages)
+                continue
+            combined_df = pd.concat(part_dfs, ignore_index=True) if part_dfs else pd.DataFrame()
+            if part == 'activitiesData' and deduplicate:
+                combined_df = self._drop_repeated_trackpoints(combined_df)
+            if user_name is not None and not combined_df.empty:
+                combined_df.insert(0, 'userName', user_name)
+            result[part] = combined_df
+        return result
+
+    def activities_tcx(self, folder_path, deduplicate=True):
         """Process all TCX files in the folder and return a combined DataFrame."""
         all_dfs = [self.parse_tcx_file(os.path.join(folder_path, filename)) 
                    for filename in os.listdir(folder_path) if filename.endswith('.tcx')]
         combined_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
-        return combined_df
+        return self._drop_repeated_trackpoints(combined_df) if deduplicate else combined_df
+
+    def _drop_repeated_trackpoints(self, df):
+        # A workout exported twice (e.g. 'x(1).tcx') repeats every trackpoint row exactly
+        if df.empty:
+            return df
+        exact_dup = pd.util.hash_pandas_object(df, index=False).duplicated().to_numpy()
+        return df[~exact_dup].reset_index(drop=True)
 
     def daily_activity_metrics(self, file_path):
         """Parse the daily activity metrics CSV and return a DataFrame."""
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_TIMEZONE = 'Asia/Kolkata'
+
+# Sentinel for "since the beginning of time"; it equals NaT's int64 value, so NaT rows fall in the first zone
+SINCE_ALWAYS = np.iinfo('int64').min
+
+
+class UserTimezones:
+    """Timezone history per user, used to turn UTC epoch timestamps into local wall-clock times.
+
+    Each user has a list of (since, timezone) entries: a zone applies from its UTC instant
+    `since` until the next entry takes over. Users without a history use the default zone.
+    """
+
+    def __init__(self, default=DEFAULT_TIMEZONE, history=None):
+        self.default = self._validate(default)
+        self._history = {}
+        # history: {userName: 'Zone/Name'} or {userName: [(since, 'Zone/Name'), ...]}
+        for user_name, entries in (history or {}).items():
+            if isinstance(entries, str):
+                self.set(user_name, entries)
+            else:
+                for since, timezone in entries:
+                    self.set(user_name, timezone, since)
+
+    def _validate(self, timezone):
+        pd.Timestamp(0, tz='UTC').tz_convert(timezone)  # raises on an unknown zone name
+        return timezone
+
+    def set(self, user_name, timezone, since=None):
+        """Use `timezone` for user_name from the UTC instant `since` on (from always when None)."""
+        timezone = self._validate(timezone)
+        since_ns = SINCE_ALWAYS if since is None else self._utc_nanos(pd.Series([since]))[0]
+        entries = dict(self._history.get(user_name, [(SINCE_ALWAYS, self.default)]))
+        entries[since_ns] = timezone
+        self._history[user_name] = sorted(entries.items())
+
+    def history(self, user_name):
+        return list(self._history.get(user_name, [(SINCE_ALWAYS, self.default)]))
+
+    def timezone_at(self, user_name, instant):
+        sinces, zones = zip(*self.history(user_name))
+        position = np.searchsorted(np.asarray(sinces, dtype='int64'), self._utc_nanos(pd.Series([instant]))[0], side='right') - 1
+        return zones[position]
+
+    def _utc_nanos(self, values):
+        """int64 UTC epoch nanoseconds; naive datetimes are taken to be UTC already."""
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        if pd.api.types.is_integer_dtype(values):
+            return values.to_numpy(dtype='int64')
+        values = pd.to_datetime(values, utc=True)
+        return values.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view('int64')
+
+    def to_local(self, utc, user_name=None, unit='ns'):
+        """Local wall-clock datetime64[ns] Series for UTC epoch values (ints in `unit`) or datetimes.
+
+        One vectorized tz_convert per zone the user passed through, never a per-row conversion.
+        """
+        index = utc.index if isinstance(utc, pd.Series) else None
+        values = pd.Series(utc) if not isinstance(utc, pd.Series) else utc
+        if pd.api.types.is_numeric_dtype(values) and unit != 'ns':
+            values = pd.to_datetime(values, unit=unit, utc=True)
+        elif pd.api.types.is_float_dtype(values):
+            values = pd.to_datetime(values, unit='ns', utc=True)
+        utc_ns = self._utc_nanos(values)
+
+        entries = self.history(user_name)
+        local_ns = np.empty(len(utc_ns), dtype='int64')
+        if len(entries) == 1:
+            segments = np.zeros(len(utc_ns), dtype='int64')
+        else:
+            sinces = np.asarray([since for since, _ in entries], dtype='int64')
+            segments = np.searchsorted(sinces, utc_ns, side='right') - 1
+        for position, (_, timezone) in enumerate(entries):
+            in_zone = segments == position
+            if in_zone.any():
+                local_ns[in_zone] = pd.DatetimeIndex(utc_ns[in_zone]).tz_localize('UTC').tz_convert(timezone).tz_localize(None).asi8
+        return pd.Series(local_ns.view('datetime64[ns]'), index=index)
+
+    def _zones_between(self, user_name, first, last):
+        sinces, zones = zip(*self.history(user_name))
+        sinces = np.asarray(sinces, dtype='int64')
+        lower, upper = np.searchsorted(sinces, self._utc_nanos(pd.Series([first, last])), side='right') - 1
+        return set(zones[max(lower, 0):upper + 1])
+
+    def localize_column(self, df, column, aware=False):
+        """Convert a UTC datetime column of a frame to each row's user's local time.
+
+        Returns naive local wall-clock times, or with aware=True tz-aware times in the users' zone
+        (kept in UTC when the rows span more than one zone, as one column has a single tz).
+        """
+        utc = pd.to_datetime(df[column], utc=True)
+        has_users = 'userName' in df.columns
+        user_names = df['userName'].unique() if has_users else [None]
+
+        if aware:
+            if utc.isna().all():
+                return utc.dt.tz_convert(self.default)
+            zones = set().union(*(self._zones_between(user_name, utc.min(), utc.max()) for user_name in user_names))
+            return utc.dt.tz_convert(zones.pop()) if len(zones) == 1 else utc
+
+        if not has_users:
+            return self.to_local(utc)
+        local = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        for user_name, user_utc in utc.groupby(df['userName']):
+            local.loc[user_utc.index] = self.to_local(user_utc, user_name).to_numpy()
+        return local
@@ -0,0 +1,240 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from urllib.parse import quote, unquote
+
+from data_source.parseData.bronzeContract import validate_bronze
+from processing.rollup.dailyRollup import window_dates
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+
+class BronzeStore:
+    """Per-user, per-data-source bronze store on disk that takes repeated Takeout exports as upserts.
+
+    A point is identified by (startTimeNanos, endTimeNanos, originDataSourceId) within its data source.
+    Each partition <root>/<userName>/<data_source>/ holds append-only Parquet parts plus a key index,
+    one .npy file per column, sorted by key:
+      start_ns, end_ns  int64   the point's interval
+      origin_code       int32   index into meta.json 'origins'
+      modified_ns       int64   modifiedTime of the stored version (NaT as int64 min)
+      part, row         int32   where that version lives
+
+    upsert() merge-joins the sorted keys of an export against the index and appends only the points
+    that are new or carry a newer modifiedTime, so re-ingesting a full-history export writes no more
+    than what changed since the previous one. Partitions with no delta are not touched.
+    """
+
+    KEY = ('start_ns', 'end_ns', 'origin_code')
+    INDEX = ('start_ns', 'end_ns', 'origin_code', 'modified_ns', 'part', 'row')
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self.upsert_report = None
+
+    def _partition_dir(self, user_name, data_source):
+        return os.path.join(self.root_dir, quote(str(user_name), safe=''), quote(str(data_source), safe=''))
+
+    def users(self):
+        return sorted(unquote(name) for name in os.listdir(self.root_dir)
+                      if os.path.isdir(os.path.join(self.root_dir, name)))
+
+    def data_sources(self, user_name):
+        user_dir = os.path.join(self.root_dir, quote(str(user_name), safe=''))
+        if not os.path.isdir(user_dir):
+            return []
+        return sorted(unquote(name) for name in os.listdir(user_dir)
+                      if os.path.isfile(os.path.join(user_dir, name, 'meta.json')))
+
+    def _load_partition(self, partition_dir):
+        meta_path = os.path.join(partition_dir, 'meta.json')
+        if not os.path.isfile(meta_path):
+            return {'origins': [], 'parts': 0, 'rows': 0}, {name: np.empty(0, dtype='int64') for name in self.INDEX}
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        return meta, {name: np.load(os.path.join(partition_dir, f'{name}.npy')) for name in self.INDEX}
+
+    def _save_index(self, partition_dir, meta, index):
+        # The part is already on disk; the index and meta are swapped in last, so a crash leaves the
+        # previous state readable and at worst an orphaned part
+        for name, values in index.items():
+            tmp_path = os.path.join(partition_dir, f'{name}.tmp.npy')
+            np.save(tmp_path, np.ascontiguousarray(values))
+            os.replace(tmp_path, os.path.join(partition_dir, f'{name}.npy'))
+        tmp_path = os.path.join(partition_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, os.path.join(partition_dir, 'meta.json'))
+
+    def _export_keys(self, source_df, origins):
+        """Key columns of an export for one partition, sorted by key with the newest version of a key last."""
+        origin_lookup = {origin: code for code, origin in enumerate(origins)}
+        new_origins = [origin for origin in pd.unique(source_df['originDataSourceId'].astype(str)) if origin not in origin_lookup]
+        for origin in new_origins:
+            origin_lookup[origin] = len(origins)
+            origins.append(origin)
+
+        modified = source_df['modifiedTime'].to_numpy(dtype='datetime64[ns]').view('int64')
+        keys = {
+            'start_ns': source_df['startTimeNanos'].to_numpy(dtype='int64'),
+            'end_ns': source_df['endTimeNanos'].to_numpy(dtype='int64'),
+            'origin_code': source_df['originDataSourceId'].astype(str).map(origin_lookup).to_numpy(dtype='int32'),
+            'modified_ns': modified,
+        }
+        order = np.lexsort((keys['modified_ns'], keys['origin_code'], keys['end_ns'], keys['start_ns']))
+        keys = {name: values[order] for name, values in keys.items()}
+
+        # One version per key within the export: the most recently modified one
+        last = np.ones(len(order), dtype=bool)
+        if len(order) > 1:
+            same_as_next = np.logical_and.reduce([keys[name][1:] == keys[name][:-1] for name in self.KEY])
+            last[:-1] = ~same_as_next
+        return {name: values[last] for name, values in keys.items()}, order[last]
+
+    def _merge_join(self, index, keys):
+        """For every export key, the index position of the same stored key or -1.
+
+        Both sides are sorted by key, so one stable lexsort of the concatenated keys places each stored
+        key directly before its export twin; matches are read off adjacent positions.
+        """
+        stored, exported = len(index['start_ns']), len(keys['start_ns'])
+        match = np.full(exported, -1, dtype='int64')
+        if stored == 0 or exported == 0:
+            return match
+        # Only the stored keys inside the export's interval range can match; the index is sorted by start
+        lower = np.searchsorted(index['start_ns'], keys['start_ns'][0], side='left')
+        upper = np.searchsorted(index['start_ns'], keys['start_ns'][-1], side='right')
+        if lower == upper:
+            return match
+
+        combined = {name: np.concatenate([index[name][lower:upper], keys[name]]) for name in self.KEY}
+        side = np.concatenate([np.zeros(upper - lower, dtype='int8'), np.ones(exported, dtype='int8')])
+        order = np.lexsort((side, combined['origin_code'], combined['end_ns'], combined['start_ns']))
+        same_key = np.logical_and.reduce([combined[name][order][1:] == combined[name][order][:-1] for name in self.KEY])
+        pairs = np.flatnonzero(same_key & (side[order][:-1] == 0) & (side[order][1:] == 1))
+        match[order[pairs + 1] - (upper - lower)] = order[pairs] + lower
+        return match
+
+    def _upsert_partition(self, user_name, data_source, source_df):
+        partition_dir = self._partition_dir(user_name, data_source)
+        meta, index = self._load_partition(partition_dir)
+        keys, rows = self._export_keys(source_df, meta['origins'])
+        match = self._merge_join(index, keys)
+
+        inserted = match < 0
+        matched = np.flatnonzero(~inserted)
+        updated = np.zeros(len(match), dtype=bool)
+        updated[matched] = keys['modified_ns'][matched] > index['modified_ns'][match[matched]]
+        delta = inserted | updated
+        counts = {'rowsIn': int(len(source_df)), 'inserted': int(inserted.sum()), 'updated': int(updated.sum()),
+                  'unchanged': int(len(match) - delta.sum())}
+        if not delta.any():
+            return counts
+
+        part = meta['parts']
+        os.makedirs(partition_dir, exist_ok=True)
+        delta_df = source_df.iloc[rows[delta]].drop(columns=['userName'], errors='ignore')
+        tmp_path = os.path.join(partition_dir, f'part-{part:05d}.parquet.tmp')
+        delta_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(partition_dir, f'part-{part:05d}.parquet'))
+
+        # Updated keys point at their new version; inserted keys are merged into the sorted index
+        index = {name: values.copy() for name, values in index.items()}
+        index['modified_ns'][match[updated]] = keys['modified_ns'][updated]
+        index['part'][match[updated]] = part
+        index['row'][match[updated]] = np.flatnonzero(updated[delta])
+        new_rows = {name: keys[name][inserted] for name in ('start_ns', 'end_ns', 'origin_code', 'modified_ns')}
+        new_rows['part'] = np.full(inserted.sum(), part)
+        new_rows['row'] = np.flatnonzero(inserted[delta])
+        merged = {name: np.concatenate([index[name], new_rows[name]]) for name in self.INDEX}
+        order = np.lexsort((merged['origin_code'], merged['end_ns'], merged['start_ns']))
+        dtypes = {'origin_code': 'int32', 'part': 'int32', 'row': 'int32'}
+        index = {name: merged[name][order].astype(dtypes.get(name, 'int64')) for name in self.INDEX}
+
+        meta.update({'userName': user_name, 'data_source': data_source, 'parts': part + 1, 'rows': int(len(order))})
+        self._save_index(partition_dir, meta, index)
+        return counts
+
+    def upsert(self, googleFit_df):
+        """Write the points of a bronze frame that are new or changed since they were last stored.
+
+        Returns the rows written per user. Per-partition counts of inserted, updated and unchanged
+        points are kept in upsert_report.
+        """
+        report = []
+        written = {}
+        if googleFit_df.empty:
+            self.upsert_report = pd.DataFrame(columns=['userName', 'data_source', 'rowsIn', 'inserted', 'updated', 'unchanged'])
+            return written
+
+        for (user_name, data_source), source_df in googleFit_df.groupby(['userName', 'data_source'], sort=True):
+            counts = self._upsert_partition(user_name, data_source, source_df)
+            report.append({'userName': user_name, 'data_source': data_source, **counts})
+            written[user_name] = written.get(user_name, 0) + counts['inserted'] + counts['updated']
+        self.upsert_report = pd.DataFrame(report)
+        return written
+
+    def read(self, user_name, *args, data_sources=None):
+        """The current version of every stored point, as a validated bronze frame.
+
+        args is an optional date window in the forms the pillar classes take; the index is sorted
+        by start, so only the parts holding points in the padded window are opened.
+        """
+        days = window_dates(*args) if args else None
+        frames = []
+        for data_source in self.data_sources(user_name):
+            if data_sources is not None and data_source not in data_sources:
+                continue
+            partition_dir = self._partition_dir(user_name, data_source)
+            meta, index = self._load_partition(partition_dir)
+            positions = np.arange(len(index['start_ns']))
+            if days:
+                # startTimeNanos is UTC and the window is local, so a day of padding either side
+                lower = pd.Timestamp(days[0]).value - DAY_NS
+                upper = pd.Timestamp(days[-1]).value + 2 * DAY_NS
+                positions = positions[np.searchsorted(index['start_ns'], lower):np.searchsorted(index['start_ns'], upper)]
+            for part in np.unique(index['part'][positions]):
+                part_rows = index['row'][positions][index['part'][positions] == part]
+                part_df = pd.read_parquet(os.path.join(partition_dir, f'part-{part:05d}.parquet'))
+                frames.append(part_df.iloc[np.sort(part_rows)])
+
+        combined_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if combined_df.empty:
+            return combined_df
+        combined_df.insert(0, 'userName', user_name)
+        return validate_bronze(combined_df)
+
+    def compact(self, user_name, data_source):
+        """Fold a partition's parts into one holding only current versions; returns the rows kept."""
+        partition_dir = self._partition_dir(user_name, data_source)
+        meta, index = self._load_partition(partition_dir)
+        if meta['parts'] <= 1:
+            return meta['rows']
+
+        frames = []
+        for part in range(meta['parts']):
+            keep = np.flatnonzero(index['part'] == part)
+            if len(keep):
+                part_df = pd.read_parquet(os.path.join(partition_dir, f'part-{part:05d}.parquet'))
+                frames.append(part_df.iloc[index['row'][keep]])
+        compacted_df = pd.concat(frames, ignore_index=True)
+        # Rows follow the index order, so the index points at row i of the single part
+        order = np.concatenate([np.flatnonzero(index['part'] == part) for part in range(meta['parts'])])
+        compacted_df = compacted_df.iloc[np.argsort(order)].reset_index(drop=True)
+
+        part = meta['parts']
+        tmp_path = os.path.join(partition_dir, f'part-{part:05d}.parquet.tmp')
+        compacted_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(partition_dir, f'part-{part:05d}.parquet'))
+        index['part'] = np.full(len(order), part, dtype='int32')
+        index['row'] = np.arange(len(order), dtype='int32')
+        old_parts = range(meta['parts'])
+        meta.update({'parts': part + 1, 'rows': int(len(order))})
+        self._save_index(partition_dir, meta, index)
+        for old_part in old_parts:
+            old_path = os.path.join(partition_dir, f'part-{old_part:05d}.parquet')
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        return meta['rows']
@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from urllib.parse import quote, unquote
+
+from processing.pillars.dataSources import HR_SOURCE
+from processing.rollup.dailyRollup import window_dates
+
+DAY_NS = 24 * 60 * 60 * 10**9
+SECOND_NS = 10**9
+
+
+class HeartRateStore:
+    """Per-user columnar heart-rate store on disk, read back through memory maps.
+
+    Each user directory holds one .npy file per column, sorted by startDate:
+      start_offset   int32   seconds since the start of the record's day
+      duration       int32   seconds from startDate to endDate
+      modified_delta int32   seconds from startDate to modifiedTime
+      origin_code    uint8   index into meta.json 'origins'
+      bpm            uint8, or float16 when a value is fractional or above 255
+      day_index      int64   (day start ns, first row, row count) per stored day
+
+    Timestamps are local wall-clock times, like the startDate/endDate columns of ParseData, at
+    second precision. Arrays are opened with mmap_mode='r', so processes reading the same
+    store share the OS page cache instead of each holding its own copy of the history.
+    """
+
+    HR_SOURCE = HR_SOURCE
+    HR_TYPE = 'com.google.heart_rate.bpm'
+    COLUMNS = ('start_offset', 'duration', 'modified_delta', 'origin_code', 'bpm', 'day_index')
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self._open = {}
+
+    def _user_dir(self, user_name):
+        return os.path.join(self.root_dir, quote(str(user_name), safe=''))
+
+    def users(self):
+        return sorted(unquote(name) for name in os.listdir(self.root_dir)
+                      if os.path.isfile(os.path.join(self.root_dir, name, 'meta.json')))
+
+    def write(self, googleFit_df):
+        """Add the heart-rate rows of a bronze frame to the store; returns rows stored per user."""
+        hr_df = googleFit_df[googleFit_df['data_source'] == self.HR_SOURCE] if 'data_source' in googleFit_df.columns else googleFit_df
+        written = {}
+        if hr_df.empty:
+            return written
+
+        for user_name, user_df in hr_df.groupby('userName'):
+            new_df = user_df[['startDate', 'endDate', 'modifiedTime', 'originDataSourceId', 'fit_value']]
+            if user_name in self.users():
+                new_df = pd.concat([self.read(user_name)[new_df.columns], new_df], ignore_index=True)
+            written[user_name] = self._write_user(user_name, new_df)
+        return written
+
+    def _write_user(self, user_name, user_df):
+        starts = pd.to_datetime(user_df['startDate']).dt.tz_localize(None)
+        ends = pd.to_datetime(user_df['endDate']).dt.tz_localize(None)
+        modified = pd.to_datetime(user_df['modifiedTime']).dt.tz_localize(None)
+
+        # Newest modification wins when a sample was exported more than once
+        user_df = user_df.assign(_start=starts, _end=ends, _modified=modified)
+        user_df = user_df.sort_values(['_start', 'originDataSourceId', '_modified'])
+        user_df = user_df.drop_duplicates(subset=['_start', 'originDataSourceId'], keep='last')
+
+        start_s = user_df['_start'].to_numpy(dtype='datetime64[ns]').view('int64') // SECOND_NS
+        end_s = user_df['_end'].to_numpy(dtype='datetime64[ns]').view('int64') // SECOND_NS
+        modified_s = user_df['_modified'].fillna(user_df['_start']).to_numpy(dtype='datetime64[ns]').view('int64') // SECOND_NS
+        day_s = start_s - start_s % (DAY_NS // SECOND_NS)
+
+        origins, origin_code = np.unique(user_df['originDataSourceId'].astype(str).to_numpy(), return_inverse=True)
+        if len(origins) > 255:
+            raise ValueError(f"Too many heart-rate origins for user {user_name!r}: {len(origins)}")
+
+        bpm = pd.to_numeric(user_df['fit_value'], errors='coerce').to_numpy(dtype='float64')
+        whole = np.isfinite(bpm).all() and (bpm >= 0).all() and (bpm <= 255).all() and (bpm == np.round(bpm)).all()
+        bpm = bpm.astype('uint8') if whole else bpm.astype('float16')
+
+        days, first_rows, counts = np.unique(day_s, return_index=True, return_counts=True)
+        columns = {
+            'start_offset': (start_s - day_s).astype('int32'),
+            'duration': (end_s - start_s).astype('int32'),
+            'modified_delta': np.clip(modified_s - start_s, np.iinfo('int32').min, np.iinfo('int32').max).astype('int32'),
+            'origin_code': origin_code.astype('uint8'),
+            'bpm': bpm,
+            'day_index': np.column_stack([days * SECOND_NS, first_rows, counts]).astype('int64'),
+        }
+        meta = {'userName': user_name, 'rows': int(len(bpm)), 'bpm_dtype': str(bpm.dtype), 'origins': origins.tolist()}
+
+        # Written to a sibling directory and swapped in, so readers never see a half-written user
+        user_dir = self._user_dir(user_name)
+        tmp_dir = user_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(values))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        self._open.pop(user_name, None)
+        old_dir = user_dir + '.old'
+        if os.path.exists(user_dir):
+            os.replace(user_dir, old_dir)
+        os.replace(tmp_dir, user_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return meta['rows']
+
+    def _columns(self, user_name):
+        if user_name not in self._open:
+            user_dir = self._user_dir(user_name)
+            with open(os.path.join(user_dir, 'meta.json')) as meta_file:
+                meta = json.load(meta_file)
+            arrays = {name: np.load(os.path.join(user_dir, f'{name}.npy'), mmap_mode='r') for name in self.COLUMNS}
+            self._open[user_name] = (meta, arrays)
+        return self._open[user_name]
+
+    def read_arrays(self, user_name, *args):
+        """Zero-copy views of the user's columns for a date window (same forms as the pillar classes).
+
+        Rows are sorted by time, so a window is one contiguous slice of every column. Also returns the
+        per-row day start in ns, which is the only array that has to be materialised.
+        """
+        if not os.path.isfile(os.path.join(self._user_dir(user_name), 'meta.json')):
+            return None
+        meta, arrays = self._columns(user_name)
+        day_index = arrays['day_index']
+        days = window_dates(*args) if args else None
+
+        if days:
+            lower = pd.Timestamp(days[0]).value
+            upper = pd.Timestamp(days[-1]).value + DAY_NS
+            first_day, last_day = np.searchsorted(day_index[:, 0], [lower, upper])
+        else:
+            first_day, last_day = 0, len(day_index)
+        if first_day == last_day:
+            row_start = row_end = 0
+        else:
+            row_start = int(day_index[first_day, 1])
+            row_end = int(day_index[last_day - 1, 1] + day_index[last_day - 1, 2])
+
+        window = {name: arrays[name][row_start:row_end] for name in self.COLUMNS if name != 'day_index'}
+        window['day_start'] = np.repeat(day_index[first_day:last_day, 0], day_index[first_day:last_day, 2])
+        window['origins'] = meta['origins']
+        if days and len(days) != (days[-1] - days[0]).days + 1:
+            # A list of scattered days: keep only rows on the listed days
+            keep = np.isin(window['day_start'], [pd.Timestamp(day).value for day in days])
+            window = {name: values[keep] if isinstance(values, np.ndarray) else values for name, values in window.items()}
+        return window
+
+    def read(self, user_name, *args):
+        """The user's heart-rate rows for a date window in the bronze layout the pillars consume."""
+        window = self.read_arrays(user_name, *args)
+        if window is None:
+            return pd.DataFrame(columns=['userName', 'startDate', 'endDate', 'modifiedTime', 'originDataSourceId',
+                                         'dataTypeName', 'fit_value', 'data_source'])
+
+        start_ns = window['day_start'] + window['start_offset'].astype('int64') * SECOND_NS
+        return pd.DataFrame({
+            'userName': user_name,
+            'startDate': pd.to_datetime(start_ns),
+            'endDate': pd.to_datetime(start_ns + window['duration'].astype('int64') * SECOND_NS),
+            'modifiedTime': pd.to_datetime(start_ns + window['modified_delta'].astype('int64') * SECOND_NS),
+            'originDataSourceId': pd.Categorical.from_codes(window['origin_code'].astype('int64'), window['origins']).astype(str),
+            'dataTypeName': self.HR_TYPE,
+            'fit_value': window['bpm'].astype('float64'),
+            'data_source': self.HR_SOURCE,
+        })
+
+    def close(self):
+        # Dropping the references unmaps the files
+        self._open.clear()
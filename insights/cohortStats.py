@@ -0,0 +1,312 @@
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from processing.rollup.dailyRollup import window_dates
+
+ALL_USERS = 'all'
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (Karnin, Lang & Liberty) over float values.
+
+    Level h holds values of weight 2**h; when a level outgrows its capacity it is sorted and every
+    other value, from a random offset, is promoted to the next level. Capacities shrink by 2/3 per
+    level below the top, so the sketch keeps O(k log(n / k)) values for n inserted and ranks are
+    within about 1.7/k of exact with high probability. Two sketches merge by concatenating their
+    levels and compacting, so per-worker sketches combine into one without the raw values.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._cdf = None
+
+    def _capacity(self, level):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level))))
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(self.levels[level])
+                # An odd value out stays behind, so the promoted half is exactly half the weight
+                keep = values[-1:] if len(values) % 2 else values[:0]
+                paired = values[:len(values) - len(keep)]
+                promoted = paired[self._rng.integers(2)::2]
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+                self.levels[level] = keep
+                # A new top level lowers every capacity below it, so compaction starts over
+                level = 0
+                continue
+            level += 1
+        self._cdf = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compact()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], values))
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compact()
+        return self
+
+    def _sorted_cdf(self):
+        # Cached until the next update, so repeated queries are a binary search over at most a few k values
+        if self._cdf is None:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(level_values), 2.0 ** level) for level, level_values in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self._cdf = (values[order], np.cumsum(weights[order]))
+        return self._cdf
+
+    def quantile(self, q):
+        """Approximate q-quantile(s), q in [0, 1]; NaN when the sketch is empty."""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        values, cumulative = self._sorted_cdf()
+        q = np.clip(np.asarray(q, dtype='float64'), 0, 1)
+        position = np.minimum(np.searchsorted(cumulative, q * cumulative[-1], side='left'), len(values) - 1)
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, values[position]))
+        return result if np.ndim(result) else float(result)
+
+    def rank(self, value):
+        """Approximate fraction of inserted values that are <= value."""
+        if self.n == 0:
+            return np.nan
+        values, cumulative = self._sorted_cdf()
+        position = np.searchsorted(values, np.asarray(value, dtype='float64'), side='right')
+        result = np.where(position > 0, cumulative[np.maximum(position - 1, 0)], 0.0) / cumulative[-1]
+        return result if np.ndim(result) else float(result)
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'min': self.min, 'max': self.max, 'levels': [values.tolist() for values in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(k=state['k'])
+        sketch.n, sketch.min, sketch.max = state['n'], state['min'], state['max']
+        sketch.levels = [np.asarray(values, dtype='float64') for values in state['levels']]
+        return sketch
+
+
+class MomentAccumulator:
+    """Count, mean, variance (Welford/Chan M2), min and max; batches and other accumulators merge in O(1)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        if count == 0:
+            return self
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+        return self
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch_mean = float(values.mean())
+        return self._combine(len(values), batch_mean, float(((values - batch_mean) ** 2).sum()), float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        return self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        accumulator = cls()
+        accumulator.count, accumulator.mean, accumulator.m2 = state['count'], state['mean'], state['m2']
+        accumulator.min, accumulator.max = state['min'], state['max']
+        return accumulator
+
+
+class CohortStats:
+    """Population and cohort distributions of daily metrics, kept as sketches instead of raw rows.
+
+    Every per-user-day value of a metric updates a KLLSketch and a MomentAccumulator for its
+    (metric, cohort, date) and for (metric, cohort) over all days, in its own cohort and in 'all'.
+    Queries touch one sketch, so a percentile costs the same for ten users as for ten million. Per-day
+    sketches of a date window are merged on demand. Each user-day should be added once: sketches
+    cannot forget a value, so re-adding a recomputed day counts it twice.
+    """
+
+    # metric -> (source s_name, source valueType, how duplicate rows of a user-day are combined)
+    METRICS = {
+        'restingHR': ('V_HR', 'restingAvg', 'mean'),
+        'dayAvgHR': ('V_HR', 'dayAvg', 'mean'),
+        'steps': ('A_StepCount', 'TotalStepCount', 'sum'),
+        'distance': ('A_WalkingRunningDistance', 'TotalWalkingRunningDistance', 'sum'),
+        'sleepDuration': ('S_SleepType', 'TotalSleepDuration', 'sum'),
+        'calories': ('V_TotalCalories', 'TotalCalories', 'sum'),
+    }
+
+    def __init__(self, cohorts=None, k=200):
+        # userName -> cohort label (e.g. an age group), or a callable doing the same; unmapped users are only in 'all'
+        self.cohorts = cohorts if cohorts is not None else {}
+        self.k = k
+        self.s_name = 'I_CohortStats'
+        self._sketches = {}
+        self._moments = {}
+
+    def _cohort_of(self, user_names):
+        if callable(self.cohorts):
+            return pd.Series([self.cohorts(user_name) for user_name in user_names], dtype='object')
+        return pd.Series(user_names).map(self.cohorts).astype('object')
+
+    def _user_days(self, agg_df):
+        """(metric, unit, userName, date, value) with one value per user-day and metric."""
+        frames = []
+        for metric, (s_name, value_type, how) in self.METRICS.items():
+            rows = agg_df[(agg_df['s_name'] == s_name) & (agg_df['valueType'] == value_type)]
+            if rows.empty:
+                continue
+            rows = rows.assign(date=pd.to_datetime(rows['date']).dt.date, value=pd.to_numeric(rows['value'], errors='coerce'))
+            daily = rows.groupby(['userName', 'date'], sort=False)['value'].agg(how).reset_index()
+            frames.append(daily.assign(metric=metric, unit=rows['unit'].iloc[0]))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def add(self, agg_df):
+        """Fold long-format aggregate rows (VHRagg, AStepCountAgg, ... for any number of users) into the sketches."""
+        daily = self._user_days(agg_df) if not agg_df.empty else None
+        if daily is None:
+            return self
+        daily = daily[daily['value'].notna()]
+        daily['cohort'] = self._cohort_of(daily['userName'].to_numpy()).to_numpy()
+        scoped = [daily.assign(cohort=ALL_USERS), daily[daily['cohort'].notna() & (daily['cohort'] != ALL_USERS)]]
+        daily = pd.concat(scoped, ignore_index=True)
+
+        # One sketch update per group, with every value of the group at once
+        for (metric, cohort, date), values in daily.groupby(['metric', 'cohort', 'date'], sort=False)['value']:
+            values = values.to_numpy(dtype='float64')
+            for key in ((metric, cohort, date), (metric, cohort, None)):
+                self._sketches.setdefault(key, KLLSketch(self.k)).update(values)
+                self._moments.setdefault(key, MomentAccumulator()).update(values)
+        return self
+
+    def merge(self, other):
+        """Fold another CohortStats (e.g. from another batch worker) into this one."""
+        for key, sketch in other._sketches.items():
+            self._sketches.setdefault(key, KLLSketch(self.k)).merge(sketch)
+        for key, moments in other._moments.items():
+            self._moments.setdefault(key, MomentAccumulator()).merge(moments)
+        return self
+
+    def _lookup(self, metric, cohort, *args):
+        """(sketch, moments) for the whole history, or merged over the days of a window."""
+        if not args:
+            key = (metric, cohort, None)
+            return self._sketches.get(key, KLLSketch(self.k)), self._moments.get(key, MomentAccumulator())
+        sketch, moments = KLLSketch(self.k), MomentAccumulator()
+        for day in window_dates(*args):
+            key = (metric, cohort, day)
+            if key in self._sketches:
+                sketch.merge(self._sketches[key])
+                moments.merge(self._moments[key])
+        return sketch, moments
+
+    def percentile(self, metric, q, *args, cohort=ALL_USERS):
+        """q-th percentile (0-100) of the metric in a cohort, overall or over a date window."""
+        sketch, _ = self._lookup(metric, cohort, *args)
+        return sketch.quantile(np.asarray(q, dtype='float64') / 100)
+
+    def percentile_rank(self, metric, value, *args, cohort=ALL_USERS):
+        """Share of the cohort's user-days (0-100) with a value at or below the given one."""
+        sketch, _ = self._lookup(metric, cohort, *args)
+        return sketch.rank(value) * 100
+
+    def summary(self, metric, *args, cohort=ALL_USERS, percentiles=(10, 50, 90)):
+        sketch, moments = self._lookup(metric, cohort, *args)
+        summary = {'count': moments.count, 'mean': moments.mean if moments.count else np.nan, 'std': moments.std,
+                   'min': moments.min if moments.count else np.nan, 'max': moments.max if moments.count else np.nan}
+        summary.update({f'p{q}': sketch.quantile(q / 100) for q in percentiles})
+        return summary
+
+    def process(self, agg_df, *args):
+        """Long-format rows placing each user-day of agg_df in its cohort: percentile rank and the cohort's p50/p90.
+
+        The cohort distribution is the whole history, or the given date window. The cohort is named
+        in valueType (e.g. 'cohortP50:all'); unit is the metric's own, or 'percent' for the rank.
+        """
+        daily = self._user_days(agg_df) if not agg_df.empty else None
+        if daily is None:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value'])
+        daily['cohort'] = self._cohort_of(daily['userName'].to_numpy()).fillna(ALL_USERS).to_numpy()
+
+        frames = []
+        for (metric, cohort), rows in daily.groupby(['metric', 'cohort'], sort=False):
+            sketch, _ = self._lookup(metric, cohort, *args)
+            values = rows['value'].to_numpy(dtype='float64')
+            unit = rows['unit'].iloc[0]
+            for value_type, value_unit, column in (
+                    ('cohortPercentileRank', 'percent', sketch.rank(values) * 100 if sketch.n else np.full(len(values), np.nan)),
+                    ('cohortP50', unit, np.full(len(values), sketch.quantile(0.5))),
+                    ('cohortP90', unit, np.full(len(values), sketch.quantile(0.9)))):
+                frames.append(pd.DataFrame({'userName': rows['userName'].to_numpy(), 'date': rows['date'].to_numpy(),
+                                            'type': metric, 'unit': value_unit, 'valueType': f'{value_type}:{cohort}',
+                                            'value': column}))
+
+        final_df = pd.concat(frames, ignore_index=True)
+        final_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        final_df['s_name'] = self.s_name
+        final_df['value'] = final_df['value'].round(2)
+        final_df = final_df.sort_values(by=['date', 'type'], ascending=False, ignore_index=True)
+        return final_df[['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']]
+
+    def to_json(self, path):
+        state = {'k': self.k,
+                 'entries': [{'metric': metric, 'cohort': cohort, 'date': None if date is None else str(date),
+                              'sketch': sketch.to_dict(), 'moments': self._moments[(metric, cohort, date)].to_dict()}
+                             for (metric, cohort, date), sketch in self._sketches.items()]}
+        with open(path, 'w') as state_file:
+            json.dump(state, state_file)
+
+    @classmethod
+    def from_json(cls, path, cohorts=None):
+        with open(path) as state_file:
+            state = json.load(state_file)
+        stats = cls(cohorts, k=state['k'])
+        for entry in state['entries']:
+            date = None if entry['date'] is None else pd.Timestamp(entry['date']).date()
+            key = (entry['metric'], entry['cohort'], date)
+            stats._sketches[key] = KLLSketch.from_dict(entry['sketch'])
+            stats._moments[key] = MomentAccumulator.from_dict(entry['moments'])
+        return stats
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from processing.kernels.numpyKernels import group_quantile, group_reduce, nearest_lookup, time_window_sums
+from processing.rollup.dailyRollup import window_dates
+
+MINUTE_NS = 60 * 10**9
+
+class HRAnalytics:
+    """Resting HR, sleeping-HR percentiles and post-workout recovery from the flagged VHeartRate stream."""
+
+    def __init__(self, hr_stream_df, window_minutes=30, min_samples=5, percentiles=(5, 50, 95),
+                 recovery_offsets=(0, 5, 10, 15, 30), tolerance_minutes=3, night_shift_hours=6):
+        self.s_name = 'I_HRAnalytics'
+        self.unit = 'bpm'
+        self.type = 'com.google.heart_rate.bpm'
+        self.window_ns = window_minutes * MINUTE_NS
+        self.min_samples = min_samples
+        self.percentiles = tuple(percentiles)
+        self.recovery_offsets = tuple(recovery_offsets)
+        self.tolerance_ns = tolerance_minutes * MINUTE_NS
+        # Sleep after 18:00 belongs to the next day's night, so one night is never split at midnight
+        self.night_shift_ns = night_shift_hours * 60 * MINUTE_NS
+
+        # One sorted array set per user; every metric below is a pass over these arrays
+        self._users = {}
+        if not hr_stream_df.empty:
+            stream = hr_stream_df.assign(startDate=pd.to_datetime(hr_stream_df['startDate']))
+            for user_name, user_df in stream.sort_values('startDate', kind='stable').groupby('userName', sort=False):
+                flags = {col: user_df[col].to_numpy() == 1 if col in user_df.columns else np.zeros(len(user_df), dtype=bool)
+                         for col in ['sleep', 'workout', 'activity', 'resting']}
+                self._users[user_name] = {
+                    'times': user_df['startDate'].to_numpy(dtype='datetime64[ns]').view('int64'),
+                    'values': pd.to_numeric(user_df['fit_value'], errors='coerce').to_numpy(dtype='float64'),
+                    **flags,
+                }
+
+    def _day_codes(self, times_ns):
+        days = times_ns - times_ns % (24 * 60 * MINUTE_NS)
+        day_index, codes = np.unique(days, return_inverse=True)
+        return pd.to_datetime(day_index).date, codes
+
+    def resting_hr(self):
+        """Daily resting HR: the lowest mean over any window_minutes of awake, non-workout samples.
+
+        A window only counts when it holds at least min_samples samples and none of them is
+        flagged sleep or workout, so short dips and gaps are never mistaken for rest.
+        """
+        frames = []
+        for user_name, user in self._users.items():
+            times, values = user['times'], user['values']
+            eligible = ~(user['sleep'] | user['workout'])
+            window_sum, window_count = time_window_sums(times, np.where(eligible, values, np.nan), self.window_ns)
+            _, ineligible_count = time_window_sums(times, np.where(eligible, np.nan, 1.0), self.window_ns)
+            sustained = (window_count >= self.min_samples) & (ineligible_count == 0)
+            window_mean = np.where(sustained, window_sum / np.maximum(window_count, 1), np.nan)
+
+            dates, codes = self._day_codes(times)
+            frames.append(pd.DataFrame({'userName': user_name, 'date': dates,
+                                        'restingHR': group_reduce(codes, window_mean, len(dates), 'min')}))
+        return self._concat(frames, ['userName', 'date', 'restingHR'])
+
+    def sleep_percentiles(self):
+        """Percentiles and minimum of sleeping HR per night, dated by the morning the night ends."""
+        columns = ['userName', 'date'] + [f'sleepP{p}' for p in self.percentiles] + ['overnightMin']
+        frames = []
+        for user_name, user in self._users.items():
+            asleep = user['sleep']
+            if not asleep.any():
+                continue
+            times, values = user['times'][asleep], user['values'][asleep]
+            dates, codes = self._day_codes(times + self.night_shift_ns)
+            night_df = pd.DataFrame({'userName': user_name, 'date': dates})
+            for p in self.percentiles:
+                night_df[f'sleepP{p}'] = group_quantile(codes, values, len(dates), p / 100)
+            night_df['overnightMin'] = group_reduce(codes, values, len(dates), 'min')
+            frames.append(night_df)
+        return self._concat(frames, columns)
+
+    def _workout_ends(self, user_name, user, workouts_df):
+        if workouts_df is not None:
+            user_workouts = workouts_df[workouts_df['userName'] == user_name] if 'userName' in workouts_df.columns else workouts_df
+            ends = pd.to_datetime(user_workouts['endDate'])
+            if ends.dt.tz is not None:
+                ends = ends.dt.tz_localize(None)
+            return np.unique(ends.dropna().to_numpy(dtype='datetime64[ns]').view('int64'))
+        # Otherwise the last sample of every run of workout-flagged samples
+        workout = user['workout'].astype('int8')
+        run_ends = np.flatnonzero(np.diff(np.concatenate((workout, [0]))) == -1)
+        return user['times'][run_ends]
+
+    def recovery_curves(self, workouts_df=None):
+        """HR at each recovery offset after every workout end, aligned with searchsorted.
+
+        Workout ends come from workouts_df['endDate'] (e.g. WDuration output) when given, otherwise
+        from the ends of workout-flagged runs in the stream. drop is HR at the end minus HR at the offset.
+        """
+        frames = []
+        offsets_ns = np.asarray(self.recovery_offsets, dtype='int64') * MINUTE_NS
+        for user_name, user in self._users.items():
+            ends = self._workout_ends(user_name, user, workouts_df)
+            if len(ends) == 0:
+                continue
+            # One lookup for every (workout, offset) pair
+            curve = nearest_lookup(user['times'], user['values'], (ends[:, None] + offsets_ns[None, :]).ravel(),
+                                   self.tolerance_ns).reshape(len(ends), len(offsets_ns))
+            frames.append(pd.DataFrame({
+                'userName': user_name,
+                'workoutEnd': pd.to_datetime(np.repeat(ends, len(offsets_ns))),
+                'offsetMinutes': np.tile(self.recovery_offsets, len(ends)),
+                'heartRate': curve.ravel(),
+                'drop': (curve[:, :1] - curve).ravel(),
+            }))
+        return self._concat(frames, ['userName', 'workoutEnd', 'offsetMinutes', 'heartRate', 'drop'])
+
+    def _concat(self, frames, columns):
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)[columns]
+
+    def process(self, *args, workouts_df=None):
+        """Long-format daily rows; optional date arguments take the same forms as the pillar classes."""
+        resting_df = self.resting_hr().melt(id_vars=['userName', 'date'], var_name='valueType', value_name='value')
+        sleep_df = self.sleep_percentiles().melt(id_vars=['userName', 'date'], var_name='valueType', value_name='value')
+
+        # Recovery is summarised per day as the mean drop at each offset over that day's workouts
+        curves = self.recovery_curves(workouts_df)
+        curves = curves[curves['offsetMinutes'] > 0]
+        recovery_df = pd.DataFrame({
+            'userName': curves['userName'],
+            'date': pd.to_datetime(curves['workoutEnd']).dt.date,
+            'valueType': 'recoveryDrop' + curves['offsetMinutes'].astype(str),
+            'value': pd.to_numeric(curves['drop']),
+        }).groupby(['userName', 'date', 'valueType'], as_index=False)['value'].mean()
+
+        frames = [frame for frame in (resting_df, sleep_df, recovery_df) if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value'])
+
+        final_df = pd.concat(frames, ignore_index=True).dropna(subset=['value'])
+        if args:
+            final_df = final_df[final_df['date'].isin(set(window_dates(*args)))]
+
+        final_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        final_df['s_name'] = self.s_name
+        final_df['type'] = self.type
+        final_df['unit'] = self.unit
+        final_df['value'] = pd.to_numeric(final_df['value']).round(1)
+        final_df = final_df.sort_values(by=['date', 'valueType'], ascending=False, ignore_index=True)
+        return final_df[['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']]
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from processing.kernels.numpyKernels import rolling_sum, sliding_extreme
+from processing.rollup.dailyRollup import window_dates
+
+class RollingMetrics:
+
+    # metric -> (source s_name, source valueType, how duplicate rows of a day are combined)
+    METRICS = {
+        'steps': ('A_StepCount', 'TotalStepCount', 'sum'),
+        'restingHR': ('V_HR', 'restingAvg', 'mean'),
+        'sleepDuration': ('S_SleepType', 'TotalSleepDuration', 'sum'),
+        'calories': ('V_TotalCalories', 'TotalCalories', 'sum'),
+    }
+
+    def __init__(self, agg_df=None, windows=(7, 30, 90), baseline_window=30):
+        self.windows = tuple(windows)
+        self.baseline_window = baseline_window
+        self.s_name = 'I_RollingMetrics'
+        # (userName, metric) -> daily series on a continuous calendar, plus its cached trend frame
+        self._series = {}
+        self._units = {}
+        self._results = {}
+        if agg_df is not None:
+            self.add(agg_df)
+
+    @classmethod
+    def from_rollup(cls, rollup_store, user_name, *args, googleFit_df=None, **kwargs):
+        """Build the daily series from a DailyRollupStore instead of re-running the additive aggregates.
+
+        Only the additive stages are read from the store. The window-dependent ones (V_HR, S_SleepType,
+        V_TotalCalories) are stored per single day, which leaves out records crossing midnight, so they
+        are computed from googleFit_df over the whole window, as are days the store does not cover.
+        Without googleFit_df those metrics are left out.
+        """
+        user_df = None if googleFit_df is None else googleFit_df[googleFit_df['userName'] == user_name]
+        frames = []
+        for s_name in dict.fromkeys(s_name for s_name, _, _ in cls.METRICS.values()):
+            agg_df = None
+            if s_name not in rollup_store.WINDOW_DEPENDENT_STAGES:
+                agg_df = rollup_store.lookup(user_name, s_name, *args)
+            if agg_df is None and user_df is not None:
+                agg_df = rollup_store.compute(user_df, s_name, *args)
+            frames.append(agg_df)
+        frames = [frame for frame in frames if frame is not None and not frame.empty]
+        return cls(pd.concat(frames, ignore_index=True) if frames else None, **kwargs)
+
+    def add(self, agg_df):
+        """Merge long-format aggregate rows into the daily series; only touched series are recomputed."""
+        for metric, (s_name, value_type, how) in self.METRICS.items():
+            rows = agg_df[(agg_df['s_name'] == s_name) & (agg_df['valueType'] == value_type)]
+            if rows.empty:
+                continue
+            rows = rows.assign(date=pd.to_datetime(rows['date']), value=pd.to_numeric(rows['value'], errors='coerce'))
+            for user_name, user_rows in rows.groupby('userName'):
+                daily = user_rows.groupby('date')['value'].agg(how)
+                key = (user_name, metric)
+                if key in self._series:
+                    # New days overwrite, older days are kept
+                    daily = daily.combine_first(self._series[key])
+                self._series[key] = daily.asfreq('D')
+                self._units[key] = user_rows['unit'].iloc[0]
+                self._results.pop(key, None)
+
+    def _compute(self, key):
+        daily = self._series[key]
+        values = daily.to_numpy(dtype='float64')
+        columns = {}
+
+        for window in self.windows:
+            window_sum, window_count = rolling_sum(values, window)
+            columns[f'movingAvg{window}'] = np.divide(window_sum, window_count, out=np.full(len(values), np.nan), where=window_count > 0)
+            columns[f'rollingMin{window}'] = sliding_extreme(values, window, 'min')
+            columns[f'rollingMax{window}'] = sliding_extreme(values, window, 'max')
+
+        # Week-over-week: this 7-day mean against the 7-day mean one week earlier
+        week_sum, week_count = rolling_sum(values, 7)
+        week_mean = np.divide(week_sum, week_count, out=np.full(len(values), np.nan), where=week_count > 0)
+        columns['wowDelta'] = week_mean - np.concatenate((np.full(min(7, len(values)), np.nan), week_mean[:-7]))
+
+        # Baseline deviation: today's value as a z-score against the preceding baseline_window days
+        squares = values * values
+        base_sum, base_count = rolling_sum(np.concatenate(([np.nan], values[:-1])), self.baseline_window)
+        base_sq_sum, _ = rolling_sum(np.concatenate(([np.nan], squares[:-1])), self.baseline_window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            base_mean = base_sum / base_count
+            base_std = np.sqrt(np.maximum(base_sq_sum / base_count - base_mean * base_mean, 0))
+            columns[f'baselineDeviation{self.baseline_window}'] = np.where((base_count > 1) & (base_std > 0), (values - base_mean) / base_std, np.nan)
+
+        trend_df = pd.DataFrame(columns, index=daily.index)
+        trend_df = trend_df[~np.isnan(values)]
+        return trend_df.reset_index(names='date').melt(id_vars=['date'], var_name='valueType', value_name='value')
+
+    def process(self, *args):
+        """Long-format trend rows; optional date arguments take the same forms as the pillar classes."""
+        days = set(window_dates(*args)) if args else None
+        frames = []
+        for key in self._series:
+            if key not in self._results:
+                self._results[key] = self._compute(key)
+            trend_df = self._results[key].copy()
+            user_name, metric = key
+            trend_df['date'] = trend_df['date'].dt.date
+            if days is not None:
+                trend_df = trend_df[trend_df['date'].isin(days)]
+            trend_df['userName'] = user_name
+            trend_df['type'] = metric
+            trend_df['unit'] = self._units[key]
+            frames.append(trend_df)
+
+        if not frames:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value'])
+
+        final_df = pd.concat(frames, ignore_index=True)
+        final_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        final_df['s_name'] = self.s_name
+        final_df['value'] = final_df['value'].round(2)
+        final_df = final_df.sort_values(by=['date', 'type'], ascending=False, ignore_index=True)
+        return final_df[['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']]
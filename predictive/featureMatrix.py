@@ -0,0 +1,190 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from processing.rollup.dailyRollup import window_dates
+
+# feature -> (s_name, valueType) of the long-format aggregate row it is read from
+AGGREGATE_FEATURES = {
+    'hrDayAvg': ('V_HR', 'dayAvg'),
+    'hrDayMin': ('V_HR', 'dayMin'),
+    'hrDayMax': ('V_HR', 'dayMax'),
+    'hrRestingAvg': ('V_HR', 'restingAvg'),
+    'hrSleepAvg': ('V_HR', 'sleepAvg'),
+    'hrActivityAvg': ('V_HR', 'activityAvg'),
+    'hrWorkoutAvg': ('V_HR', 'workoutAvg'),
+    'steps': ('A_StepCount', 'TotalStepCount'),
+    'distance': ('A_WalkingRunningDistance', 'TotalWalkingRunningDistance'),
+    'activityCalories': ('A_ActivityCalories', 'TotalActivityCalories'),
+    'totalCalories': ('V_TotalCalories', 'TotalCalories'),
+    'activeCalories': ('V_TotalCalories', 'ActiveCalories'),
+    'restingCalories': ('V_TotalCalories', 'RestingCalories'),
+    'sleepDuration': ('S_SleepType', 'TotalSleepDuration'),
+    'sleepLight': ('S_SleepType', 'TotalLightSleepDuration'),
+    'sleepDeep': ('S_SleepType', 'TotalDeepSleepDuration'),
+    'sleepREM': ('S_SleepType', 'TotalREMSleepDuration'),
+    'sleepAwake': ('S_SleepType', 'TotalAwakeDuration'),
+}
+# Features computed from stream outputs rather than read from aggregate rows
+STREAM_FEATURES = ('workoutMinutes', 'coverage')
+
+
+class FeatureMatrix:
+    """Dense float32 per-user-day feature matrix built from pillar outputs, for the Predictive layer.
+
+    Rows are (userName, date) on a continuous calendar per user, sorted by user then date, so a
+    missing day is a row of NaN rather than an absent row. Base features come from one pivot of every
+    user's long-format aggregate rows at once; lags and trailing means are computed over the whole
+    matrix with prefix sums that restart at each user's first row, so no per-user loop is involved.
+    The result is written once to Parquet or to a memory-mappable .npy, and model training reads
+    that file instead of reprocessing the bronze data.
+    """
+
+    def __init__(self, lags=(1, 7), windows=(7, 28)):
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self._frames = []
+        self._result = None
+
+    def add(self, stage_outputs):
+        """Add a PillarRunner.process() result, or any iterable of pillar output frames, for one or more users."""
+        frames = stage_outputs.items() if isinstance(stage_outputs, dict) else ((None, frame) for frame in stage_outputs)
+        for s_name, frame in frames:
+            if frame is None or frame.empty:
+                continue
+            long_df = self._long_rows(s_name, frame)
+            if long_df is not None and not long_df.empty:
+                self._frames.append(long_df)
+        self._result = None
+        return self
+
+    def _long_rows(self, s_name, frame):
+        """(userName, date, feature, value) rows from one pillar output."""
+        if 'valueType' in frame.columns:
+            lookup = {key: feature for feature, key in AGGREGATE_FEATURES.items()}
+            keys = pd.MultiIndex.from_arrays([frame['s_name'], frame['valueType']])
+            rows = pd.DataFrame({'userName': frame['userName'].to_numpy(), 'date': frame['date'].to_numpy(),
+                                 'feature': pd.Series(lookup).reindex(keys).to_numpy(), 'value': pd.to_numeric(frame['value'], errors='coerce').to_numpy()})
+            rows = rows[rows['feature'].notna()]
+            if 'coverage' in frame.columns:
+                # The same coverage is attached to every row of a user-day; one copy is enough
+                coverage = frame[['userName', 'date', 'coverage']].drop_duplicates(['userName', 'date'])
+                rows = pd.concat([rows, coverage.rename(columns={'coverage': 'value'}).assign(feature='coverage')], ignore_index=True)
+            return rows
+        if s_name == 'V_TotalCalories' and 'activeCalories' in frame.columns:
+            from processing.pillars.vitality.dataStream.v_calorieTimeline import VCalorieTimeline
+            daily_df = VCalorieTimeline(frame).daily_totals()
+            return self._long_rows(None, daily_df)
+        if s_name == 'W_Duration' and 'duration' in frame.columns:
+            # Workouts are bucketed by the local day they started on
+            starts = pd.to_datetime(frame['startDate'])
+            if isinstance(starts.dtype, pd.DatetimeTZDtype):
+                starts = starts.dt.tz_localize(None)
+            # One W_Duration row per lap; its start identifies it when the same output is added again
+            laps = frame['Lap.StartTime'] if 'Lap.StartTime' in frame.columns else frame['startDate']
+            return pd.DataFrame({'userName': frame['userName'].to_numpy(), 'date': starts.dt.date.to_numpy(),
+                                 'feature': 'workoutMinutes', 'value': pd.to_numeric(frame['duration'], errors='coerce').to_numpy(),
+                                 'workout': laps.astype(str).to_numpy()})
+        return None
+
+    def _base_matrix(self):
+        if not self._frames:
+            return pd.DataFrame(columns=list(AGGREGATE_FEATURES) + list(STREAM_FEATURES),
+                                index=pd.MultiIndex.from_arrays([[], []], names=['userName', 'date']), dtype='float32')
+        long_df = pd.concat(self._frames, ignore_index=True)
+        long_df['date'] = pd.to_datetime(long_df['date']).dt.normalize()
+        # Workout minutes add up over a day's sessions, each counted once however often it was added;
+        # every other feature has one row per user-day (a later add() of the same day wins)
+        additive = long_df['feature'] == 'workoutMinutes'
+        workouts = long_df[additive].reindex(columns=['userName', 'date', 'feature', 'value', 'workout'])
+        workouts = workouts.drop_duplicates(['userName', 'workout'], keep='last')
+        summed = workouts.groupby(['userName', 'date', 'feature'])['value'].sum()
+        latest = long_df[~additive].groupby(['userName', 'date', 'feature'])['value'].last()
+        wide_df = pd.concat([summed, latest]).unstack('feature')
+        wide_df = wide_df.reindex(columns=[column for column in list(AGGREGATE_FEATURES) + list(STREAM_FEATURES)
+                                           if column in wide_df.columns])
+        if 'workoutMinutes' in wide_df.columns:
+            # No workout on a day with other data means zero minutes, not unknown
+            wide_df['workoutMinutes'] = wide_df['workoutMinutes'].fillna(0)
+
+        # Continuous calendar per user, built for all users in one go
+        spans = wide_df.reset_index().groupby('userName')['date'].agg(['min', 'max'])
+        lengths = ((spans['max'] - spans['min']).dt.days + 1).to_numpy()
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        dates = np.repeat(spans['min'].to_numpy(dtype='datetime64[ns]'), lengths) + offsets.astype('timedelta64[D]')
+        calendar = pd.MultiIndex.from_arrays([np.repeat(spans.index.to_numpy(), lengths), dates], names=['userName', 'date'])
+        return wide_df.reindex(calendar).astype('float32')
+
+    def _derived(self, base_df):
+        """Lag and trailing-mean features for every base column, across all users at once."""
+        values = base_df.to_numpy(dtype='float64')
+        user_codes = pd.factorize(base_df.index.get_level_values('userName'))[0]
+        rows = np.arange(len(values))
+        # Position of each row's user's first row; lags and windows never reach past it
+        user_start = np.zeros(len(values), dtype='int64')
+        if len(values):
+            first = np.flatnonzero(np.diff(user_codes, prepend=-1))
+            user_start = np.repeat(first, np.diff(np.append(first, len(values))))
+
+        columns = {}
+        names = list(base_df.columns)
+        for lag in self.lags:
+            source = rows - lag
+            lagged = np.full(values.shape, np.nan)
+            valid = source >= user_start
+            lagged[valid] = values[source[valid]]
+            columns.update({f'{name}Lag{lag}': lagged[:, position] for position, name in enumerate(names)})
+
+        valid_values = ~np.isnan(values)
+        prefix_sum = np.vstack((np.zeros((1, values.shape[1])), np.cumsum(np.where(valid_values, values, 0.0), axis=0)))
+        prefix_count = np.vstack((np.zeros((1, values.shape[1])), np.cumsum(valid_values, axis=0)))
+        for window in self.windows:
+            # Trailing window of `window` days ending today, clipped to the user's first day
+            lower = np.maximum(rows + 1 - window, user_start)
+            window_sum = prefix_sum[rows + 1] - prefix_sum[lower]
+            window_count = prefix_count[rows + 1] - prefix_count[lower]
+            window_mean = np.divide(window_sum, window_count, out=np.full(values.shape, np.nan), where=window_count > 0)
+            columns.update({f'{name}Mean{window}': window_mean[:, position] for position, name in enumerate(names)})
+        return pd.DataFrame(columns, index=base_df.index).astype('float32')
+
+    def build(self, *args):
+        """The feature matrix; optional date arguments (same forms as the pillar classes) select its rows.
+
+        Lags and windows are computed before rows are selected, so the first days of a window still
+        see the days before it.
+        """
+        if self._result is None:
+            base_df = self._base_matrix()
+            self._result = pd.concat([base_df, self._derived(base_df)], axis=1)
+        if not args:
+            return self._result
+        days = pd.to_datetime(pd.Series(window_dates(*args)))
+        return self._result[self._result.index.get_level_values('date').isin(days)]
+
+    def to_parquet(self, path, *args):
+        matrix_df = self.build(*args)
+        matrix_df.reset_index().to_parquet(path, index=False)
+        return len(matrix_df)
+
+    def to_npy(self, directory, *args):
+        """Write features.npy (float32, rows x features) with rows.json and columns.json beside it."""
+        matrix_df = self.build(*args)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'features.npy'), np.ascontiguousarray(matrix_df.to_numpy(dtype='float32')))
+        with open(os.path.join(directory, 'columns.json'), 'w') as columns_file:
+            json.dump(list(matrix_df.columns), columns_file)
+        with open(os.path.join(directory, 'rows.json'), 'w') as rows_file:
+            json.dump({'userName': matrix_df.index.get_level_values('userName').tolist(),
+                       'date': [str(date.date()) for date in matrix_df.index.get_level_values('date')]}, rows_file)
+        return len(matrix_df)
+
+
+def load_feature_matrix(directory, mmap_mode='r'):
+    """(features, row index frame, column names) of a matrix written by FeatureMatrix.to_npy; the array is memory-mapped."""
+    features = np.load(os.path.join(directory, 'features.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(directory, 'columns.json')) as columns_file:
+        columns = json.load(columns_file)
+    with open(os.path.join(directory, 'rows.json')) as rows_file:
+        rows = pd.DataFrame(json.load(rows_file))
+    return features, rows, columns
@@ -0,0 +1,273 @@
+import json
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote, unquote
+
+ALL_DATA_DIR = os.path.join('Fit', 'All Data')
+ACTIVITIES_DIR = os.path.join('Fit', 'Activities')
+# Errors worth another attempt: a lost worker, I/O on the shared filesystem, memory pressure. Anything
+# else is a property of the user's data and would fail again the same way.
+TRANSIENT_ERRORS = (BrokenProcessPool, OSError, MemoryError, TimeoutError)
+
+
+def _atomic_write_json(path, payload):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as tmp_file:
+        json.dump(payload, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def process_user(user_name, user_dir, output_root, args, pillars=None):
+    """Parse one user's bronze files, run every pillar and write one Parquet part per stage.
+
+    Runs inside a pool worker, so it only imports the pipeline there and only ever
+    reads the files under user_dir.
+    """
+    import pandas as pd
+    from data_source.parseData.googleFitDataParsing import ParseData
+    from data_egestion.arrowEgestion import ArrowEgestion
+    from processing.engine.pillarRunner import PillarRunner
+    from processing.pillars.registry import pillar_stage_names
+
+    start = time.perf_counter()
+    parser = ParseData()
+    # Only the All Data files some selected stage reads are parsed
+    googleFit_df = parser.allData_json(os.path.join(user_dir, ALL_DATA_DIR), user_name=user_name,
+                                       stages=pillar_stage_names(pillars))
+    activities_dir = os.path.join(user_dir, ACTIVITIES_DIR)
+    googleFit_activitiesData = parser.activities_tcx(activities_dir) if os.path.isdir(activities_dir) else pd.DataFrame()
+    if not googleFit_activitiesData.empty:
+        googleFit_activitiesData.insert(0, 'userName', user_name)
+    parse_seconds = time.perf_counter() - start
+
+    # Stages none of whose registry data sources has a row in the window (e.g. the workouts of a user
+    # without TCX files) are left out, so each stage is skipped on its own inputs, not with its pillar
+    runner = PillarRunner(googleFit_df, googleFit_activitiesData, *args, mode='sequential', pillars=pillars,
+                          coverage=not googleFit_df.empty, skip_empty_stages=True)
+    stage_outputs = runner.process()
+    days_with_data = runner.completeness.days_with_data() if runner.completeness is not None else []
+
+    # Hive-style partitions: <output_root>/s_name=<stage>/userName=<user>/part.parquet
+    egestion = ArrowEgestion()
+    rows = {}
+    for s_name, stage_df in stage_outputs.items():
+        if stage_df.empty or (s_name not in egestion.stream_schemas and 'valueType' not in stage_df.columns):
+            continue
+        partition_dir = os.path.join(output_root, f's_name={s_name}', f'userName={quote(user_name, safe="")}')
+        os.makedirs(partition_dir, exist_ok=True)
+        tmp_path = os.path.join(partition_dir, f'part.{os.getpid()}.tmp')
+        rows[s_name] = egestion.write_parquet(stage_df, tmp_path, s_name=s_name)
+        os.replace(tmp_path, os.path.join(partition_dir, 'part.parquet'))
+
+    return {
+        'userName': user_name,
+        'bronzeRows': int(len(googleFit_df)),
+        'daysWithData': len(days_with_data),
+        'rows': rows,
+        # A failing stage is reported here; the user's other stages are still written
+        'stageFailures': runner.failures,
+        'skippedStages': runner.skipped_stages,
+        'parseSeconds': round(parse_seconds, 4),
+        'seconds': round(time.perf_counter() - start, 4),
+        'workerPid': os.getpid(),
+    }
+
+
+class BatchRunner:
+    """Run the pipeline for every user under users_root in a pool of worker processes.
+
+    Expected layout is one Takeout-style folder per user: <users_root>/<userName>/Fit/All Data/*.json,
+    optionally with Fit/Activities/*.tcx. Several nodes can run the same job against the same
+    users_root and output_root on a shared filesystem: users are claimed with lock files and
+    finished users are checkpointed, so a node that crashes or is restarted resumes where it stopped.
+    """
+
+    def __init__(self, users_root, output_root, *args, max_workers=None, max_tasks_per_child=20,
+                 retries=2, lock_timeout=3600, pillars=None, node_name=None):
+        self.users_root = users_root
+        self.output_root = output_root
+        self.args = args
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Workers are replaced after this many users, so memory kept by pandas/allocators stays bounded
+        self.max_tasks_per_child = max_tasks_per_child
+        self.retries = retries
+        self.lock_timeout = lock_timeout
+        # Held locks are refreshed well within lock_timeout, so only a node that died leaves a stale one
+        self.lock_refresh_seconds = lock_timeout / 4
+        self.pillars = pillars
+        self.node_name = node_name or f'{socket.gethostname()}-{os.getpid()}'
+
+        self.checkpoint_dir = os.path.join(output_root, '_checkpoint')
+        self.lock_dir = os.path.join(output_root, '_locks')
+        self.runs_dir = os.path.join(output_root, '_runs')
+        for directory in (self.checkpoint_dir, self.lock_dir, self.runs_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.report = None
+
+    def users(self):
+        return sorted(name for name in os.listdir(self.users_root)
+                      if os.path.isdir(os.path.join(self.users_root, name, ALL_DATA_DIR)))
+
+    def _marker(self, directory, user_name, suffix):
+        return os.path.join(directory, f'{quote(user_name, safe="")}.{suffix}')
+
+    def completed_users(self):
+        return sorted(unquote(name[:-len('.done')]) for name in os.listdir(self.checkpoint_dir) if name.endswith('.done'))
+
+    def _claim(self, user_name):
+        """Take the user's lock file; O_EXCL creation is atomic, also on shared filesystems."""
+        lock_path = self._marker(self.lock_dir, user_name, 'lock')
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._take_over_stale(lock_path):
+                return False
+            return self._claim(user_name)
+        with os.fdopen(descriptor, 'w') as lock_file:
+            json.dump({'node': self.node_name, 'claimedAt': time.time()}, lock_file)
+        return True
+
+    def _take_over_stale(self, lock_path):
+        """Move a lock not refreshed for lock_timeout out of the way; True if the lock path is free again.
+
+        The lock is renamed to a name of this node's first, which only one node can do, so two nodes
+        never both remove it and then both claim. If its owner refreshed it in between, it is put back.
+        """
+        try:
+            if time.time() - os.path.getmtime(lock_path) < self.lock_timeout:
+                return False
+            stale_path = f'{lock_path}.{quote(self.node_name, safe="")}.stale'
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            # Released, or taken over by another node, in the meantime
+            return True
+        try:
+            if time.time() - os.path.getmtime(stale_path) < self.lock_timeout:
+                try:
+                    os.link(stale_path, lock_path)
+                except FileExistsError:
+                    pass
+                return False
+            return True
+        finally:
+            os.remove(stale_path)
+
+    def _refresh_locks(self, user_names):
+        """Touch the locks this node holds, so other nodes never see them as stale while the users are processed."""
+        for user_name in user_names:
+            lock_path = self._marker(self.lock_dir, user_name, 'lock')
+            try:
+                with open(lock_path) as lock_file:
+                    if json.load(lock_file).get('node') != self.node_name:
+                        continue
+                os.utime(lock_path)
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def _release(self, user_name):
+        try:
+            os.remove(self._marker(self.lock_dir, user_name, 'lock'))
+        except FileNotFoundError:
+            pass
+
+    def _new_pool(self):
+        # spawn keeps workers free of the parent's memory and is required for max_tasks_per_child
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   max_tasks_per_child=self.max_tasks_per_child)
+
+    def run(self, users=None):
+        """Process every pending user; returns (and writes under _runs/) a throughput report."""
+        run_start = time.perf_counter()
+        users = list(users) if users is not None else self.users()
+        done = set(self.completed_users())
+        pending = [user_name for user_name in users if user_name not in done]
+
+        attempts = {user_name: 0 for user_name in pending}
+        results, failures, skipped = [], {}, sorted(done.intersection(users))
+        queue = list(pending)
+        pool = self._new_pool()
+        running = {}
+        next_refresh = time.monotonic() + self.lock_refresh_seconds
+        try:
+            while queue or running:
+                # Keep at most two tasks per worker in flight, claiming users only when they are submitted
+                while queue and len(running) < 2 * self.max_workers:
+                    user_name = queue.pop(0)
+                    if attempts[user_name] == 0 and not self._claim(user_name):
+                        skipped.append(user_name)
+                        continue
+                    attempts[user_name] += 1
+                    future = pool.submit(process_user, user_name, os.path.join(self.users_root, user_name),
+                                         self.output_root, self.args, self.pillars)
+                    running[future] = user_name
+                if not running:
+                    continue
+
+                finished, _ = wait(running, timeout=max(next_refresh - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                if time.monotonic() >= next_refresh:
+                    # Users queued for a retry keep their lock too
+                    self._refresh_locks(set(running.values()).union(user for user in queue if attempts[user]))
+                    next_refresh = time.monotonic() + self.lock_refresh_seconds
+                broken = False
+                for future in finished:
+                    user_name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as error:
+                        # A worker died (e.g. killed for memory); every task in flight is lost with it
+                        broken = True
+                        self._retry_or_fail(user_name, error, attempts, queue, failures)
+                    except Exception as error:
+                        self._retry_or_fail(user_name, error, attempts, queue, failures)
+                    else:
+                        result['attempts'] = attempts[user_name]
+                        result['node'] = self.node_name
+                        _atomic_write_json(self._marker(self.checkpoint_dir, user_name, 'done'), result)
+                        self._release(user_name)
+                        results.append(result)
+                if broken:
+                    for future, user_name in running.items():
+                        self._retry_or_fail(user_name, BrokenProcessPool('worker pool restarted'), attempts, queue, failures)
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._new_pool()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            for user_name in list(queue) + list(running.values()):
+                self._release(user_name)
+
+        self.report = self._report(results, failures, skipped, time.perf_counter() - run_start)
+        _atomic_write_json(os.path.join(self.runs_dir, f'{self.node_name}-{int(time.time())}.json'), self.report)
+        return self.report
+
+    def _retry_or_fail(self, user_name, error, attempts, queue, failures):
+        if isinstance(error, TRANSIENT_ERRORS) and attempts[user_name] <= self.retries:
+            queue.append(user_name)
+        else:
+            failures[user_name] = repr(error)
+            self._release(user_name)
+
+    def _report(self, results, failures, skipped, wall_seconds):
+        output_rows = sum(sum(result['rows'].values()) for result in results)
+        bronze_rows = sum(result['bronzeRows'] for result in results)
+        worker_seconds = sum(result['seconds'] for result in results)
+        return {
+            'node': self.node_name,
+            'usersProcessed': len(results),
+            'usersFailed': len(failures),
+            'usersSkipped': len(skipped),
+            'failures': failures,
+            'stageFailures': {result['userName']: result['stageFailures'] for result in results if result['stageFailures']},
+            'retries': sum(result['attempts'] - 1 for result in results),
+            'bronzeRows': bronze_rows,
+            'outputRows': output_rows,
+            'wallSeconds': round(wall_seconds, 4),
+            'workerSeconds': round(worker_seconds, 4),
+            'usersPerMinute': round(60 * len(results) / wall_seconds, 2) if wall_seconds > 0 else None,
+            'bronzeRowsPerSecond': round(bronze_rows / wall_seconds, 1) if wall_seconds > 0 else None,
+            'parallelEfficiency': round(worker_seconds / (wall_seconds * self.max_workers), 2) if wall_seconds > 0 else None,
+        }
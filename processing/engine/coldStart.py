@@ -0,0 +1,51 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from processing.pillars.registry import STAGE_REGISTRY, pillar_names
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': len(sys.modules),
+                  'processingModules': sorted(m for m in sys.modules if m.startswith('processing.'))}}))
+"""
+
+
+def cold_start(statement, repeat=7):
+    """Median time an import statement takes in a fresh interpreter, and the modules it leaves loaded.
+
+    Each run is a new process, so nothing is shared through sys.modules; the OS file cache is warm
+    after the first run, which is the case that matters for short-lived workers.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(statement=statement)], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output))
+    return {
+        'statement': statement,
+        'medianSeconds': round(statistics.median(run['seconds'] for run in runs), 4),
+        'modules': runs[-1]['modules'],
+        'processingModules': runs[-1]['processingModules'],
+    }
+
+
+def pillar_cold_starts(repeat=7):
+    """Cold start of the package itself, of each stage class and of each whole pillar."""
+    statements = ['import pandas', 'import processing.pillars']
+    for s_name, entry in STAGE_REGISTRY.items():
+        statements.append(f"from processing.pillars import {(entry['aggregate'] or entry['stream']).split(':')[1]}")
+    for pillar in pillar_names():
+        statements.append(f"import processing.pillars.{pillar} as p; [getattr(p, name) for name in p.__all__]")
+    return [cold_start(statement, repeat) for statement in statements]
+
+
+if __name__ == '__main__':
+    for result in pillar_cold_starts():
+        print(f"{result['medianSeconds']:8.4f}s {len(result['processingModules']):3d} modules  {result['statement']}")
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from processing.kernels.numpyKernels import cumulative_lookup
+from processing.pillars.dataSources import HR_SOURCE, STEP_COUNT_SOURCE
+from processing.rollup.dailyRollup import window_dates
+
+DAY_NS = 24 * 60 * 60 * 10**9
+MINUTE_NS = 60 * 10**9
+
+
+class DataCompleteness:
+    """Wear time, data gaps and coverage per user-day from the heart-rate and step timestamps.
+
+    Every heart-rate sample counts as sample_minutes of wear, a step record as its interval when it
+    is no longer than max_gap_minutes and otherwise as two samples at its ends. Sorted by start,
+    samples closer than max_gap_minutes to the wear seen so far extend it, so one running maximum
+    over the ends turns them into non-overlapping wear blocks; everything between blocks is a gap.
+    Coverage is the share of a day's minutes that fall inside a block, so an aggregate over 3 hours
+    of wear can be told apart from a genuinely low day.
+    """
+
+    SOURCES = (HR_SOURCE, STEP_COUNT_SOURCE)
+    DAILY_COLUMNS = ['userName', 'date', 'hasData', 'wearMinutes', 'coverage', 'gapCount', 'longestGapMinutes']
+
+    def __init__(self, googleFit_df, *args, max_gap_minutes=10, sample_minutes=1):
+        self.max_gap_ns = int(max_gap_minutes * MINUTE_NS)
+        self.sample_ns = int(sample_minutes * MINUTE_NS)
+        self.days = window_dates(*args) if args else None
+
+        records_df = googleFit_df[googleFit_df['data_source'].isin(self.SOURCES)] if 'data_source' in googleFit_df.columns else googleFit_df
+        # (userName) -> (wear block starts, wear block ends, sample starts), all int64 local ns
+        self._blocks = {user_name: self._wear_blocks(user_df) for user_name, user_df in records_df.groupby('userName', sort=True)}
+        self._daily = None
+        self._gaps = None
+
+    def _wear_blocks(self, user_df):
+        starts = user_df['startDate'].to_numpy(dtype='datetime64[ns]').view('int64')
+        ends = user_df['endDate'].to_numpy(dtype='datetime64[ns]').view('int64')
+        # Step records longer than max_gap are coarse rollups that say nothing about the minutes inside
+        # them, so only their start and end count as samples; shorter ones are worn for their extent
+        coarse = (ends - starts) > self.max_gap_ns
+        starts, ends = np.concatenate((starts, ends[coarse])), np.concatenate((np.where(coarse, starts, ends), ends[coarse]))
+        ends = np.maximum(ends, starts + self.sample_ns)
+
+        if self.days:
+            # Samples just outside the window can still bridge its first or last minutes
+            lower = pd.Timestamp(self.days[0]).value - self.max_gap_ns
+            upper = pd.Timestamp(self.days[-1]).value + DAY_NS + self.max_gap_ns
+            keep = (ends >= lower) & (starts < upper)
+            starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='int64'), starts
+
+        order = np.argsort(starts, kind='stable')
+        starts, ends = starts[order], ends[order]
+        reach = np.maximum.accumulate(ends)
+        # A new block starts where a sample begins more than max_gap after all earlier wear ended
+        new_block = np.ones(len(starts), dtype=bool)
+        new_block[1:] = starts[1:] > reach[:-1] + self.max_gap_ns
+        first = np.flatnonzero(new_block)
+        last = np.append(first[1:] - 1, len(starts) - 1)
+        return starts[first], reach[last], starts
+
+    def _day_starts(self, block_starts, block_ends):
+        if self.days:
+            return np.array([pd.Timestamp(day).value for day in self.days], dtype='int64')
+        if len(block_starts) == 0:
+            return np.empty(0, dtype='int64')
+        first_day = block_starts[0] - block_starts[0] % DAY_NS
+        return np.arange(first_day, block_ends[-1], DAY_NS, dtype='int64')
+
+    def gaps(self):
+        """Gap intervals (no wear) inside the window, split at midnight: userName, startDate, endDate, minutes."""
+        if self._gaps is None:
+            frames = []
+            for user_name, (block_starts, block_ends, _) in self._blocks.items():
+                day_starts = self._day_starts(block_starts, block_ends)
+                if len(day_starts) == 0:
+                    continue
+                # The complement of the blocks, cut into days so a gap never spans two dates
+                bounds_start = np.concatenate(([day_starts[0]], block_ends))
+                bounds_end = np.concatenate((block_starts, [day_starts[-1] + DAY_NS]))
+                span = np.maximum(bounds_end - bounds_start, 0)
+                first_day = (bounds_start - day_starts[0]) // DAY_NS
+                last_day = (np.maximum(bounds_end, bounds_start + 1) - 1 - day_starts[0]) // DAY_NS
+                pieces = np.where(span > 0, last_day - first_day + 1, 0)
+                gap = np.repeat(np.arange(len(span)), pieces)
+                day = np.repeat(first_day, pieces) + (np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces))
+                piece_start = np.maximum(bounds_start[gap], day_starts[0] + day * DAY_NS)
+                piece_end = np.minimum(bounds_end[gap], day_starts[0] + (day + 1) * DAY_NS)
+                # Only the requested days are reported when the window is a list of scattered dates
+                keep = np.isin(day_starts[0] + day * DAY_NS, day_starts) & (piece_end > piece_start)
+                frames.append(pd.DataFrame({
+                    'userName': user_name,
+                    'startDate': pd.to_datetime(piece_start[keep]),
+                    'endDate': pd.to_datetime(piece_end[keep]),
+                    'minutes': (piece_end[keep] - piece_start[keep]) / MINUTE_NS,
+                }))
+            self._gaps = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['userName', 'startDate', 'endDate', 'minutes'])
+        return self._gaps
+
+    def daily(self):
+        """One row per user-day: whether any sample started that day, wear minutes, coverage and gap statistics."""
+        if self._daily is None:
+            frames = []
+            user_gaps_dfs = dict(tuple(self.gaps().groupby('userName', sort=False)))
+            for user_name, (block_starts, block_ends, sample_starts) in self._blocks.items():
+                day_starts = self._day_starts(block_starts, block_ends)
+                if len(day_starts) == 0:
+                    continue
+                # Covered time before t is a running total over alternating wear and gap segments
+                boundaries = np.column_stack((block_starts, block_ends)).ravel()
+                segment_values = np.zeros(max(len(boundaries) - 1, 0))
+                segment_values[::2] = (block_ends - block_starts)
+                wear_ns = cumulative_lookup(boundaries, segment_values, day_starts + DAY_NS) - cumulative_lookup(boundaries, segment_values, day_starts)
+                samples = np.searchsorted(sample_starts, day_starts + DAY_NS) - np.searchsorted(sample_starts, day_starts)
+
+                user_gaps = user_gaps_dfs.get(user_name, self.gaps().iloc[:0])
+                gap_day = user_gaps['startDate'].dt.normalize().to_numpy(dtype='datetime64[ns]').view('int64')
+                gap_position = np.searchsorted(day_starts, gap_day)
+                gap_count = np.bincount(gap_position, minlength=len(day_starts))[:len(day_starts)]
+                longest = np.zeros(len(day_starts))
+                np.maximum.at(longest, gap_position, user_gaps['minutes'].to_numpy(dtype='float64'))
+
+                frames.append(pd.DataFrame({
+                    'userName': user_name,
+                    'date': pd.to_datetime(day_starts).date,
+                    'hasData': samples > 0,
+                    'wearMinutes': (wear_ns / MINUTE_NS).round(1),
+                    'coverage': (wear_ns / DAY_NS).round(3),
+                    'gapCount': gap_count,
+                    'longestGapMinutes': longest.round(1),
+                }))
+            self._daily = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.DAILY_COLUMNS)
+        return self._daily
+
+    def days_with_data(self, user_name=None):
+        """Dates on which at least one heart-rate or step sample started, optionally for one user."""
+        daily_df = self.daily()
+        if user_name is not None:
+            daily_df = daily_df[daily_df['userName'] == user_name]
+        return sorted(set(daily_df.loc[daily_df['hasData'], 'date']))
+
+    def process(self):
+        return self.daily()
+
+
+def attach_coverage(agg_df, daily_df):
+    """Add the coverage of each row's user-day to a long-format aggregate frame; days not assessed get NaN."""
+    if agg_df.empty or 'date' not in agg_df.columns:
+        return agg_df.assign(coverage=pd.Series(dtype='float64'))
+    keys = pd.MultiIndex.from_arrays([daily_df['userName'], pd.to_datetime(daily_df['date'])])
+    coverage = pd.Series(daily_df['coverage'].to_numpy(dtype='float64'), index=keys)
+    coverage = coverage[~coverage.index.duplicated()]
+    lookup = pd.MultiIndex.from_arrays([agg_df['userName'], pd.to_datetime(agg_df['date'])])
+    return agg_df.assign(coverage=coverage.reindex(lookup).to_numpy())
@@ -0,0 +1,243 @@
+import math
+import pandas as pd
+from datetime import datetime
+
+from processing.pillars.dataSources import (ACTIVE_MINUTES_SOURCE, CALORIES_SOURCE, DISTANCE_SOURCE, HR_SOURCE, SLEEP_SOURCE,
+                                            STEP_COUNT_SOURCE)
+from processing.pillars.sleep.dataStream.s_typeSleep import SSleepType
+
+DAY_NS = 24 * 60 * 60 * 10**9
+MINUTE_NS = 60 * 10**9
+
+HR_CONTEXTS = ('day', 'activity', 'sleep', 'workout', 'resting')
+# Contexts an interval record opens, in the priority VHeartRate flags them with
+INTERVAL_CONTEXTS = ('sleep', 'workout', 'activity')
+# Additive stream -> (s_name, valueType, default type, unit, scale of fit_value), as written by the activity aggregates
+ADDITIVE_STAGES = {
+    'steps': ('A_StepCount', 'TotalStepCount', 'com.google.step_count.delta', 'count', 1),
+    'distance': ('A_WalkingRunningDistance', 'TotalWalkingRunningDistance', 'com.google.distance.delta', 'km', 1 / 1000),
+    'activityCalories': ('A_ActivityCalories', 'TotalActivityCalories', 'com.google.calories.expended', 'kcal', 1),
+}
+SLEEP_VALUE_TYPES = {
+    'LightSleep': 'TotalLightSleepDuration',
+    'DeepSleep': 'TotalDeepSleepDuration',
+    'REMSleep': 'TotalREMSleepDuration',
+    'Awake': 'TotalAwakeDuration',
+}
+TOTAL_SLEEP_STAGES = ('LightSleep', 'DeepSleep', 'REMSleep')
+OUTPUT_COLUMNS = ['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']
+
+
+def _to_ns(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp is pd.NaT:
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_localize(None)
+    return timestamp.value
+
+
+class _DayState:
+    """Running aggregates of one user's local day."""
+
+    def __init__(self, day_ns):
+        self.day_ns = day_ns
+        # context -> [count, sum, min, max]
+        self.hr = {context: [0, 0.0, math.inf, -math.inf] for context in HR_CONTEXTS}
+        # stream -> running total; the end of the last interval counted is kept per user, not per day
+        self.totals = {}
+        # sleep stage -> minutes
+        self.sleep = {}
+
+
+class OnlineAggregator:
+    """Today's aggregates per user, updated one bronze data point at a time for live dashboards.
+
+    push() takes points in the bronze schema (a dict, a list of dicts or a frame) in roughly the
+    order they happen. Every point is applied in O(1): heart rate updates a running count, sum,
+    minimum and maximum for the day and for its context; steps, distance and activity calories add
+    to running totals, trimmed against the end of the last interval counted so repeated or
+    overlapping intervals are counted once, as in the batch kernel; sleep stages add their minutes.
+    The context of a heart-rate sample comes from the latest sleep, workout and activity interval of
+    each kind seen so far, which stays open across midnight.
+
+    Context intervals that arrive after the heart rate they cover are not applied to it
+    retroactively, so live context values can differ from the batch aggregates until the day is
+    recomputed; the day totals cannot. The keep_days most recent days of each user are kept, since
+    sleep is dated by its modifiedTime and usually lands on the next day; points for an older day
+    are counted in late_points and otherwise ignored.
+
+    snapshot() writes the same long-format rows as V_HR, A_StepCount, A_WalkingRunningDistance,
+    A_ActivityCalories and S_SleepType, rounded the same way.
+    """
+
+    def __init__(self, keep_days=2):
+        self.keep_days = keep_days
+        # userName -> day_ns -> _DayState
+        self._days = {}
+        # userName -> context -> [start_ns, end_ns] of the latest interval of that context
+        self._open = {}
+        # userName -> stream -> end_ns of the last additive interval counted
+        self._counted_until = {}
+        # (userName, s_name) -> dataTypeName first seen, written as the row type
+        self._types = {}
+        self.late_points = 0
+
+    def push(self, points):
+        """Apply bronze data points; returns how many were applied to a kept day."""
+        if isinstance(points, dict):
+            points = [points]
+        elif isinstance(points, pd.DataFrame):
+            points = points.to_dict('records')
+        return sum(self._push_point(point) for point in points)
+
+    def _push_point(self, point):
+        data_source = point.get('data_source')
+        user_name = point.get('userName', 'UnknownUser')
+        start_ns = _to_ns(point.get('startDate'))
+        if start_ns is None:
+            return 0
+        end_ns = _to_ns(point.get('endDate'))
+        end_ns = start_ns if end_ns is None else max(end_ns, start_ns)
+
+        if data_source == SLEEP_SOURCE:
+            self._open_interval(user_name, 'sleep', start_ns, end_ns)
+            # S_SleepType dates a stage by its modifiedTime
+            modified_ns = _to_ns(point.get('modifiedTime'))
+            state = self._day_state(user_name, end_ns if modified_ns is None else modified_ns)
+            if state is None:
+                return 0
+            stage = SSleepType.SLEEP_STAGE_MAPPING.get(self._number(point.get('fit_value')), 'Unknown')
+            state.sleep[stage] = state.sleep.get(stage, 0.0) + round((end_ns - start_ns) / MINUTE_NS, 1)
+            self._types.setdefault((user_name, 'S_SleepType'), point.get('dataTypeName'))
+            return 1
+
+        if data_source == CALORIES_SOURCE and point.get('originDataSourceId') != CALORIES_SOURCE:
+            self._open_interval(user_name, 'workout', start_ns, end_ns)
+            return self._add(user_name, 'activityCalories', point, start_ns, end_ns)
+        if data_source in (ACTIVE_MINUTES_SOURCE, STEP_COUNT_SOURCE):
+            self._open_interval(user_name, 'activity', start_ns, end_ns)
+            if data_source == ACTIVE_MINUTES_SOURCE:
+                return 0
+            return self._add(user_name, 'steps', point, start_ns, end_ns)
+        if data_source == DISTANCE_SOURCE:
+            return self._add(user_name, 'distance', point, start_ns, end_ns)
+        if data_source == HR_SOURCE:
+            return self._add_heart_rate(user_name, point, start_ns, end_ns)
+        return 0
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    def _day_state(self, user_name, time_ns):
+        day_ns = time_ns - time_ns % DAY_NS
+        days = self._days.setdefault(user_name, {})
+        state = days.get(day_ns)
+        if state is not None:
+            return state
+        if days and day_ns <= max(days) - self.keep_days * DAY_NS:
+            self.late_points += 1
+            return None
+        state = days[day_ns] = _DayState(day_ns)
+        # At most keep_days days, so a new day evicts the oldest one
+        for old_day_ns in [old for old in days if old <= max(days) - self.keep_days * DAY_NS]:
+            del days[old_day_ns]
+        return state
+
+    def _open_interval(self, user_name, context, start_ns, end_ns):
+        intervals = self._open.setdefault(user_name, {})
+        interval = intervals.get(context)
+        if interval is not None and start_ns <= interval[1]:
+            # Contiguous or overlapping records extend the open interval
+            interval[0] = min(interval[0], start_ns)
+            interval[1] = max(interval[1], end_ns)
+        elif interval is None or start_ns > interval[0]:
+            intervals[context] = [start_ns, end_ns]
+
+    def _context(self, user_name, start_ns, end_ns):
+        intervals = self._open.get(user_name, {})
+        for context in INTERVAL_CONTEXTS:
+            interval = intervals.get(context)
+            if interval is not None and interval[0] <= end_ns and interval[1] >= start_ns:
+                return context
+        return 'resting'
+
+    def _add_heart_rate(self, user_name, point, start_ns, end_ns):
+        value = self._number(point.get('fit_value'))
+        if math.isnan(value):
+            return 0
+        state = self._day_state(user_name, start_ns)
+        if state is None:
+            return 0
+        for context in ('day', self._context(user_name, start_ns, end_ns)):
+            stats = state.hr[context]
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = min(stats[2], value)
+            stats[3] = max(stats[3], value)
+        self._types.setdefault((user_name, 'V_HR'), point.get('dataTypeName'))
+        return 1
+
+    def _add(self, user_name, stream, point, start_ns, end_ns):
+        value = self._number(point.get('fit_value')) * ADDITIVE_STAGES[stream][4]
+        if math.isnan(value):
+            return 0
+        state = self._day_state(user_name, start_ns)
+        if state is None:
+            return 0
+        # Instantaneous points get a 1 ns extent, and overlaps go to the interval counted first
+        end_ns = max(end_ns, start_ns + 1)
+        counted_until = self._counted_until.setdefault(user_name, {})
+        kept_start = max(start_ns, counted_until.get(stream, start_ns))
+        # Only the part before the next midnight belongs to today
+        kept_end = min(end_ns, state.day_ns + DAY_NS)
+        if kept_end > kept_start:
+            state.totals[stream] = state.totals.get(stream, 0.0) + value * (kept_end - kept_start) / (end_ns - start_ns)
+        counted_until[stream] = max(counted_until.get(stream, end_ns), end_ns)
+        self._types.setdefault((user_name, ADDITIVE_STAGES[stream][0]), point.get('dataTypeName'))
+        return 1
+
+    def _user_rows(self, user_name, state):
+        day = pd.Timestamp(state.day_ns).date()
+        rows = []
+        if state.hr['day'][0]:
+            hr_type = self._types.get((user_name, 'V_HR'))
+            for context in HR_CONTEXTS:
+                count, total, minimum, maximum = state.hr[context]
+                for suffix, value in (('Avg', total / count if count else math.nan),
+                                      ('Min', minimum if count else math.nan),
+                                      ('Max', maximum if count else math.nan)):
+                    rows.append(('V_HR', hr_type, 'bpm', f'{context}{suffix}', round(value, 1)))
+        for stream, (s_name, value_type, default_type, unit, _) in ADDITIVE_STAGES.items():
+            if stream in state.totals:
+                rows.append((s_name, self._types.get((user_name, s_name)) or default_type, unit, value_type,
+                             round(state.totals[stream], 1)))
+        if state.sleep:
+            sleep_type = self._types.get((user_name, 'S_SleepType'))
+            for stage, value_type in SLEEP_VALUE_TYPES.items():
+                if stage in state.sleep:
+                    rows.append(('S_SleepType', sleep_type, 'min', value_type, round(state.sleep[stage], 1)))
+            if any(stage in state.sleep for stage in TOTAL_SLEEP_STAGES):
+                total = sum(state.sleep.get(stage, 0.0) for stage in TOTAL_SLEEP_STAGES)
+                rows.append(('S_SleepType', sleep_type, 'min', 'TotalSleepDuration', round(total, 1)))
+        return [(user_name, day) + row for row in rows]
+
+    def snapshot(self, user_name=None):
+        """Long-format rows of the days kept for every user, or for one user, latest day first."""
+        user_names = sorted(self._days) if user_name is None else [user_name]
+        rows = [row for name in user_names for day_ns in sorted(self._days.get(name, {}), reverse=True)
+                for row in self._user_rows(name, self._days[name][day_ns])]
+        if not rows:
+            return pd.DataFrame(columns=OUTPUT_COLUMNS)
+        snapshot_df = pd.DataFrame(rows, columns=['userName', 'date', 's_name', 'type', 'unit', 'valueType', 'value'])
+        snapshot_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return snapshot_df[OUTPUT_COLUMNS]
+
+    def process(self):
+        return self.snapshot()
@@ -0,0 +1,143 @@
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from processing.pillars.registry import STAGE_REGISTRY, load_class, pillar_names, pillar_stage_names, required_inputs
+
+class PillarRunner:
+
+    # pillar -> {stage name: (stage class path, input frame)}; classes are imported when their pillar runs
+    PILLARS = {
+        pillar: {s_name: (entry['aggregate'] or entry['stream'], entry['source'])
+                 for s_name, entry in STAGE_REGISTRY.items() if entry['pillar'] == pillar}
+        for pillar in pillar_names()
+    }
+
+    # Sequential by default: the pillars are mostly pandas work that holds the GIL, and threads measured slower
+    MODES = ('sequential', 'threaded')
+
+    # Stages that can read heart rate from a memory-mapped HeartRateStore instead of the bronze frame
+    HR_STORE_STAGES = ('V_HR',)
+
+    def __init__(self, googleFit_df, googleFit_activitiesData, *args, mode='sequential', max_workers=None, pillars=None, hr_store=None,
+                 coverage=False, skip_empty_stages=False):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported mode: {mode}")
+
+        self.googleFit_df = googleFit_df
+        self.googleFit_activitiesData = googleFit_activitiesData
+        self.args = args
+        self.mode = mode
+        self.pillars = list(pillars) if pillars else list(self.PILLARS)
+        self.max_workers = max_workers or len(self.pillars)
+        self.hr_store = hr_store
+        # Attach each user-day's wear coverage (DataCompleteness) to the long-format aggregate rows
+        self.coverage = coverage
+        self.completeness = None
+        # Leave out the stages none of whose declared inputs has a row in the window, instead of running them on nothing
+        self.skip_empty_stages = skip_empty_stages
+        self.skipped_stages = []
+        # s_name -> 'ExceptionType: message' of the stages that raised in the last process()
+        self.failures = {}
+        # Union of what the selected stages declare in the registry, per input frame
+        self.required_inputs = required_inputs(pillar_stage_names(self.pillars))
+        self._inputs = None
+
+    def _row_mask(self, df, needs):
+        """Boolean mask of the rows of an input frame that stages with these needs read."""
+        import numpy as np
+        from processing.rollup.dailyRollup import window_dates
+
+        keep = np.ones(len(df), dtype=bool)
+        if needs['data_sources'] is not None and 'data_source' in df.columns:
+            keep &= df['data_source'].isin(needs['data_sources']).to_numpy()
+        days = window_dates(*self.args) if self.args else []
+        if days and 'startDate' in df.columns and pd.api.types.is_datetime64_dtype(df['startDate']):
+            # Pillars keep records starting inside the window, so rows outside it plus padding are never read
+            before, after = needs['padding_days']
+            starts = df['startDate'].to_numpy()
+            keep &= (starts >= np.datetime64(days[0] - timedelta(days=before), 'ns')) & \
+                    (starts < np.datetime64(days[-1] + timedelta(days=after + 1), 'ns'))
+        return keep
+
+    def _select_inputs(self, df, needs):
+        """The rows and columns of an input frame that the selected stages read, selected once for all of them."""
+        if df is None or df.empty:
+            return df
+        keep = self._row_mask(df, needs)
+        columns = list(df.columns) if needs['columns'] is None else [col for col in df.columns if col in needs['columns']]
+        if keep.all() and len(columns) == len(df.columns):
+            return df
+        # Row order and df.attrs are kept, so a frame validated at ingest stays conforming
+        return df.loc[keep, columns]
+
+    def _has_input(self, s_name, source):
+        """Whether any row of the stage's own data sources falls in its window."""
+        df = self._input_for(source)
+        if df is None or df.empty:
+            return False
+        return bool(self._row_mask(df, required_inputs([s_name])[source]).any())
+
+    def _prepare_inputs(self):
+        frames = {'allData': self.googleFit_df, 'activitiesData': self.googleFit_activitiesData}
+        self._inputs = {source: self._select_inputs(frames[source], needs) for source, needs in self.required_inputs.items()}
+
+    def _input_for(self, source):
+        # Stages never modify their input, so every stage of the run shares one frame per source
+        return self._inputs[source]
+
+    def _run_pillar(self, pillar):
+        outputs, timings = {}, {}
+        pillar_start = time.perf_counter()
+        for s_name, (class_path, source) in self.PILLARS[pillar].items():
+            if self.skip_empty_stages and not self._has_input(s_name, source):
+                self.skipped_stages.append(s_name)
+                continue
+            stage_start = time.perf_counter()
+            stage_kwargs = {'hr_store': self.hr_store} if self.hr_store is not None and s_name in self.HR_STORE_STAGES else {}
+            try:
+                outputs[s_name] = load_class(class_path)(self._input_for(source), *self.args, **stage_kwargs).process()
+            except Exception as error:
+                # One failing stage must not discard the others; it comes back empty with its error
+                outputs[s_name] = pd.DataFrame()
+                self.failures[s_name] = f'{type(error).__name__}: {error}'
+            timings[s_name] = time.perf_counter() - stage_start
+        return outputs, timings, time.perf_counter() - pillar_start
+
+    def process(self):
+        run_start = time.perf_counter()
+        self.failures = {}
+        self.skipped_stages = []
+        # Selected before the pillars start, so their threads share one filtered frame per input
+        self._prepare_inputs()
+        if self.mode == 'threaded':
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {pillar: executor.submit(self._run_pillar, pillar) for pillar in self.pillars}
+                results = {pillar: future.result() for pillar, future in futures.items()}
+        else:
+            results = {pillar: self._run_pillar(pillar) for pillar in self.pillars}
+        wall_seconds = time.perf_counter() - run_start
+
+        if self.coverage:
+            from processing.engine.dataCompleteness import DataCompleteness, attach_coverage
+            # Read from the whole bronze frame: coverage needs heart rate and steps whichever stages ran
+            self.completeness = DataCompleteness(self.googleFit_df, *self.args)
+            daily_df = self.completeness.daily()
+
+        stage_outputs = {}
+        for pillar, (outputs, timings, pillar_seconds) in results.items():
+            for s_name, stage_df in outputs.items():
+                if self.coverage and 'valueType' in stage_df.columns:
+                    stage_df = attach_coverage(stage_df, daily_df)
+                stage_df.attrs['stageTiming'] = {
+                    'pillar': pillar,
+                    'mode': self.mode,
+                    'stageSeconds': round(timings[s_name], 4),
+                    'pillarSeconds': round(pillar_seconds, 4),
+                    'wallSeconds': round(wall_seconds, 4),
+                    'error': self.failures.get(s_name),
+                }
+                stage_outputs[s_name] = stage_df
+
+        return stage_outputs
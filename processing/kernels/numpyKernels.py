@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+
+# These kernels only operate on contiguous int64/float64 arrays, so the heavy work
+# (argsort, searchsorted, ufunc reductions) runs as vectorised NumPy calls instead of per-row Python.
+
+REDUCERS = ('min', 'max', 'sum', 'mean', 'count')
+
+
+def to_int64_ns(values):
+    """Convert a datetime-like Series/array to int64 nanoseconds since epoch."""
+    return np.ascontiguousarray(pd.to_datetime(pd.Series(values)).to_numpy(dtype='datetime64[ns]').view('int64'))
+
+
+def interval_overlap_mask(starts, ends, event_starts, event_ends):
+    """Flag every interval [start, end] that overlaps at least one event interval."""
+    starts = np.asarray(starts, dtype='int64')
+    ends = np.asarray(ends, dtype='int64')
+    event_starts = np.asarray(event_starts, dtype='int64')
+    event_ends = np.asarray(event_ends, dtype='int64')
+
+    mask = np.zeros(len(starts), dtype=bool)
+    if len(starts) == 0 or len(event_starts) == 0:
+        return mask
+
+    # Sort events by start and keep the running max of their ends; the last event
+    # starting at or before a record's end overlaps it iff that running max reaches the record's start.
+    order = np.argsort(event_starts, kind='stable')
+    sorted_starts = event_starts[order]
+    running_max_end = np.maximum.accumulate(event_ends[order])
+
+    idx = np.searchsorted(sorted_starts, ends, side='right') - 1
+    has_event = idx >= 0
+    mask[has_event] = running_max_end[idx[has_event]] >= starts[has_event]
+    return mask
+
+
+def group_reduce(codes, values, n_groups, how='sum'):
+    """Reduce values per integer group code in one sorted pass; empty groups come back as NaN (0 for count)."""
+    if how not in REDUCERS:
+        raise ValueError(f"Unsupported reducer: {how}")
+
+    codes = np.asarray(codes, dtype='int64')
+    values = np.asarray(values, dtype='float64')
+    valid = (codes >= 0) & (codes < n_groups) & ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+
+    result = np.zeros(n_groups, dtype='float64') if how == 'count' else np.full(n_groups, np.nan)
+    if len(codes) == 0:
+        return result
+
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    group_starts = np.concatenate(([0], boundaries))
+    present = codes[group_starts]
+    counts = np.diff(np.concatenate((group_starts, [len(codes)])))
+
+    if how == 'count':
+        result[present] = counts
+    elif how == 'min':
+        result[present] = np.minimum.reduceat(values, group_starts)
+    elif how == 'max':
+        result[present] = np.maximum.reduceat(values, group_starts)
+    elif how == 'sum':
+        result[present] = np.add.reduceat(values, group_starts)
+    else:
+        result[present] = np.add.reduceat(values, group_starts) / counts
+    return result
+
+
+def bucket_codes(times_ns, origin_ns, width_ns):
+    """Map int64 nanosecond timestamps to fixed-width bucket codes counted from origin."""
+    times_ns = np.asarray(times_ns, dtype='int64')
+    return np.floor_divide(times_ns - np.int64(origin_ns), np.int64(width_ns))
+
+
+def resample_reduce(times_ns, values, origin_ns, width_ns, n_buckets, how='mean'):
+    """Resample samples onto a fixed grid of n_buckets buckets starting at origin."""
+    codes = bucket_codes(times_ns, origin_ns, width_ns)
+    return group_reduce(codes, values, n_buckets, how)
+
+
+def elementary_boundaries(*time_arrays):
+    """Sorted unique cut points of a set of intervals; consecutive pairs form non-overlapping segments."""
+    return np.unique(np.concatenate([np.asarray(times, dtype='int64') for times in time_arrays]))
+
+
+def segment_rate_sum(boundaries, starts, ends, rates):
+    """Sweep intervals over elementary segments, returning the summed rate and covering count of each segment."""
+    n_boundaries = len(boundaries)
+    if n_boundaries < 2:
+        return np.zeros(0), np.zeros(0, dtype='int64')
+
+    start_idx = np.searchsorted(boundaries, np.asarray(starts, dtype='int64'))
+    end_idx = np.searchsorted(boundaries, np.asarray(ends, dtype='int64'))
+    rates = np.asarray(rates, dtype='float64')
+
+    # Difference arrays: +rate where an interval opens, -rate where it closes, then one cumulative sum
+    rate_diff = np.bincount(start_idx, weights=rates, minlength=n_boundaries) - np.bincount(end_idx, weights=rates, minlength=n_boundaries)
+    count_diff = np.bincount(start_idx, minlength=n_boundaries) - np.bincount(end_idx, minlength=n_boundaries)
+    # Float even when no interval is given, where bincount returns integers
+    rate_sum = np.cumsum(rate_diff, dtype='float64')[:-1]
+    count = np.cumsum(count_diff)[:-1]
+    rate_sum[count == 0] = 0.0
+    return rate_sum, count
+
+
+def cumulative_lookup(boundaries, segment_values, query_times):
+    """Evaluate the running total of per-segment values at arbitrary times (linear within a segment)."""
+    boundaries = np.asarray(boundaries, dtype='int64')
+    if len(boundaries) < 2:
+        return np.zeros(len(query_times))
+    origin = boundaries[0]
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_values)))
+    return np.interp((np.asarray(query_times, dtype='int64') - origin).astype('float64'),
+                     (boundaries - origin).astype('float64'), cumulative)
+
+
+def rolling_sum(values, window):
+    """Trailing-window sum and count of non-NaN values via one prefix sum, O(n) for any window."""
+    values = np.asarray(values, dtype='float64')
+    valid = ~np.isnan(values)
+    prefix_sum = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    prefix_count = np.concatenate(([0], np.cumsum(valid)))
+    lagged = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    return prefix_sum[1:] - prefix_sum[lagged], prefix_count[1:] - prefix_count[lagged]
+
+
+def sliding_extreme(values, window, how='max'):
+    """Trailing-window max/min in O(n) with the van Herk/Gil-Werman block prefix/suffix scheme; NaNs are skipped."""
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    if n == 0:
+        return values.copy()
+    ufunc = np.maximum if how == 'max' else np.minimum
+    fill = -np.inf if how == 'max' else np.inf
+
+    # Left-pad so every output position has a full window, then pad to a whole number of blocks
+    padded = np.concatenate((np.full(window - 1, fill), np.where(np.isnan(values), fill, values)))
+    n_blocks = -(-len(padded) // window)
+    blocks = np.concatenate((padded, np.full(n_blocks * window - len(padded), fill))).reshape(n_blocks, window)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    starts = np.arange(n)
+    result = ufunc(suffix[starts], prefix[starts + window - 1])
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+def resolve_additive_intervals(starts, ends, values):
+    """Make additive intervals non-overlapping so every instant is counted once.
+
+    Identical (start, end) intervals are kept once. Remaining overlaps go to the interval that
+    started first: later intervals are trimmed to start where the earlier ones end and their
+    value is scaled by the fraction of their duration that is kept. Returns sorted arrays.
+    """
+    starts = np.asarray(starts, dtype='int64')
+    # Instantaneous points are given a 1 ns extent so their value is kept
+    ends = np.maximum(np.asarray(ends, dtype='int64'), starts + 1)
+    values = np.asarray(values, dtype='float64')
+    if len(starts) == 0:
+        return starts, ends, values
+
+    order = np.lexsort((ends, starts))
+    starts, ends, values = starts[order], ends[order], values[order]
+    repeated = np.concatenate(([False], (starts[1:] == starts[:-1]) & (ends[1:] == ends[:-1])))
+    starts, ends, values = starts[~repeated], ends[~repeated], values[~repeated]
+
+    previous_end = np.concatenate(([np.iinfo('int64').min], np.maximum.accumulate(ends)[:-1]))
+    clipped_starts = np.maximum(starts, previous_end)
+    kept = ends > clipped_starts
+    scaled = values * (ends - clipped_starts) / (ends - starts)
+    return clipped_starts[kept], ends[kept], scaled[kept]
+
+
+def daily_additive_totals(starts, ends, values, day_starts, day_ns=24 * 60 * 60 * 10**9):
+    """Sum additive interval values per day; an interval crossing midnight is split in proportion to time."""
+    starts, ends, values = resolve_additive_intervals(starts, ends, values)
+    day_starts = np.asarray(day_starts, dtype='int64')
+    if len(starts) == 0:
+        return np.zeros(len(day_starts)), np.zeros(len(day_starts), dtype=bool)
+
+    # Non-overlapping intervals interleaved with the gaps between them form one running total
+    knots = np.empty(2 * len(starts), dtype='int64')
+    knots[0::2], knots[1::2] = starts, ends
+    segment_values = np.zeros(len(knots) - 1)
+    segment_values[0::2] = values
+
+    totals = cumulative_lookup(knots, segment_values, day_starts + day_ns) - cumulative_lookup(knots, segment_values, day_starts)
+    has_data = interval_overlap_mask(day_starts, day_starts + day_ns - 1, starts, ends - 1)
+    return totals, has_data
+
+
+def group_quantile(codes, values, n_groups, q):
+    """Linearly interpolated quantile q (0..1) of values per integer group code; empty groups are NaN."""
+    codes = np.asarray(codes, dtype='int64')
+    values = np.asarray(values, dtype='float64')
+    valid = (codes >= 0) & (codes < n_groups) & ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+
+    result = np.full(n_groups, np.nan)
+    if len(codes) == 0:
+        return result
+
+    # Sorted by group, then by value inside the group, so each group's order statistics are contiguous
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    group_starts = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1))
+    counts = np.diff(np.concatenate((group_starts, [len(codes)])))
+
+    position = group_starts + q * (counts - 1)
+    lower = np.floor(position).astype('int64')
+    upper = np.minimum(lower + 1, group_starts + counts - 1)
+    result[codes[group_starts]] = values[lower] + (position - lower) * (values[upper] - values[lower])
+    return result
+
+
+def time_window_sums(times_ns, values, window_ns):
+    """Sum and count of values in [t, t + window) starting at every sample; times must be sorted.
+
+    The window end of every sample is found with one searchsorted, and sums come from a prefix sum.
+    """
+    times_ns = np.asarray(times_ns, dtype='int64')
+    values = np.asarray(values, dtype='float64')
+    window_end = np.searchsorted(times_ns, times_ns + window_ns, side='left')
+    present = ~np.isnan(values)
+    prefix_sum = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    prefix_count = np.concatenate(([0], np.cumsum(present)))
+    positions = np.arange(len(times_ns))
+    return prefix_sum[window_end] - prefix_sum[positions], prefix_count[window_end] - prefix_count[positions]
+
+
+def nearest_lookup(times_ns, values, query_ns, tolerance_ns):
+    """Value of the sample nearest to each query time (sorted times), NaN when none is within tolerance."""
+    times_ns = np.asarray(times_ns, dtype='int64')
+    values = np.asarray(values, dtype='float64')
+    query_ns = np.asarray(query_ns, dtype='int64')
+    result = np.full(query_ns.shape, np.nan)
+    if len(times_ns) == 0:
+        return result
+
+    right = np.clip(np.searchsorted(times_ns, query_ns, side='left'), 0, len(times_ns) - 1)
+    left = np.clip(right - 1, 0, len(times_ns) - 1)
+    nearest = np.where(np.abs(times_ns[left] - query_ns) <= np.abs(times_ns[right] - query_ns), left, right)
+    within = np.abs(times_ns[nearest] - query_ns) <= tolerance_ns
+    result[within] = values[nearest[within]]
+    return result
@@ -0,0 +1,175 @@
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_distances(lat, lon):
+    """Great-circle distance in meters between consecutive (lat, lon) points; one shorter than the input."""
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    lon = np.radians(np.asarray(lon, dtype='float64'))
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def local_meters(lat, lon, alt=None):
+    """(n, 2) or (n, 3) points in meters on an equirectangular plane around the first point.
+
+    Accurate to well under a meter over the extent of a workout, which is all the simplification needs.
+    """
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    scale = np.radians(EARTH_RADIUS_M)
+    columns = [(lon - lon[0]) * scale * np.cos(np.radians(lat[0])), (lat - lat[0]) * scale]
+    if alt is not None:
+        columns.append(np.asarray(alt, dtype='float64'))
+    return np.column_stack(columns)
+
+
+def douglas_peucker(points, epsilon):
+    """Mask of the points Douglas-Peucker keeps so no dropped point is further than epsilon from the simplified line.
+
+    Iterative, with one vectorized distance computation over the interior points of each segment
+    it splits; the first and last points are always kept.
+    """
+    points = np.asarray(points, dtype='float64')
+    keep = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return keep
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chord = points[last] - points[first]
+        interior = points[first + 1:last] - points[first]
+        chord_sq = chord @ chord
+        # Distance to the chord segment (not the infinite line), so out-and-back routes keep their turn
+        along = np.clip(interior @ chord / chord_sq, 0.0, 1.0) if chord_sq > 0 else np.zeros(len(interior))
+        distances = np.sqrt(((interior - along[:, None] * chord) ** 2).sum(axis=1))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > epsilon:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend(((first, split), (split, last)))
+    return keep
+
+
+class CompactRoute:
+    """A workout route simplified with Douglas-Peucker and stored as delta-encoded integers.
+
+    Kept points are quantized (microdegrees, decimeters, milliseconds) and stored as differences
+    from the previous point, which are small and compress well; the first value of each field is
+    absolute (time relative to start_ns). Cumulative distance is carried from the full-rate track,
+    so distance and splits are exact at the kept points rather than measured along the shortened line.
+    """
+
+    # field -> multiplier to its integer unit
+    SCALES = {'time': 1000, 'lat': 10**6, 'lon': 10**6, 'distance': 10, 'alt': 10}
+    HEADER = struct.Struct('<4sBIIq')
+    MAGIC = b'FHRT'
+
+    def __init__(self, start_ns, deltas, raw_points):
+        self.start_ns = int(start_ns)
+        self.deltas = deltas
+        self.raw_points = int(raw_points)
+
+    @classmethod
+    def encode(cls, times, lat, lon, alt=None, distance=None, epsilon_meters=5.0):
+        """Simplify and encode one track; points without a position are left out.
+
+        times are UTC timestamps; distance, when given, is the track's cumulative distance in meters
+        (TCX DistanceMeters), otherwise it is measured point to point before simplification.
+        """
+        times = pd.to_datetime(pd.Series(times), utc=True).to_numpy(dtype='datetime64[ns]').view('int64')
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        located = ~(np.isnan(lat) | np.isnan(lon))
+        times, lat, lon = times[located], lat[located], lon[located]
+        if len(times) == 0:
+            return cls(0, {name: np.empty(0, dtype='int32') for name in ('time', 'lat', 'lon', 'distance')}, 0)
+
+        if distance is None or np.isnan(np.asarray(distance, dtype='float64')[located]).all():
+            distance = np.concatenate(([0.0], np.cumsum(haversine_distances(lat, lon))))
+        else:
+            distance = pd.Series(np.asarray(distance, dtype='float64')[located]).ffill().fillna(0).to_numpy()
+        if alt is not None:
+            alt = pd.Series(np.asarray(alt, dtype='float64')[located]).ffill().bfill().to_numpy()
+            if np.isnan(alt).all():
+                alt = None
+
+        keep = douglas_peucker(local_meters(lat, lon, alt), epsilon_meters)
+        fields = {'time': (times[keep] - times[0]) / 10**9, 'lat': lat[keep], 'lon': lon[keep], 'distance': distance[keep]}
+        if alt is not None:
+            fields['alt'] = alt[keep]
+        # Quantized first, then differenced, so decoding never accumulates rounding error
+        deltas = {name: np.diff(np.round(values * cls.SCALES[name]).astype('int64'), prepend=0).astype('int32')
+                  for name, values in fields.items()}
+        return cls(times[0], deltas, len(times))
+
+    @property
+    def kept_points(self):
+        return len(self.deltas['time'])
+
+    def decode(self):
+        """Float arrays of the kept points: time (UTC datetime64), lat, lon, distance and, if recorded, alt."""
+        values = {name: np.cumsum(deltas, dtype='int64') / self.SCALES[name] for name, deltas in self.deltas.items()}
+        values['time'] = (self.start_ns + np.round(values['time'] * 10**9).astype('int64')).astype('datetime64[ns]')
+        return values
+
+    def to_bytes(self):
+        has_alt = 'alt' in self.deltas
+        header = self.HEADER.pack(self.MAGIC, int(has_alt), self.kept_points, self.raw_points, self.start_ns)
+        names = ('time', 'lat', 'lon', 'distance') + (('alt',) if has_alt else ())
+        return header + zlib.compress(np.concatenate([self.deltas[name] for name in names]).astype('<i4').tobytes())
+
+    @classmethod
+    def from_bytes(cls, blob):
+        magic, has_alt, kept, raw_points, start_ns = cls.HEADER.unpack_from(blob)
+        if magic != cls.MAGIC:
+            raise ValueError('Not a compact route')
+        names = ('time', 'lat', 'lon', 'distance') + (('alt',) if has_alt else ())
+        values = np.frombuffer(zlib.decompress(blob[cls.HEADER.size:]), dtype='<i4')
+        return cls(start_ns, {name: values[position * kept:(position + 1) * kept] for position, name in enumerate(names)}, raw_points)
+
+    def distance(self):
+        """Total distance in meters."""
+        return float(np.sum(self.deltas['distance'][1:], dtype='int64') / self.SCALES['distance']) if self.kept_points else 0.0
+
+    def duration(self):
+        """Seconds from the first to the last point."""
+        return float(np.sum(self.deltas['time'][1:], dtype='int64') / self.SCALES['time']) if self.kept_points else 0.0
+
+    def elevation(self):
+        """(gain, loss) in meters over the kept points; climbs shorter than the error bound are smoothed out."""
+        if 'alt' not in self.deltas or self.kept_points < 2:
+            return 0.0, 0.0
+        steps = self.deltas['alt'][1:] / self.SCALES['alt']
+        return float(steps[steps > 0].sum()), float(-steps[steps < 0].sum())
+
+    def splits(self, split_meters=1000):
+        """One row per split: split number, distance, seconds and elevation gain; the last split may be shorter."""
+        columns = ['split', 'distance', 'seconds', 'elevationGain']
+        total = self.distance()
+        if self.kept_points < 2 or total <= 0:
+            return pd.DataFrame(columns=columns)
+        values = self.decode()
+        seconds = (values['time'] - values['time'][0]) / np.timedelta64(1, 's')
+        covered = values['distance'] - values['distance'][0]
+        marks = np.append(np.arange(0.0, total, split_meters), total)
+        # Times and climbing at the split marks, interpolated along cumulative distance
+        mark_seconds = np.interp(marks, covered, seconds)
+        if 'alt' in values:
+            climbed = np.concatenate(([0.0], np.cumsum(np.maximum(np.diff(values['alt']), 0))))
+            mark_climbed = np.interp(marks, covered, climbed)
+        else:
+            mark_climbed = np.zeros(len(marks))
+        return pd.DataFrame({
+            'split': np.arange(1, len(marks)),
+            'distance': np.diff(marks).round(1),
+            'seconds': np.diff(mark_seconds).round(1),
+            'elevationGain': np.diff(mark_climbed).round(1),
+        })
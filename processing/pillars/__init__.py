@@ -0,0 +1,5 @@
+from processing.pillars.registry import STAGE_REGISTRY, lazy_exports, load_class, pillar_names, pillar_stages, stage_class
+
+# Pillar classes are imported on first use, so `from processing.pillars import AStepCountAgg` loads only that pillar
+__getattr__, __dir__, _exported = lazy_exports(__name__)
+__all__ = ['STAGE_REGISTRY', 'load_class', 'pillar_names', 'pillar_stages', 'stage_class'] + _exported
@@ -0,0 +1,42 @@
+import pandas as pd
+from datetime import datetime
+
+from processing.kernels.dailyTotals import additive_daily_totals
+from processing.pillars.activity.dataStream.a_activityCalories import AActivityCalories
+from processing.rollup.dailyRollup import lookup_rollup
+
+class AActivityCaloriesAgg:
+    def __init__(self, googleFit_df, *args, rollup_store=None):
+        self.googleFit_df = googleFit_df
+        self.valueType = 'TotalActivityCalories'
+        self.s_name = 'A_ActivityCalories'
+
+        # Answer from the precomputed daily rollup when it covers the whole window
+        self.rollup_df = lookup_rollup(rollup_store, self.googleFit_df, self.s_name, *args)
+        if self.rollup_df is not None:
+            return
+
+        self.processor = AActivityCalories(self.googleFit_df, *args)
+        self.activity_calories_df = self.processor.process().rename(columns={'fit_value': 'value', 'dataTypeName': 'type'})
+        self.type = self.activity_calories_df['type'].iloc[0] if not self.activity_calories_df.empty else 'com.google.calories.expended'
+
+    def process(self):
+        if self.rollup_df is not None:
+            return self.rollup_df.copy()
+
+        # Same additive kernel as steps and distance: overlapping activity intervals are counted once
+        self.activity_calories_df = additive_daily_totals(self.activity_calories_df, 'value')
+
+        # Add additional columns and metadata
+        self.activity_calories_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.activity_calories_df['value'] = self.activity_calories_df['value'].round(1)
+        self.activity_calories_df['type'] = self.type
+        self.activity_calories_df['unit'] = self.processor.unit
+        self.activity_calories_df['valueType'] = self.valueType
+        self.activity_calories_df['s_name'] = self.s_name
+
+        # Reorder columns and sort by date
+        self.activity_calories_df = self.activity_calories_df[['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']]
+        self.activity_calories_df = self.activity_calories_df.sort_values(by=['date'], ascending=False).reset_index(drop=True)
+
+        return self.activity_calories_df
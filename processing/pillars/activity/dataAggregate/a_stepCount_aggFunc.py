@@ -1,33 +1,34 @@
 import pandas as pd
-from processing.pillars.activity.dataStream.a_stepCount import *
+from datetime import datetime
+
+from processing.kernels.dailyTotals import additive_daily_totals
+from processing.pillars.activity.dataStream.a_stepCount import AStepCount
+from processing.rollup.dailyRollup import lookup_rollup
 
 class AStepCountAgg:
-    def __init__(self, googleFit_df, *args):
+    def __init__(self, googleFit_df, *args, rollup_store=None):
         self.googleFit_df = googleFit_df
-        self.processor = AStepCount(self.googleFit_df, *args)
-        self.step_count_df = self.processor.process()
-        self.type = self.step_count_df['type'].iloc[0]
         self.valueType = 'TotalStepCount'
         self.s_name = 'A_StepCount'
 
-    def process(self):
-        # Check for duplicate columns and rows
-        self.step_count_df = self.step_count_df.loc[:, ~self.step_count_df.columns.duplicated()]
-        self.step_count_df = self.step_count_df.drop_duplicates()
-
-        # Convert 'value' column to numeric and date columns to datetime
-        self.step_count_df['value'] = pd.to_numeric(self.step_count_df['value'], errors='coerce')
-        self.step_count_df['startDate'] = pd.to_datetime(self.step_count_df['startDate'], errors='coerce').dt.date
-        self.step_count_df['endDate'] = pd.to_datetime(self.step_count_df['endDate'], errors='coerce').dt.date
+        # Answer from the precomputed daily rollup when it covers the whole window
+        self.rollup_df = lookup_rollup(rollup_store, self.googleFit_df, self.s_name, *args)
+        if self.rollup_df is not None:
+            return
 
-        # Set the date column
-        self.step_count_df['date'] = self.step_count_df['startDate']
-
-        # Aggregate data by userName, date, startDate, endDate, and unit
-        self.step_count_df = self.step_count_df.groupby(['userName', 'date', 'startDate', 'endDate', 'unit']).agg({'value': 'sum'}).reset_index()
+        self.processor = AStepCount(self.googleFit_df, *args)
+        self.step_count_df = self.processor.process().rename(columns={'fit_value': 'value', 'dataTypeName': 'type'})
+        self.type = self.step_count_df['type'].iloc[0] if not self.step_count_df.empty else 'com.google.step_count.delta'
 
-        # Keep rows with the maximum value for each date
-        self.step_count_df = self.step_count_df.loc[self.step_count_df.groupby('date')['value'].idxmax()]
+    def process(self):
+        if self.rollup_df is not None:
+            return self.rollup_df.copy()
+
+        # Daily totals over deduplicated, non-overlapping intervals; intervals crossing
+        # midnight are split between the two days in proportion to time
+        unit = self.processor.unit
+        self.step_count_df = additive_daily_totals(self.step_count_df, 'value')
+        self.step_count_df['unit'] = unit
 
         # Add additional columns and metadata
         self.step_count_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
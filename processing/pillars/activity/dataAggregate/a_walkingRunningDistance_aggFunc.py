@@ -1,31 +1,34 @@
 import pandas as pd
-from processing.pillars.activity.dataStream.a_walkingRunningDistance import *
+from datetime import datetime
+
+from processing.kernels.dailyTotals import additive_daily_totals
+from processing.pillars.activity.dataStream.a_walkingRunningDistance import AWalkingRunningDistance
+from processing.rollup.dailyRollup import lookup_rollup
 
 class AWalkingRunningDistanceAgg:
-    def __init__(self, googleFit_df, *args):
+    def __init__(self, googleFit_df, *args, rollup_store=None):
         self.googleFit_df = googleFit_df
-        self.processor = AWalkingRunningDistance(self.googleFit_df, *args)
-        self.walking_running_distance_df = self.processor.process()
-        self.type = self.walking_running_distance_df['type'].iloc[0]
         self.valueType = 'TotalWalkingRunningDistance'
         self.s_name = 'A_WalkingRunningDistance'
 
-    def process(self):
-        # Check for duplicate columns and rows
-        self.walking_running_distance_df = self.walking_running_distance_df.loc[:, ~self.walking_running_distance_df.columns.duplicated()]
-        self.walking_running_distance_df = self.walking_running_distance_df.drop_duplicates()
-
-        # Convert 'value' column to numeric and date columns to datetime
-        self.walking_running_distance_df['value'] = pd.to_numeric(self.walking_running_distance_df['value'], errors='coerce')
-        self.walking_running_distance_df['startDate'] = pd.to_datetime(self.walking_running_distance_df['startDate'], errors='coerce').dt.date
-        self.walking_running_distance_df['endDate'] = pd.to_datetime(self.walking_running_distance_df['endDate'], errors='coerce').dt.date
+        # Answer from the precomputed daily rollup when it covers the whole window
+        self.rollup_df = lookup_rollup(rollup_store, self.googleFit_df, self.s_name, *args)
+        if self.rollup_df is not None:
+            return
 
-        # Set 'date' column to 'startDate' and group by relevant columns
-        self.walking_running_distance_df['date'] = self.walking_running_distance_df['startDate']
-        self.walking_running_distance_df = self.walking_running_distance_df.groupby(['userName', 'date', 'startDate', 'endDate', 'unit']).agg({'value': 'sum'}).reset_index()
+        self.processor = AWalkingRunningDistance(self.googleFit_df, *args)
+        self.walking_running_distance_df = self.processor.process().rename(columns={'fit_value': 'value', 'dataTypeName': 'type'})
+        self.type = self.walking_running_distance_df['type'].iloc[0] if not self.walking_running_distance_df.empty else 'com.google.distance.delta'
 
-        # Keep rows with the maximum value for each date
-        self.walking_running_distance_df = self.walking_running_distance_df.loc[self.walking_running_distance_df.groupby('date')['value'].idxmax()]
+    def process(self):
+        if self.rollup_df is not None:
+            return self.rollup_df.copy()
+
+        # Daily totals over deduplicated, non-overlapping intervals; intervals crossing
+        # midnight are split between the two days in proportion to time
+        unit = self.processor.unit
+        self.walking_running_distance_df = additive_daily_totals(self.walking_running_distance_df, 'value')
+        self.walking_running_distance_df['unit'] = unit
 
         # Add additional columns and metadata
         self.walking_running_distance_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
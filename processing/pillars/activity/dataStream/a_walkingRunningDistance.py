@@ -1,18 +1,27 @@
 import pandas as pd
 from datetime import datetime, timedelta
 
+from data_source.parseData.bronzeContract import day_window, is_conforming
+from processing.pillars.dataSources import DISTANCE_SOURCE
+
 class AWalkingRunningDistance:
     def __init__(self, googleFit_df, *args):
         # Filter for step count records using the specified identifier
-        self.records_df = googleFit_df[googleFit_df['data_source'] == 'derived:com.google.distance.delta:com.google.android.gms:merge_distance_delta'].copy()
-        self.records_df['fit_value'] = pd.to_numeric(self.records_df['fit_value'], errors='coerce')
-        self.records_df.dropna(subset=['fit_value'], inplace=True)
+        records_df = googleFit_df[googleFit_df['data_source'] == DISTANCE_SOURCE]
+        self.conforming = is_conforming(records_df)
+        if self.conforming:
+            # Validated at ingest (see bronzeContract): already typed, so no copy or coercion
+            self.records_df = records_df[records_df['fit_value'].notna()]
+        else:
+            self.records_df = records_df.copy()
+            self.records_df['fit_value'] = pd.to_numeric(self.records_df['fit_value'], errors='coerce')
+            self.records_df.dropna(subset=['fit_value'], inplace=True)
         self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         self.unit = 'km'
 
         # Initialize filtered_records_df based on input arguments
         if len(args) == 1 and isinstance(args[0], list):
-            dates_list = [pd.to_datetime(date).tz_localize(None) for date in args[0]]
+            dates_list = list(dict.fromkeys(pd.to_datetime(date).tz_localize(None).normalize() for date in args[0]))
             self.filtered_records_df = self._filter_by_dates_list(dates_list)
         elif len(args) == 1:
             start_date = pd.to_datetime(args[0]).tz_localize(None)
@@ -45,13 +54,18 @@ class AWalkingRunningDistance:
         return self._filter_data(start_date, end_date)
 
     def _filter_by_dates_list(self, dates_list):
-        filtered_df = pd.concat([self._filter_data(date) for date in dates_list]).drop_duplicates().reset_index(drop=True)
+        filtered_df = pd.concat([self._filter_data(date) for date in dates_list]).reset_index(drop=True)
         return filtered_df
 
     def _filter_data(self, start_date, end_date=None):
         if self.records_df.empty:
             return pd.DataFrame(columns=self.records_df.columns)
 
+        if self.conforming:
+            # Typed and sorted by startDate at ingest, so the window is a binary-search slice with no conversion
+            end_of_day = (end_date or start_date).replace(hour=23, minute=59, second=59, microsecond=999999)
+            return day_window(self.records_df, start_date.replace(hour=0, minute=0, second=0, microsecond=0), end_of_day)
+
         df = self.records_df.copy()
         df['startDate'] = pd.to_datetime(df['startDate']).dt.tz_localize(None)
         df['endDate'] = pd.to_datetime(df['endDate']).dt.tz_localize(None)
@@ -0,0 +1,3 @@
+from processing.pillars.registry import lazy_exports
+
+__getattr__, __dir__, __all__ = lazy_exports(__name__, 'body')
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from processing.pillars.dataSources import BMR_SOURCE, CALORIES_SOURCE, HEIGHT_SOURCE, WEIGHT_SOURCE
+from processing.rollup.dailyRollup import window_dates
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+# data source -> column it fills on each interval
+BODY_METRICS = {
+    WEIGHT_SOURCE: 'weightKg',
+    HEIGHT_SOURCE: 'heightM',
+    BMR_SOURCE: 'bmrKcalPerDay',
+}
+# A measurement is carried forward for at most this long; the registry pads the window by the same amount
+MAX_METRIC_AGE = pd.Timedelta(days=365)
+
+
+def body_metrics_timeline(googleFit_df):
+    """One row per user and measurement time with the latest known weight, height and BMR, sorted by startDate.
+
+    Measurements of different metrics rarely share a timestamp, so each metric is carried forward
+    per user; a later as-of lookup then needs only one row per point in time.
+    """
+    metrics_df = googleFit_df[googleFit_df['data_source'].isin(list(BODY_METRICS))]
+    columns = list(BODY_METRICS.values())
+    if metrics_df.empty:
+        return pd.DataFrame({'userName': pd.Series(dtype='object'), 'startDate': pd.Series(dtype='datetime64[ns]'),
+                             **{column: pd.Series(dtype='float64') for column in columns}})
+
+    long_df = pd.DataFrame({
+        'userName': metrics_df['userName'].to_numpy(),
+        'startDate': pd.to_datetime(metrics_df['startDate']).to_numpy(dtype='datetime64[ns]'),
+        'metric': metrics_df['data_source'].map(BODY_METRICS).to_numpy(),
+        'value': pd.to_numeric(metrics_df['fit_value'], errors='coerce').to_numpy(dtype='float64'),
+    }).dropna(subset=['value'])
+    # The last value reported at a timestamp wins, as it would in a per-row lookup
+    wide_df = long_df.pivot_table(index=['userName', 'startDate'], columns='metric', values='value', aggfunc='last')
+    wide_df = wide_df.reindex(columns=columns).sort_index()
+    wide_df = wide_df.groupby(level='userName').ffill().reset_index()
+    return wide_df.sort_values('startDate', kind='stable', ignore_index=True)
+
+
+def attach_body_metrics(intervals_df, timeline_df, on='startDate'):
+    """Attach the latest weight, height and BMR known at each interval's `on` time, per userName.
+
+    A backward as-of join (pandas merge_asof semantics, with MAX_METRIC_AGE as tolerance) done as one
+    binary search per user over that user's timeline, so the intervals are never sorted and keep their
+    order. Works for calorie records and for workouts alike, as long as both carry userName and a
+    local `on` time.
+    """
+    columns = list(BODY_METRICS.values())
+    attached = {column: np.full(len(intervals_df), np.nan) for column in columns}
+    if intervals_df.empty or timeline_df.empty:
+        return intervals_df.assign(**attached).reset_index(drop=True)
+
+    times = pd.to_datetime(intervals_df[on]).dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view('int64')
+    user_codes, user_names = pd.factorize(intervals_df['userName'])
+    # Row positions grouped by user with one stable sort, instead of one mask per user
+    user_rows = np.split(np.argsort(user_codes, kind='stable'), np.cumsum(np.bincount(user_codes, minlength=len(user_names)))[:-1])
+    timelines = dict(tuple(timeline_df.groupby('userName', sort=False)))
+    for user_name, rows in zip(user_names, user_rows):
+        if user_name not in timelines:
+            continue
+        user_timeline = timelines[user_name]
+        metric_times = user_timeline['startDate'].to_numpy(dtype='datetime64[ns]').view('int64')
+        # Last measurement at or before each interval, if it is recent enough
+        position = np.searchsorted(metric_times, times[rows], side='right') - 1
+        found = position >= 0
+        found[found] &= times[rows][found] - metric_times[position[found]] <= MAX_METRIC_AGE.value
+        for column in columns:
+            attached[column][rows[found]] = user_timeline[column].to_numpy(dtype='float64')[position[found]]
+    return intervals_df.assign(**attached).reset_index(drop=True)
+
+
+class BBodyMetrics:
+    """Calorie intervals of the requested window with the body metrics known when each one started.
+
+    Besides the raw weight, height and BMR it derives the BMR energy due over the interval and the
+    interval's energy per kilogram of body weight.
+    """
+
+    OUTPUT_COLUMNS = ['userName', 'valueGeneratedAt', 'dataTypeName', 'originDataSourceId', 'data_source', 'modifiedTime',
+                      'startDate', 'endDate', 'unit', 'fit_value', 'weightKg', 'heightM', 'bmrKcalPerDay', 'bmrCalories',
+                      'caloriesPerKg']
+
+    def __init__(self, googleFit_df, *args):
+        self.unit = 'kcal'
+        self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Measurements are read from the whole frame, since the latest one may predate the window
+        self.timeline_df = body_metrics_timeline(googleFit_df)
+
+        records_df = googleFit_df[googleFit_df['data_source'] == CALORIES_SOURCE]
+        self.filtered_records_df = self._filter_days(records_df, window_dates(*args)) if args else records_df.reset_index(drop=True)
+        if self.filtered_records_df.empty:
+            self._handle_empty_records()
+
+    def _filter_days(self, df, days):
+        # Records starting on a requested day and ending by its end, as in the other pillars
+        if df.empty:
+            return df.reset_index(drop=True)
+        starts = pd.to_datetime(df['startDate']).dt.tz_localize(None)
+        ends = pd.to_datetime(df['endDate']).dt.tz_localize(None)
+        day_starts = starts.dt.normalize()
+        keep = day_starts.isin([pd.Timestamp(day) for day in days]) & (ends < day_starts + pd.Timedelta(days=1))
+        return df[keep].reset_index(drop=True)
+
+    def _handle_empty_records(self):
+        print(f'No data available for the given input.')
+
+    def process(self):
+        if self.filtered_records_df.empty:
+            return pd.DataFrame(columns=self.OUTPUT_COLUMNS)
+
+        body_df = attach_body_metrics(self.filtered_records_df, self.timeline_df)
+        body_df['unit'] = self.unit
+        body_df['valueGeneratedAt'] = self.value_generated_at
+        fit_value = pd.to_numeric(body_df['fit_value'], errors='coerce')
+        duration_ns = (pd.to_datetime(body_df['endDate']) - pd.to_datetime(body_df['startDate'])).dt.total_seconds() * 10**9
+        body_df['bmrCalories'] = body_df['bmrKcalPerDay'] * duration_ns / DAY_NS
+        body_df['caloriesPerKg'] = fit_value / body_df['weightKg']
+        return body_df[self.OUTPUT_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,15 @@
+# Google Fit Takeout data sources read by the pillars; each All Data file holds exactly one of them
+HR_SOURCE = 'derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm'
+SLEEP_SOURCE = 'derived:com.google.sleep.segment:com.google.android.gms:merged'
+CALORIES_SOURCE = 'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended'
+ACTIVE_MINUTES_SOURCE = 'derived:com.google.active_minutes:com.google.android.gms:merge_active_minutes'
+STEP_COUNT_SOURCE = 'derived:com.google.step_count.delta:com.google.android.gms:estimated_steps'
+DISTANCE_SOURCE = 'derived:com.google.distance.delta:com.google.android.gms:merge_distance_delta'
+ACTIVITY_SEGMENT_SOURCE = 'derived:com.google.activity.segment:com.google.android.gms:merge_activity_segments'
+WEIGHT_SOURCE = 'derived:com.google.weight:com.google.android.gms:merge_weight'
+HEIGHT_SOURCE = 'derived:com.google.height:com.google.android.gms:merge_height'
+BMR_SOURCE = 'derived:com.google.calories.bmr:com.google.android.gms:merged'
+
+# Columns of the bronze All Data frame the pillars use (the bronze contract columns plus userName)
+ALL_DATA_COLUMNS = ('userName', 'startDate', 'endDate', 'modifiedTime', 'startTimeNanos', 'endTimeNanos',
+                    'fit_value', 'dataTypeName', 'originDataSourceId', 'data_source')
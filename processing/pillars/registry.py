@@ -0,0 +1,200 @@
+import sys
+from importlib import import_module
+
+from processing.pillars.dataSources import (ACTIVE_MINUTES_SOURCE, ALL_DATA_COLUMNS, BMR_SOURCE, CALORIES_SOURCE, DISTANCE_SOURCE,
+                                            HEIGHT_SOURCE, HR_SOURCE, SLEEP_SOURCE, STEP_COUNT_SOURCE, WEIGHT_SOURCE)
+
+# stage -> pillar, stream class path, aggregate class path (None when the stream is the output), input frame and
+# what the stage reads from it: data_sources (None for every row), columns (None for every column) and
+# padding_days, the days before and after the requested window its stream looks at.
+# Paths are plain strings, so reading the registry imports no pillar module.
+STAGE_REGISTRY = {
+    'V_HR': {
+        'pillar': 'vitality',
+        'stream': 'processing.pillars.vitality.dataStream.v_hr_types:VHeartRate',
+        'aggregate': 'processing.pillars.vitality.dataAggregate.v_hr_aggFunc:VHRagg',
+        'source': 'allData',
+        'data_sources': [HR_SOURCE, SLEEP_SOURCE, CALORIES_SOURCE, ACTIVE_MINUTES_SOURCE, STEP_COUNT_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'V_TotalCalories': {
+        'pillar': 'vitality',
+        'stream': 'processing.pillars.vitality.dataStream.v_totalCaloriesBurned:VTotalCalories',
+        'aggregate': None,
+        'source': 'allData',
+        'data_sources': [CALORIES_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'A_StepCount': {
+        'pillar': 'activity',
+        'stream': 'processing.pillars.activity.dataStream.a_stepCount:AStepCount',
+        'aggregate': 'processing.pillars.activity.dataAggregate.a_stepCount_aggFunc:AStepCountAgg',
+        'source': 'allData',
+        'data_sources': [STEP_COUNT_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'A_WalkingRunningDistance': {
+        'pillar': 'activity',
+        'stream': 'processing.pillars.activity.dataStream.a_walkingRunningDistance:AWalkingRunningDistance',
+        'aggregate': 'processing.pillars.activity.dataAggregate.a_walkingRunningDistance_aggFunc:AWalkingRunningDistanceAgg',
+        'source': 'allData',
+        'data_sources': [DISTANCE_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'A_ActivityCalories': {
+        'pillar': 'activity',
+        'stream': 'processing.pillars.activity.dataStream.a_activityCalories:AActivityCalories',
+        'aggregate': 'processing.pillars.activity.dataAggregate.a_activityCalories_aggFunc:AActivityCaloriesAgg',
+        'source': 'allData',
+        'data_sources': [CALORIES_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'S_SleepType': {
+        'pillar': 'sleep',
+        'stream': 'processing.pillars.sleep.dataStream.s_typeSleep:SSleepType',
+        'aggregate': 'processing.pillars.sleep.dataAggregate.s_typeSleep_aggFunc:SSleepTypeAgg',
+        'source': 'allData',
+        'data_sources': [SLEEP_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        'padding_days': (0, 0),
+    },
+    'B_BodyMetrics': {
+        'pillar': 'body',
+        'stream': 'processing.pillars.body.dataStream.b_bodyMetrics:BBodyMetrics',
+        'aggregate': None,
+        'source': 'allData',
+        'data_sources': [CALORIES_SOURCE, WEIGHT_SOURCE, HEIGHT_SOURCE, BMR_SOURCE],
+        'columns': ALL_DATA_COLUMNS,
+        # Body metrics are carried forward for up to a year (b_bodyMetrics.MAX_METRIC_AGE)
+        'padding_days': (365, 0),
+    },
+    'W_Duration': {
+        'pillar': 'workout',
+        'stream': 'processing.pillars.workout.dataStream.w_typeDuration:WDuration',
+        'aggregate': None,
+        'source': 'activitiesData',
+        'data_sources': None,
+        'columns': None,
+        'padding_days': (0, 0),
+    },
+    'W_Calories': {
+        'pillar': 'workout',
+        'stream': 'processing.pillars.workout.dataStream.w_typeCaloriesBurned:WCalories',
+        'aggregate': None,
+        'source': 'activitiesData',
+        'data_sources': None,
+        'columns': None,
+        'padding_days': (0, 0),
+    },
+    'W_HeartRate': {
+        'pillar': 'workout',
+        'stream': 'processing.pillars.workout.dataStream.w_typeHeartRate:WHeartRate',
+        'aggregate': None,
+        'source': 'activitiesData',
+        'data_sources': None,
+        'columns': None,
+        'padding_days': (0, 0),
+    },
+    'W_Route': {
+        'pillar': 'workout',
+        'stream': 'processing.pillars.workout.dataStream.w_typeRoute:WRoute',
+        'aggregate': None,
+        'source': 'activitiesData',
+        'data_sources': None,
+        'columns': None,
+        'padding_days': (0, 0),
+    },
+}
+
+# Public classes outside the stage table that the pillar packages also export
+EXTRA_EXPORTS = {
+    'VCalorieTimeline': 'processing.pillars.vitality.dataStream.v_calorieTimeline:VCalorieTimeline',
+}
+
+
+def load_class(class_path):
+    """Import 'package.module:ClassName' and return the class; only that module and its imports are loaded."""
+    module_name, class_name = class_path.split(':')
+    return getattr(import_module(module_name), class_name)
+
+
+def pillar_names():
+    return list(dict.fromkeys(entry['pillar'] for entry in STAGE_REGISTRY.values()))
+
+
+def pillar_stages(pillar):
+    """{s_name: registry entry} for one pillar, in run order."""
+    stages = {s_name: entry for s_name, entry in STAGE_REGISTRY.items() if entry['pillar'] == pillar}
+    if not stages:
+        raise KeyError(f"Unknown pillar: {pillar}")
+    return stages
+
+
+def stage_class(s_name):
+    """The class that produces a stage's output: its aggregate when it has one, else its stream."""
+    entry = STAGE_REGISTRY[s_name]
+    return load_class(entry['aggregate'] or entry['stream'])
+
+
+def required_inputs(s_names):
+    """What a set of stages reads, per input frame: the union of their data sources and columns and the widest padding.
+
+    data_sources or columns is None when any of the stages reads every row or column of that frame.
+    """
+    inputs = {}
+    for s_name in s_names:
+        entry = STAGE_REGISTRY[s_name]
+        needs = inputs.setdefault(entry['source'], {'data_sources': set(), 'columns': [], 'padding_days': (0, 0)})
+        for key in ('data_sources', 'columns'):
+            if needs[key] is None or entry[key] is None:
+                needs[key] = None
+            elif key == 'data_sources':
+                needs[key].update(entry[key])
+            else:
+                needs[key].extend(column for column in entry[key] if column not in needs[key])
+        needs['padding_days'] = tuple(max(pair) for pair in zip(needs['padding_days'], entry['padding_days']))
+    return inputs
+
+
+def pillar_stage_names(pillars=None):
+    """Stage names of the given pillars (every pillar when None), in run order."""
+    return [s_name for s_name, entry in STAGE_REGISTRY.items() if pillars is None or entry['pillar'] in pillars]
+
+
+def class_paths(pillar=None):
+    """{ClassName: class path} of every exported class, optionally only one pillar's."""
+    paths = {}
+    for entry in STAGE_REGISTRY.values():
+        if pillar is None or entry['pillar'] == pillar:
+            for class_path in (entry['stream'], entry['aggregate']):
+                if class_path:
+                    paths[class_path.split(':')[1]] = class_path
+    for class_name, class_path in EXTRA_EXPORTS.items():
+        if pillar is None or class_path.startswith(f'processing.pillars.{pillar}.'):
+            paths[class_name] = class_path
+    return paths
+
+
+def lazy_exports(module_name, pillar=None):
+    """Module-level __getattr__, __dir__ and __all__ (PEP 562) for a package exporting pillar classes.
+
+    A class is imported on first access and then cached in the package namespace.
+    """
+    paths = class_paths(pillar)
+
+    def __getattr__(name):
+        if name not in paths:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        cls = load_class(paths[name])
+        setattr(sys.modules[module_name], name, cls)
+        return cls
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module_name])) | set(paths))
+
+    return __getattr__, __dir__, sorted(paths)
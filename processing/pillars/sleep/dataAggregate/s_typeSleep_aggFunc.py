@@ -1,17 +1,29 @@
 import pandas as pd
 from processing.pillars.sleep.dataStream.s_typeSleep import SSleepType
+from processing.rollup.dailyRollup import lookup_rollup
 
 class SSleepTypeAgg:
-    def __init__(self, google_fit_df, *args):
+    def __init__(self, google_fit_df, *args, rollup_store=None):
         self.records_df = google_fit_df
-        self.processor = SSleepType(self.records_df, *args)
-        self.sleep_data_processor = self.processor.process()
-        self.type = self.sleep_data_processor['type'].iloc[0]
         self.s_name = 'S_SleepType'
 
+        # Answer from the precomputed daily rollup when it covers the whole window
+        self.rollup_df = lookup_rollup(rollup_store, self.records_df, self.s_name, *args)
+        if self.rollup_df is not None:
+            return
+
+        self.processor = SSleepType(self.records_df, *args)
+        self.sleep_data_processor = self.processor.process().rename(columns={'fit_value': 'value', 'dataTypeName': 'type', 'data_source': 'dataSource'})
+        self.type = self.sleep_data_processor['type'].iloc[0] if not self.sleep_data_processor.empty else 'com.google.sleep.segment'
+
     def process(self):
+        if self.rollup_df is not None:
+            return self.rollup_df.copy()
+
         # Process the records using SSleepType to get the relevant data for the *args
         sleep_data_processor = self.sleep_data_processor
+        if sleep_data_processor.empty:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value'])
 
         # Ensure that the 'date' column is in date format
         sleep_data_processor.loc[:, 'date'] = pd.to_datetime(sleep_data_processor['modifiedTime']).dt.date
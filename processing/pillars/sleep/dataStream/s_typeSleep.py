@@ -1,6 +1,9 @@
 import pandas as pd
 from datetime import datetime, timedelta
 
+from data_source.parseData.bronzeContract import day_window, is_conforming
+from processing.pillars.dataSources import SLEEP_SOURCE
+
 class SSleepType:
 
     SLEEP_STAGE_MAPPING = {
@@ -13,7 +16,10 @@ class SSleepType:
     }
     
     def __init__(self, googleFit_df, *args):
-        self.records_df = googleFit_df[googleFit_df['data_source'] == 'derived:com.google.sleep.segment:com.google.android.gms:merged'].copy()
+        records_df = googleFit_df[googleFit_df['data_source'] == SLEEP_SOURCE]
+        # Conforming frames are never modified here, so they are not copied
+        self.conforming = is_conforming(records_df)
+        self.records_df = records_df if self.conforming else records_df.copy()
         
         if self.records_df.empty:
             self._handle_empty_records()
@@ -21,7 +27,7 @@ class SSleepType:
         
         # Handle date filtering based on the arguments
         if len(args) == 1 and isinstance(args[0], list):
-            self.dates_list = [pd.to_datetime(date).tz_localize(None) for date in args[0]]
+            self.dates_list = list(dict.fromkeys(pd.to_datetime(date).tz_localize(None).normalize() for date in args[0]))
             self.records_df = self._filter_by_dates_list(self.records_df, self.dates_list)
         elif len(args) == 1:
             self.start_date = pd.to_datetime(args[0]).tz_localize(None)
@@ -56,9 +62,14 @@ class SSleepType:
 
     def _filter_by_dates_list(self, df, dates_list):
         filtered_df = pd.concat([self._filter_data(df, date) for date in dates_list])
-        return filtered_df.drop_duplicates().reset_index(drop=True)
+        return filtered_df.reset_index(drop=True)
 
     def _filter_data(self, df, start_date, end_date=None):
+        if self.conforming:
+            # Typed and sorted by startDate at ingest, so the window is a binary-search slice with no conversion
+            end_of_day = (end_date or start_date).replace(hour=23, minute=59, second=59, microsecond=999999)
+            return day_window(df, start_date.replace(hour=0, minute=0, second=0, microsecond=0), end_of_day)
+
         df['startDate'] = pd.to_datetime(df['startDate']).dt.tz_localize(None)
         df['endDate'] = pd.to_datetime(df['endDate']).dt.tz_localize(None)
 
@@ -85,7 +96,10 @@ class SSleepType:
 
     def _format_output(self):
         self.records_df['fit_value'] = self.records_df['fit_value'].apply(self._map_sleep_stage)
-        self.records_df['duration'] = self.records_df.apply(self._calculate_duration, axis=1)
+        if self.conforming:
+            self.records_df['duration'] = ((self.records_df['endDate'] - self.records_df['startDate']).dt.total_seconds() / 60).round(1)
+        else:
+            self.records_df['duration'] = self.records_df.apply(self._calculate_duration, axis=1)
         self.records_df['unit'] = 'min'
         self.records_df['valueGeneratedAt'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
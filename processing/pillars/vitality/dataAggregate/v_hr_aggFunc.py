@@ -1,17 +1,29 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-from processing.pillars.vitality.dataStream.v_hr_types import *
+from processing.kernels.numpyKernels import group_reduce
+
+from processing.pillars.vitality.dataStream.v_hr_types import VHeartRate
+from processing.rollup.dailyRollup import lookup_rollup
 
 class VHRagg:
-    def __init__(self, googleFit_df, *args):
+    def __init__(self, googleFit_df, *args, rollup_store=None, hr_store=None):
         self.googleFit_df = googleFit_df
         self.user_name = self.googleFit_df['userName'].iloc[0] if 'userName' in self.googleFit_df.columns else 'UnknownUser'
-        self.processor_instance = VHeartRate(self.googleFit_df, *args)
-        self.processed_df = self.processor_instance.process()
         self.s_name = 'V_HR'
 
+        # Answer from the precomputed daily rollup when it covers the whole window
+        self.rollup_df = lookup_rollup(rollup_store, self.googleFit_df, self.s_name, *args)
+        if self.rollup_df is not None:
+            return
+
+        self.processor_instance = VHeartRate(self.googleFit_df, *args, hr_store=hr_store)
+        self.processed_df = self.processor_instance.process().rename(columns={'fit_value': 'value', 'dataTypeName': 'type'})
+
     def process(self):
+        if self.rollup_df is not None:
+            return self.rollup_df.copy()
 
         processed_df = self.processed_df
 
@@ -25,34 +37,23 @@ class VHRagg:
         processed_df['startDate'] = pd.to_datetime(processed_df['startDate'], errors='coerce')
         processed_df = processed_df.dropna(subset=['startDate'])
         processed_df['value'] = pd.to_numeric(processed_df['value'], errors='coerce')
-        processed_df = processed_df.drop_duplicates(subset='startDate')
 
         for col in ['activity', 'sleep', 'workout', 'resting']:
             if col not in processed_df.columns:
                 processed_df[col] = 0
 
-        daily_agg = processed_df.groupby(processed_df['startDate'].dt.date).agg(
-            dayMin=('value', 'min'),
-            dayMax=('value', 'max'),
-            dayAvg=('value', 'mean'),
-            activityMin=('value', lambda x: x[processed_df['activity'] == 1].min() if (processed_df['activity'] == 1).any() else pd.NA),
-            activityMax=('value', lambda x: x[processed_df['activity'] == 1].max() if (processed_df['activity'] == 1).any() else pd.NA),
-            activityAvg=('value', lambda x: x[processed_df['activity'] == 1].mean() if (processed_df['activity'] == 1).any() else pd.NA),
-            sleepMin=('value', lambda x: x[processed_df['sleep'] == 1].min() if (processed_df['sleep'] == 1).any() else pd.NA),
-            sleepMax=('value', lambda x: x[processed_df['sleep'] == 1].max() if (processed_df['sleep'] == 1).any() else pd.NA),
-            sleepAvg=('value', lambda x: x[processed_df['sleep'] == 1].mean() if (processed_df['sleep'] == 1).any() else pd.NA),
-            workoutMin=('value', lambda x: x[processed_df['workout'] == 1].min() if (processed_df['workout'] == 1).any() else pd.NA),
-            workoutMax=('value', lambda x: x[processed_df['workout'] == 1].max() if (processed_df['workout'] == 1).any() else pd.NA),
-            workoutAvg=('value', lambda x: x[processed_df['workout'] == 1].mean() if (processed_df['workout'] == 1).any() else pd.NA),
-            restingMin=('value', lambda x: x[processed_df['resting'] == 1].min() if (processed_df['resting'] == 1).any() else pd.NA),
-            restingMax=('value', lambda x: x[processed_df['resting'] == 1].max() if (processed_df['resting'] == 1).any() else pd.NA),
-            restingAvg=('value', lambda x: x[processed_df['resting'] == 1].mean() if (processed_df['resting'] == 1).any() else pd.NA),
-        ).reset_index()
-
-        daily_agg = daily_agg.fillna({'activityMin': pd.NA, 'activityMax': pd.NA, 'activityAvg': pd.NA,
-                                      'sleepMin': pd.NA, 'sleepMax': pd.NA, 'sleepAvg': pd.NA,
-                                      'workoutMin': pd.NA, 'workoutMax': pd.NA, 'workoutAvg': pd.NA,
-                                      'restingMin': pd.NA, 'restingMax': pd.NA, 'restingAvg': pd.NA})
+        # Single sorted pass per context instead of a Python lambda per group
+        dates = processed_df['startDate'].dt.normalize()
+        day_index = pd.Index(dates.unique()).sort_values()
+        codes = day_index.get_indexer(dates)
+        values = processed_df['value'].to_numpy(dtype='float64')
+
+        daily_agg = pd.DataFrame({'startDate': day_index.date})
+        for how, suffix in [('min', 'Min'), ('max', 'Max'), ('mean', 'Avg')]:
+            daily_agg[f'day{suffix}'] = group_reduce(codes, values, len(day_index), how)
+            for col in ['activity', 'sleep', 'workout', 'resting']:
+                context_values = np.where(processed_df[col].to_numpy() == 1, values, np.nan)
+                daily_agg[f'{col}{suffix}'] = group_reduce(codes, context_values, len(day_index), how)
 
         long_format = daily_agg.melt(id_vars=['startDate'], 
                                      value_vars=['dayAvg', 'dayMin', 'dayMax',
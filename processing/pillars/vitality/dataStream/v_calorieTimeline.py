@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from processing.kernels.numpyKernels import (to_int64_ns, elementary_boundaries, segment_rate_sum,
+                                             cumulative_lookup)
+from processing.pillars.dataSources import CALORIES_SOURCE
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+class VCalorieTimeline:
+
+    MERGED_SOURCE = CALORIES_SOURCE
+
+    def __init__(self, calories_df):
+        # merge_calories_expended records from every origin; other data sources are ignored
+        self.records_df = calories_df[calories_df['data_source'] == self.MERGED_SOURCE] if 'data_source' in calories_df.columns else calories_df
+        self.unit = 'kcal'
+        self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._timelines = {user_name: self._build(user_df) for user_name, user_df in self.records_df.groupby('userName')} if not self.records_df.empty else {}
+
+    def _build(self, user_df):
+        starts = to_int64_ns(user_df['startDate'])
+        ends = to_int64_ns(user_df['endDate'])
+        # Instantaneous points are given a 1 ns extent so their energy is kept
+        ends = np.maximum(ends, starts + 1)
+        values = pd.to_numeric(user_df['fit_value'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        rates = values / (ends - starts)
+        active = (user_df['originDataSourceId'] != self.MERGED_SOURCE).to_numpy()
+
+        boundaries = elementary_boundaries(starts, ends)
+        active_rate, active_count = segment_rate_sum(boundaries, starts[active], ends[active], rates[active])
+        merged_rate, merged_count = segment_rate_sum(boundaries, starts[~active], ends[~active], rates[~active])
+
+        # Reports of the same kind covering the same time describe the same energy, so their rates are averaged
+        active_rate = np.divide(active_rate, active_count, out=np.zeros_like(active_rate), where=active_count > 0)
+        merged_rate = np.divide(merged_rate, merged_count, out=np.zeros_like(merged_rate), where=merged_count > 0)
+
+        # Per-activity energy wins where it overlaps the merged stream; only the excess is resting
+        segment_ns = np.diff(boundaries)
+        active_energy = active_rate * segment_ns
+        resting_energy = np.maximum(merged_rate - active_rate, 0) * segment_ns
+        return boundaries, active_energy, resting_energy
+
+    def process(self):
+        """Non-overlapping segments with the active and resting energy each one carries."""
+        frames = []
+        for user_name, (boundaries, active_energy, resting_energy) in self._timelines.items():
+            keep = (active_energy > 0) | (resting_energy > 0)
+            frames.append(pd.DataFrame({
+                'userName': user_name,
+                'valueGeneratedAt': self.value_generated_at,
+                'startDate': pd.to_datetime(boundaries[:-1][keep]),
+                'endDate': pd.to_datetime(boundaries[1:][keep]),
+                'unit': self.unit,
+                'activeCalories': active_energy[keep],
+                'restingCalories': resting_energy[keep],
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 'startDate', 'endDate', 'unit', 'activeCalories', 'restingCalories'])
+        return pd.concat(frames, ignore_index=True)
+
+    def daily_totals(self, dates=None):
+        """Active, resting and total kcal per user-day; segments crossing midnight are split by time."""
+        rows = []
+        for user_name, (boundaries, active_energy, resting_energy) in self._timelines.items():
+            if dates is None:
+                first_day = boundaries[0] - boundaries[0] % DAY_NS
+                day_starts = np.arange(first_day, boundaries[-1], DAY_NS, dtype='int64')
+            else:
+                day_starts = to_int64_ns(pd.to_datetime(pd.Series(dates)).dt.normalize())
+
+            # Each day total is the running total at its end minus the running total at its start
+            day_ends = day_starts + DAY_NS
+            active_day = cumulative_lookup(boundaries, active_energy, day_ends) - cumulative_lookup(boundaries, active_energy, day_starts)
+            resting_day = cumulative_lookup(boundaries, resting_energy, day_ends) - cumulative_lookup(boundaries, resting_energy, day_starts)
+
+            day_values = pd.to_datetime(day_starts).date
+            for value_type, values in [('ActiveCalories', active_day), ('RestingCalories', resting_day),
+                                       ('TotalCalories', active_day + resting_day)]:
+                rows.append(pd.DataFrame({'userName': user_name, 'date': day_values, 'valueType': value_type, 'value': values}))
+
+        if not rows:
+            return pd.DataFrame(columns=['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value'])
+
+        daily_df = pd.concat(rows, ignore_index=True)
+        daily_df['valueGeneratedAt'] = self.value_generated_at
+        daily_df['s_name'] = 'V_TotalCalories'
+        daily_df['type'] = 'com.google.calories.expended'
+        daily_df['unit'] = self.unit
+        daily_df['value'] = daily_df['value'].round(1)
+        daily_df = daily_df.sort_values(by=['date', 'valueType'], ascending=False, ignore_index=True)
+        return daily_df[['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']]
@@ -1,14 +1,23 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+from data_source.parseData.bronzeContract import day_window, is_conforming
+from data_source.storage.hrStore import DAY_NS, SECOND_NS, HeartRateStore
+from processing.kernels.numpyKernels import interval_overlap_mask, to_int64_ns
+from processing.pillars.dataSources import ACTIVE_MINUTES_SOURCE, CALORIES_SOURCE, HR_SOURCE, SLEEP_SOURCE, STEP_COUNT_SOURCE
+from processing.rollup.dailyRollup import window_dates
+
 class VHeartRate:
-    def __init__(self, googleFit_df, *args):
-        self.records_df = googleFit_df.copy()
+    def __init__(self, googleFit_df, *args, hr_store=None):
+        # Conforming frames are never modified here, so they are not copied
+        self.conforming = is_conforming(googleFit_df)
+        self.records_df = googleFit_df if self.conforming else googleFit_df.copy()
         self.unit = 'bpm'
         self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         if len(args) == 1 and isinstance(args[0], list):
-            self.dates_list = [pd.to_datetime(date).tz_localize(None) for date in args[0]]
+            self.dates_list = list(dict.fromkeys(pd.to_datetime(date).tz_localize(None).normalize() for date in args[0]))
             self.filtered_records_df = self._filter_by_dates_list(self.records_df, self.dates_list)
         elif len(args) == 1:
             self.start_date = pd.to_datetime(args[0]).tz_localize(None)
@@ -23,11 +32,67 @@ class VHeartRate:
             self.offset_sign = args[2]
             self.filtered_records_df = self._filter_by_offset(self.records_df, self.start_date, self.days_offset, self.offset_sign)
         
-        if not self.filtered_records_df.empty:
+        # With a HeartRateStore, heart rate is read from its memory-mapped columns and the bronze
+        # frame only supplies the sleep, workout and activity context
+        self.stored_hr = self._read_stored_heart_rate(hr_store, *args) if hr_store is not None else None
+        if self.stored_hr is not None:
+            self._flag_stored_heart_rate()
+        elif not self.filtered_records_df.empty:
             self.flagged_records_df = self._flag_records()
         else:
             self._handle_empty_records()
 
+    def _read_stored_heart_rate(self, hr_store, *args):
+        """The window's heart-rate samples as int64 ns / value arrays, cut from the store's views with no frame built."""
+        if 'userName' in self.records_df.columns and not self.records_df.empty:
+            user_names = self.records_df['userName'].unique()
+        else:
+            user_names = hr_store.users()
+        days = window_dates(*args)
+        per_day = len(args) == 1
+
+        columns = {'userName': [], 'startDate': [], 'endDate': [], 'modifiedTime': [], 'originDataSourceId': [], 'fit_value': []}
+        for user_name in user_names:
+            window = hr_store.read_arrays(user_name, *args)
+            if window is None:
+                continue
+            starts = window['day_start'] + window['start_offset'].astype('int64') * SECOND_NS
+            ends = starts + window['duration'].astype('int64') * SECOND_NS
+            # Same rule as _filter_data: a sample must also end by the end of its day (a list of days)
+            # or of the window's last day
+            window_end = window['day_start'] + DAY_NS if per_day else pd.Timestamp(days[-1]).value + DAY_NS
+            keep = ends < window_end
+            columns['userName'].append(np.full(int(keep.sum()), user_name, dtype=object))
+            columns['startDate'].append(starts[keep])
+            columns['endDate'].append(ends[keep])
+            columns['modifiedTime'].append(starts[keep] + window['modified_delta'][keep].astype('int64') * SECOND_NS)
+            columns['originDataSourceId'].append(np.asarray(window['origins'], dtype=object)[window['origin_code'][keep]])
+            columns['fit_value'].append(window['bpm'][keep].astype('float64'))
+        return {name: np.concatenate(values) if values else np.empty(0, dtype='int64') for name, values in columns.items()}
+
+    def _flag_stored_heart_rate(self):
+        """Context flags of the stored samples, with the same precedence as _flag_records."""
+        records = self.filtered_records_df
+        starts, ends = self.stored_hr['startDate'], self.stored_hr['endDate']
+
+        def overlapping(events_df):
+            return interval_overlap_mask(starts, ends, to_int64_ns(events_df['startDate']), to_int64_ns(events_df['endDate']))
+
+        sleep = overlapping(records[records['data_source'] == SLEEP_SOURCE])
+        workout = overlapping(records[(records['data_source'] == CALORIES_SOURCE) &
+                                      (records['originDataSourceId'] != CALORIES_SOURCE)]) & ~sleep
+        activity = overlapping(records[records['data_source'].isin([ACTIVE_MINUTES_SOURCE, STEP_COUNT_SOURCE])]) & ~sleep & ~workout
+        self.stored_hr.update(sleep=sleep.astype(int), workout=workout.astype(int), activity=activity.astype(int),
+                              resting=(~(sleep | workout | activity)).astype(int))
+
+    def _stored_heart_rate_frame(self):
+        heart_rate_df = pd.DataFrame({name: values for name, values in self.stored_hr.items()})
+        for column in ('startDate', 'endDate', 'modifiedTime'):
+            heart_rate_df[column] = pd.to_datetime(heart_rate_df[column].to_numpy(dtype='int64'))
+        heart_rate_df['dataTypeName'] = HeartRateStore.HR_TYPE
+        heart_rate_df['data_source'] = HR_SOURCE
+        return heart_rate_df
+
     def _filter_by_single_date(self, df, start_date):
         return self._filter_data(df, start_date)
 
@@ -44,13 +109,18 @@ class VHeartRate:
 
     def _filter_by_dates_list(self, df, dates_list):
         filtered_df = pd.concat([self._filter_data(df, date) for date in dates_list])
-        return filtered_df.drop_duplicates().reset_index(drop=True)
+        return filtered_df.reset_index(drop=True)
 
     def _filter_data(self, df, start_date, end_date=None):
         if df.empty:
             return pd.DataFrame(columns=['dataTypeName', 'originDataSourceId', 'data_source', 'startDate', 
                                          'endDate', 'value_type', 'fit_value'])
 
+        if self.conforming:
+            # Typed and sorted by startDate at ingest, so the window is a binary-search slice with no conversion
+            end_of_day = (end_date or start_date).replace(hour=23, minute=59, second=59, microsecond=999999)
+            return day_window(df, start_date.replace(hour=0, minute=0, second=0, microsecond=0), end_of_day)
+
         df['startDate'] = pd.to_datetime(df['startDate']).dt.tz_localize(None)
         df['endDate'] = pd.to_datetime(df['endDate']).dt.tz_localize(None)
 
@@ -85,43 +155,34 @@ class VHeartRate:
                 df[col] = 0
         return df
 
+    def _flag_overlapping(self, events_df):
+        records = self.filtered_records_df
+        return interval_overlap_mask(to_int64_ns(records['startDate']), to_int64_ns(records['endDate']),
+                                     to_int64_ns(events_df['startDate']), to_int64_ns(events_df['endDate']))
+
     def _flag_sleep_records(self):
-        sleep_values = ['derived:com.google.sleep.segment:com.google.android.gms:merged']
-        for sleep_type in sleep_values:
-            sleep_df = self.filtered_records_df[self.filtered_records_df['data_source'] == sleep_type].copy()
-            for _, sleep_row in sleep_df.iterrows():
-                sleep_start = sleep_row['startDate']
-                sleep_end = sleep_row['endDate']
-                overlap_mask = (self.filtered_records_df['startDate'] <= sleep_end) & (self.filtered_records_df['endDate'] >= sleep_start)
-                self.filtered_records_df.loc[overlap_mask, 'sleep'] = 1
+        sleep_values = [SLEEP_SOURCE]
+        sleep_df = self.filtered_records_df[self.filtered_records_df['data_source'].isin(sleep_values)]
+        overlap_mask = self._flag_overlapping(sleep_df)
+        self.filtered_records_df.loc[overlap_mask, 'sleep'] = 1
 
     def _flag_workout_records(self):
-        workout_types = [
-            'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended'
-        ]    
-        for workout_type in workout_types:
-            workout_df = self.filtered_records_df[(self.filtered_records_df['data_source'] == workout_type) & (self.filtered_records_df['originDataSourceId'] != 
-                        'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended')].copy()
-            for _, workout_row in workout_df.iterrows():
-                workout_start = workout_row['startDate']
-                workout_end = workout_row['endDate']
-                overlap_mask = (self.filtered_records_df['startDate'] <= workout_end) & (self.filtered_records_df['endDate'] >= workout_start)
-                self.filtered_records_df.loc[(overlap_mask) & (self.filtered_records_df['sleep'] == 0), 'workout'] = 1    
+        workout_types = [CALORIES_SOURCE]
+        workout_df = self.filtered_records_df[(self.filtered_records_df['data_source'].isin(workout_types)) &
+                                              (self.filtered_records_df['originDataSourceId'] != CALORIES_SOURCE)]
+        overlap_mask = self._flag_overlapping(workout_df)
+        self.filtered_records_df.loc[(overlap_mask) & (self.filtered_records_df['sleep'] == 0), 'workout'] = 1
 
     def _flag_activity_records(self):
         activity_types = [
-            'derived:com.google.active_minutes:com.google.android.gms:merge_active_minutes',
-            'derived:com.google.step_count.delta:com.google.android.gms:estimated_steps'
+            ACTIVE_MINUTES_SOURCE,
+            STEP_COUNT_SOURCE
         ]
-        for activity_type in activity_types:
-            activity_df = self.filtered_records_df[self.filtered_records_df['data_source'] == activity_type].copy()
-            for _, activity_row in activity_df.iterrows():
-                activity_start = activity_row['startDate']
-                activity_end = activity_row['endDate']
-                overlap_mask = (self.filtered_records_df['startDate'] <= activity_end) & (self.filtered_records_df['endDate'] >= activity_start)
-                self.filtered_records_df.loc[(overlap_mask) & 
-                                             (self.filtered_records_df['sleep'] == 0) & 
-                                             (self.filtered_records_df['workout'] == 0), 'activity'] = 1
+        activity_df = self.filtered_records_df[self.filtered_records_df['data_source'].isin(activity_types)]
+        overlap_mask = self._flag_overlapping(activity_df)
+        self.filtered_records_df.loc[(overlap_mask) & 
+                                     (self.filtered_records_df['sleep'] == 0) & 
+                                     (self.filtered_records_df['workout'] == 0), 'activity'] = 1
 
     def _flag_resting_records(self):
         self.filtered_records_df['resting'] = (
@@ -131,14 +192,18 @@ class VHeartRate:
         ).astype(int)
 
     def process(self):
-        heart_rate_df = self.filtered_records_df[self.filtered_records_df['data_source'] == 'derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm'].copy()
+        if self.stored_hr is not None:
+            heart_rate_df = self._stored_heart_rate_frame()
+        else:
+            heart_rate_df = self.filtered_records_df[self.filtered_records_df['data_source'] == HR_SOURCE].copy()
         if heart_rate_df.empty:
             return heart_rate_df
         
         heart_rate_df['unit'] = self.unit
         heart_rate_df['valueGeneratedAt'] = self.value_generated_at
-        heart_rate_df['fit_value'] = heart_rate_df['fit_value'].astype(float)
-        heart_rate_df['startDate'] = pd.to_datetime(heart_rate_df['startDate'])
+        if not self.conforming:
+            heart_rate_df['fit_value'] = heart_rate_df['fit_value'].astype(float)
+            heart_rate_df['startDate'] = pd.to_datetime(heart_rate_df['startDate'])
         heart_rate_df['dateSorting'] = heart_rate_df['startDate'].dt.date
         heart_rate_df = heart_rate_df.sort_values(by=['dateSorting', 'startDate', 'dataTypeName'], ascending=(False, True, False), ignore_index=True)
         
@@ -1,14 +1,22 @@
 import pandas as pd
 from datetime import datetime, timedelta
 
+from data_source.parseData.bronzeContract import day_window, is_conforming
+
+from processing.pillars.vitality.dataStream.v_calorieTimeline import VCalorieTimeline
+from processing.pillars.dataSources import CALORIES_SOURCE
+
 class VTotalCalories:
     def __init__(self, googleFit_df, *args):
-        self.records_df = googleFit_df[googleFit_df['data_source'] == 'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended'].copy()
+        records_df = googleFit_df[googleFit_df['data_source'] == CALORIES_SOURCE]
+        # Conforming frames are never modified here, so they are not copied
+        self.conforming = is_conforming(records_df)
+        self.records_df = records_df if self.conforming else records_df.copy()
         self.unit = 'kcal'
         self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         if len(args) == 1 and isinstance(args[0], list):
-            self.dates_list = [pd.to_datetime(date).tz_localize(None) for date in args[0]]
+            self.dates_list = list(dict.fromkeys(pd.to_datetime(date).tz_localize(None).normalize() for date in args[0]))
             self.filtered_records_df = self._filter_by_dates_list(self.records_df, self.dates_list)
         elif len(args) == 1:
             self.start_date = pd.to_datetime(args[0]).tz_localize(None)
@@ -44,9 +52,14 @@ class VTotalCalories:
 
     def _filter_by_dates_list(self, df, dates_list):
         filtered_df = pd.concat([self._filter_data(df, date) for date in dates_list])
-        return filtered_df.drop_duplicates().reset_index(drop=True)
+        return filtered_df.reset_index(drop=True)
 
     def _filter_data(self, df, start_date, end_date=None):
+        if self.conforming:
+            # Typed and sorted by startDate at ingest, so the window is a binary-search slice with no conversion
+            end_of_day = (end_date or start_date).replace(hour=23, minute=59, second=59, microsecond=999999)
+            return day_window(df, start_date.replace(hour=0, minute=0, second=0, microsecond=0), end_of_day)
+
         df['startDate'] = pd.to_datetime(df['startDate']).dt.tz_localize(None)
         df['endDate'] = pd.to_datetime(df['endDate']).dt.tz_localize(None)
 
@@ -80,13 +93,21 @@ class VTotalCalories:
         return df
 
     def _flag_active_calories(self):
-        non_google_sources = self.filtered_records_df['originDataSourceId'] != 'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended'
+        non_google_sources = self.filtered_records_df['originDataSourceId'] != CALORIES_SOURCE
         self.filtered_records_df.loc[non_google_sources, 'activeCalories'] = 1
 
     def _flag_resting_calories(self):
-        google_sources = self.filtered_records_df['originDataSourceId'] == 'derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended'
+        google_sources = self.filtered_records_df['originDataSourceId'] == CALORIES_SOURCE
         self.filtered_records_df.loc[google_sources & (self.filtered_records_df['activeCalories'] == 0), 'restingCalories'] = 1
 
+    def timeline(self):
+        # Overlapping merged/per-activity intervals resolved into non-overlapping active and resting energy
+        return VCalorieTimeline(self.filtered_records_df).process()
+
+    def daily_totals(self):
+        dates = sorted(pd.to_datetime(self.filtered_records_df['startDate']).dt.normalize().unique()) if not self.filtered_records_df.empty else None
+        return VCalorieTimeline(self.filtered_records_df).daily_totals(dates)
+
     def process(self):
         calories_df = self.filtered_records_df.copy()
         if calories_df.empty:
@@ -94,8 +115,9 @@ class VTotalCalories:
         
         calories_df['unit'] = self.unit
         calories_df['valueGeneratedAt'] = self.value_generated_at
-        calories_df['fit_value'] = calories_df['fit_value'].astype(float)
-        calories_df['startDate'] = pd.to_datetime(calories_df['startDate'])
+        if not self.conforming:
+            calories_df['fit_value'] = calories_df['fit_value'].astype(float)
+            calories_df['startDate'] = pd.to_datetime(calories_df['startDate'])
         calories_df['dateSorting'] = calories_df['startDate'].dt.date
         #calories_df = calories_df.sort_values(by=['dateSorting', 'startDate', 'dataTypeName'], ascending=(False, True, False), ignore_index=True)
 
@@ -1,33 +1,28 @@
 import pandas as pd
 from datetime import datetime, timedelta
-import pytz
+
+from data_source.parseData.userTimezones import DEFAULT_TIMEZONE, UserTimezones
 
 class WHeartRate:
 
-    def __init__(self, googleFit_activitiesData, *args):
-        self.googleFit_activitiesData = googleFit_activitiesData
+    def __init__(self, googleFit_activitiesData, *args, timezone=None):
+        # Localized into a private copy: the caller's frame keeps its UTC columns, so building the
+        # class again on the same frame never converts them twice
+        self.googleFit_activitiesData = googleFit_activitiesData.copy()
         self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         self.unit = 'bpm'
-        self.timezone = pytz.timezone('Asia/Kolkata')
-        
-        # Convert columns to datetime
-        self.googleFit_activitiesData["Lap.StartTime"] = pd.to_datetime(self.googleFit_activitiesData["Lap.StartTime"])
-        self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"] = pd.to_datetime(self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"])
-
-        # Convert to UTC if not already timezone aware
-        if self.googleFit_activitiesData["Lap.StartTime"].dt.tz is None:
-            self.googleFit_activitiesData["Lap.StartTime"] = self.googleFit_activitiesData["Lap.StartTime"].dt.tz_localize('UTC')
+        # A zone name, or a UserTimezones with per-user history
+        self.timezones = timezone if isinstance(timezone, UserTimezones) else UserTimezones(timezone or DEFAULT_TIMEZONE)
 
-        if self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"].dt.tz is None:
-            self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"] = self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"].dt.tz_localize('UTC')
-
-        # Convert to the desired timezone
-        self.googleFit_activitiesData["Lap.StartTime"] = self.googleFit_activitiesData["Lap.StartTime"].dt.tz_convert(self.timezone)
-        self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"] = self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"].dt.tz_convert(self.timezone)
+        # Parsed once as UTC and converted per user in one vectorized step
+        self.googleFit_activitiesData["Lap.StartTime"] = self.timezones.localize_column(self.googleFit_activitiesData, "Lap.StartTime", aware=True)
+        self.googleFit_activitiesData["Lap.Track.Trackpoint.Time"] = self.timezones.localize_column(self.googleFit_activitiesData, "Lap.Track.Trackpoint.Time")
+        # Workouts are bucketed by the local day they started on
+        self.googleFit_activitiesData["Id"] = self.timezones.localize_column(self.googleFit_activitiesData, "Id")
 
         # Filter data based on arguments
         if len(args) == 1 and isinstance(args[0], list):
-            self.dates_list = [pd.to_datetime(date).tz_localize(None) for date in args[0]]
+            self.dates_list = list(dict.fromkeys(pd.to_datetime(date).tz_localize(None).normalize() for date in args[0]))
             self.filtered_googleFit_activitiesData = self._filter_by_dates_list(self.googleFit_activitiesData, self.dates_list)
         elif len(args) == 1:
             self.start_date = pd.to_datetime(args[0]).tz_localize(None)
@@ -61,7 +56,7 @@ class WHeartRate:
 
     def _filter_by_dates_list(self, df, dates_list):
         filtered_df = pd.concat([self._filter_data(df, date) for date in dates_list])
-        return filtered_df.drop_duplicates().reset_index(drop=True)
+        return filtered_df.reset_index(drop=True)
 
     def _filter_data(self, df, start_date, end_date=None):
         if df.empty:
@@ -70,8 +65,6 @@ class WHeartRate:
         start_of_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_day = end_date.replace(hour=23, minute=59, second=59, microsecond=999999) if end_date else start_of_day.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-        df["Id"] = pd.to_datetime(df["Id"]).dt.tz_localize(None)
-        df["Lap.Track.Trackpoint.Time"] = pd.to_datetime(df["Lap.Track.Trackpoint.Time"]).dt.tz_localize(None)
         filtered_df = df[((df['Id'] >= start_of_day) & (df['Id'] <= end_of_day)) &
                          ((df['Lap.Track.Trackpoint.Time'] >= start_of_day) & (df['Lap.Track.Trackpoint.Time'] <= end_of_day))]
         
@@ -0,0 +1,95 @@
+import pandas as pd
+from datetime import datetime
+
+from data_source.parseData.userTimezones import DEFAULT_TIMEZONE, UserTimezones
+from processing.kernels.routeCompression import CompactRoute
+from processing.rollup.dailyRollup import window_dates
+
+LATITUDE = 'Lap.Track.Trackpoint.Position.LatitudeDegrees'
+LONGITUDE = 'Lap.Track.Trackpoint.Position.LongitudeDegrees'
+ALTITUDE = 'Lap.Track.Trackpoint.AltitudeMeters'
+CADENCE_COLUMNS = ('Lap.Track.Trackpoint.RunCadence', 'Lap.Track.Trackpoint.Cadence')
+
+
+class WRoute:
+    """One row per GPS-tracked workout with its route compressed, and distance and elevation read from it.
+
+    The trackpoints of a workout (all its laps) are simplified with Douglas-Peucker to within
+    epsilon_meters and delta-encoded (see CompactRoute); the `route` column holds the encoded bytes,
+    a few percent of the raw trackpoints. Workouts without positions are left out.
+    """
+
+    OUTPUT_COLUMNS = ['userName', 'valueGeneratedAt', 'Sport', 'Lap.StartTime', 'startDate', 'endDate', 'unit', 'points',
+                      'keptPoints', 'distance', 'elevationGain', 'elevationLoss', 'avgCadence', 'route']
+
+    def __init__(self, googleFit_activitiesData, *args, timezone=None, epsilon_meters=5.0):
+        self.googleFit_activitiesData = googleFit_activitiesData
+        self.value_generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.unit = 'm'
+        self.epsilon_meters = epsilon_meters
+        # A zone name, or a UserTimezones with per-user history
+        self.timezones = timezone if isinstance(timezone, UserTimezones) else UserTimezones(timezone or DEFAULT_TIMEZONE)
+
+        if googleFit_activitiesData.empty or LATITUDE not in googleFit_activitiesData.columns:
+            self.filtered_googleFit_activitiesData = pd.DataFrame(columns=list(googleFit_activitiesData.columns))
+        else:
+            tracked_df = googleFit_activitiesData[googleFit_activitiesData[LATITUDE].notna()].copy()
+            tracked_df['Lap.StartTime'] = self.timezones.localize_column(tracked_df, 'Lap.StartTime', aware=True)
+            # Workouts are bucketed by the local day they started on
+            tracked_df['localId'] = self.timezones.localize_column(tracked_df, 'Id')
+            tracked_df['localTime'] = self.timezones.localize_column(tracked_df, 'Lap.Track.Trackpoint.Time')
+            self.filtered_googleFit_activitiesData = self._filter_days(tracked_df, window_dates(*args)) if args else tracked_df
+
+        if self.filtered_googleFit_activitiesData.empty:
+            self._handle_empty_records()
+
+    def _filter_days(self, df, days):
+        day_starts = df['localId'].dt.normalize()
+        return df[day_starts.isin([pd.Timestamp(day) for day in days])].reset_index(drop=True)
+
+    def _handle_empty_records(self):
+        print("No GPS-tracked workouts available for the specified dates.")
+
+    def _workout_row(self, workout_df):
+        distance = pd.to_numeric(workout_df['Lap.Track.Trackpoint.DistanceMeters'], errors='coerce') \
+            if 'Lap.Track.Trackpoint.DistanceMeters' in workout_df.columns else None
+        route = CompactRoute.encode(workout_df['Lap.Track.Trackpoint.Time'], workout_df[LATITUDE], workout_df[LONGITUDE],
+                                    alt=workout_df[ALTITUDE] if ALTITUDE in workout_df.columns else None,
+                                    distance=distance, epsilon_meters=self.epsilon_meters)
+        gain, loss = route.elevation()
+        cadence_column = next((column for column in CADENCE_COLUMNS if column in workout_df.columns), None)
+        return {
+            'userName': workout_df['userName'].iloc[0] if 'userName' in workout_df.columns else None,
+            'Sport': workout_df['Sport'].iloc[0],
+            'Lap.StartTime': workout_df['Lap.StartTime'].iloc[0],
+            'startDate': workout_df['localTime'].min(),
+            'endDate': workout_df['localTime'].max(),
+            'points': route.raw_points,
+            'keptPoints': route.kept_points,
+            'distance': round(route.distance(), 1),
+            'elevationGain': round(gain, 1),
+            'elevationLoss': round(loss, 1),
+            'avgCadence': round(workout_df[cadence_column].mean(), 1) if cadence_column else float('nan'),
+            'route': route.to_bytes(),
+        }
+
+    def process(self):
+        if self.filtered_googleFit_activitiesData.empty:
+            return pd.DataFrame(columns=self.OUTPUT_COLUMNS)
+
+        keys = ['userName', 'Id'] if 'userName' in self.filtered_googleFit_activitiesData.columns else ['Id']
+        workout_rows = [self._workout_row(workout_df.sort_values('Lap.Track.Trackpoint.Time', kind='stable'))
+                        for _, workout_df in self.filtered_googleFit_activitiesData.groupby(keys, sort=False)]
+        route_df = pd.DataFrame(workout_rows)
+        route_df['valueGeneratedAt'] = self.value_generated_at
+        route_df['unit'] = self.unit
+        return route_df.sort_values('startDate', ascending=False, ignore_index=True)[self.OUTPUT_COLUMNS]
+
+
+def route_splits(route_df, split_meters=1000):
+    """Splits of every workout in a W_Route output, decoded from the compact routes: one row per split."""
+    frames = [CompactRoute.from_bytes(row['route']).splits(split_meters).assign(userName=row['userName'], startDate=row['startDate'])
+              for _, row in route_df.iterrows()]
+    if not frames:
+        return pd.DataFrame(columns=['userName', 'startDate', 'split', 'distance', 'seconds', 'elevationGain'])
+    return pd.concat(frames, ignore_index=True)[['userName', 'startDate', 'split', 'distance', 'seconds', 'elevationGain']]
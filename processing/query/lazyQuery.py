@@ -0,0 +1,131 @@
+import copy
+import pandas as pd
+
+from processing.pillars.registry import STAGE_REGISTRY, load_class
+from processing.rollup.dailyRollup import window_dates
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+# stage -> (stream class path, aggregate class path or None, input frame, data sources it reads or None for all,
+#           (days before, days after) the window it reads)
+STAGES = {
+    s_name: (entry['stream'], entry['aggregate'], entry['source'], entry['data_sources'], entry['padding_days'])
+    for s_name, entry in STAGE_REGISTRY.items()
+}
+
+
+class PillarQuery:
+
+    def __init__(self, googleFit_df=None, googleFit_activitiesData=None, rollup_store=None):
+        self.googleFit_df = googleFit_df
+        self.googleFit_activitiesData = googleFit_activitiesData
+        self.rollup_store = rollup_store
+        self._user_name = None
+        self._window = None
+        self._stages = []
+        self._aggregate = False
+
+    def _derive(self, **changes):
+        # Builder steps never mutate the query they are called on
+        query = copy.copy(self)
+        query._stages = list(self._stages)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def for_user(self, user_name):
+        return self._derive(_user_name=user_name)
+
+    def window(self, *args):
+        """Same forms as the pillar constructors: [dates], date, (start, end) or (date, days_offset, sign)."""
+        window_dates(*args)  # validate eagerly, evaluate lazily
+        return self._derive(_window=args)
+
+    def stream(self, s_name):
+        if s_name not in STAGES:
+            raise KeyError(f"Unknown stage: {s_name}")
+        return self._derive(_stages=self._stages + [s_name])
+
+    def aggregate(self):
+        return self._derive(_aggregate=True)
+
+    def _plan(self):
+        if not self._stages:
+            raise ValueError("No stream selected; call .stream(s_name) before collecting")
+        if self._window is None:
+            raise ValueError("No date window selected; call .window(...) before collecting")
+
+        steps = []
+        for s_name in self._stages:
+            stream_path, agg_path, source, data_sources, padding_days = STAGES[s_name]
+            use_agg = self._aggregate and agg_path is not None
+            steps.append({
+                's_name': s_name,
+                'class_path': agg_path if use_agg else stream_path,
+                'source': source,
+                'data_sources': data_sources,
+                'padding_days': padding_days,
+                'rollup': use_agg and self.rollup_store is not None,
+            })
+        return steps
+
+    def explain(self):
+        """Describe the optimised plan without executing it."""
+        lines = []
+        days = window_dates(*self._window) if self._window is not None else []
+        for step in self._plan():
+            pushed = [f"userName == {self._user_name!r}"] if self._user_name is not None else []
+            if step['source'] == 'allData' and days:
+                before, after = step['padding_days']
+                pushed.append(f"startTimeNanos in [{days[0]} - {before + 1}d, {days[-1]} + {after + 2}d)")
+            if step['data_sources']:
+                pushed.append(f"data_source in {len(step['data_sources'])} sources")
+            scan = 'rollup lookup, fallback ' if step['rollup'] else ''
+            lines.append(f"{step['s_name']}: {scan}{step['class_path'].split(':')[1]} <- scan {step['source']} [{'; '.join(pushed)}]")
+        return '\n'.join(lines)
+
+    def _pushdown(self, df, step, days, scan_cache):
+        # Identical predicates are evaluated once and shared by every stage of the query
+        if df is None:
+            raise ValueError(f"No {step['source']} frame was given to the query")
+        sources = tuple(sorted(step['data_sources'])) if step['data_sources'] else None
+        cache_key = (step['source'], sources, step['padding_days'])
+        if cache_key in scan_cache:
+            return scan_cache[cache_key]
+
+        mask = pd.Series(True, index=df.index)
+        if self._user_name is not None and 'userName' in df.columns:
+            mask &= df['userName'] == self._user_name
+        if sources is not None and 'data_source' in df.columns:
+            mask &= df['data_source'].isin(sources)
+        if step['source'] == 'allData' and 'startTimeNanos' in df.columns:
+            # Widened by the days the stage reads around its window, plus a day either side so
+            # local-time day boundaries are never cut; the pillar still applies its exact day filter
+            before, after = step['padding_days']
+            lower = pd.Timestamp(days[0]).value - (before + 1) * DAY_NS
+            upper = pd.Timestamp(days[-1]).value + (after + 2) * DAY_NS
+            start_nanos = pd.to_numeric(df['startTimeNanos'], errors='coerce')
+            mask &= (start_nanos >= lower) & (start_nanos < upper)
+
+        pruned = df[mask]
+        scan_cache[cache_key] = pruned
+        return pruned
+
+    def collect(self):
+        """Execute the plan; a single stage returns its frame, several return {s_name: frame}."""
+        steps = self._plan()
+        days = window_dates(*self._window)
+        scan_cache = {}
+        results = {}
+        for step in steps:
+            frame = self.googleFit_df if step['source'] == 'allData' else self.googleFit_activitiesData
+            pruned = self._pushdown(frame, step, days, scan_cache)
+            stage_cls = load_class(step['class_path'])
+            if step['rollup']:
+                results[step['s_name']] = stage_cls(pruned, *self._window, rollup_store=self.rollup_store).process()
+            else:
+                results[step['s_name']] = stage_cls(pruned, *self._window).process()
+
+        if len(results) == 1:
+            return next(iter(results.values()))
+        return results
@@ -0,0 +1,292 @@
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+AGG_COLUMNS = ['userName', 'valueGeneratedAt', 's_name', 'date', 'type', 'unit', 'valueType', 'value']
+
+
+def window_dates(*args):
+    """Resolve the pillar positional date arguments into the list of calendar days they cover."""
+    if len(args) == 1 and isinstance(args[0], list):
+        return sorted({pd.to_datetime(date).tz_localize(None).date() for date in args[0]})
+    if len(args) == 1:
+        return [pd.to_datetime(args[0]).tz_localize(None).date()]
+    if len(args) == 2:
+        start_date, end_date = pd.to_datetime(args[0]).tz_localize(None), pd.to_datetime(args[1]).tz_localize(None)
+    elif len(args) == 3:
+        start_date, days_offset, offset_sign = pd.to_datetime(args[0]).tz_localize(None), int(args[1]), args[2]
+        if offset_sign == '+':
+            end_date = start_date + timedelta(days=days_offset)
+        else:
+            end_date = start_date
+            start_date = start_date - timedelta(days=days_offset)
+    else:
+        raise ValueError("Expected a list of dates, a date, a date range or (date, days_offset, sign)")
+    return [day.date() for day in pd.date_range(start_date.normalize(), end_date.normalize(), freq='D')]
+
+
+def lookup_rollup(rollup_store, googleFit_df, s_name, *args):
+    """The stored rows for a window of the user in googleFit_df, or None to compute from the frame.
+
+    The store answers one user at a time; a frame of several users is always computed, so the
+    aggregates return the same rows with or without a store.
+    """
+    if rollup_store is None or googleFit_df.empty or 'userName' not in googleFit_df.columns:
+        return None
+    user_names = pd.unique(googleFit_df['userName'])
+    if len(user_names) != 1:
+        return None
+    return rollup_store.lookup(user_names[0], s_name, *args)
+
+
+class DailyRollupStore:
+    """Precomputed daily aggregate rows per user and stage, answering the pillar aggregates' date windows.
+
+    The store serves two kinds of stage:
+
+    - A_StepCount, A_WalkingRunningDistance and A_ActivityCalories give a day the same rows whatever
+      window it is in, so lookup() answers any window (single day, range or list of days) of
+      ingested days.
+    - V_HR, S_SleepType and V_TotalCalories depend on the window edges (a record must end inside
+      the window, and sleep of two window days can share a date), so each is computed one window day
+      at a time and lookup() only answers single-day windows. Wider windows return None and are
+      computed from the bronze frame.
+
+    Rows are keyed by the window day they are computed for (windowDate), which is not always their
+    date: S_SleepType dates a stage by its modifiedTime, so a night started on the window day is dated
+    the next day. Each covered day also keeps a digest of the stage's input rows starting on it, and
+    ingest() only recomputes the days whose digest changed.
+    """
+
+    CALORIES_S_NAME = 'V_TotalCalories'
+    ROLLUP_STAGES = ('V_HR', 'A_StepCount', 'A_WalkingRunningDistance', 'A_ActivityCalories', 'S_SleepType')
+    WINDOW_DEPENDENT_STAGES = ('V_HR', 'S_SleepType', CALORIES_S_NAME)
+
+    def __init__(self, db_path=':memory:'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # (userName, s_name) -> 'ExceptionType: message' of the stages that raised in ingest; their days stay uncovered
+        self.failures = {}
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            columns = [column for (_, column, *_) in self._conn.execute("PRAGMA table_info(daily_rollup)")]
+            if columns and 'position' not in columns:
+                # Rows stored before they were keyed by window day and kept in order are recomputed on the next ingest
+                self._conn.execute("DROP TABLE daily_rollup")
+                self._conn.execute("DROP TABLE IF EXISTS rollup_coverage")
+            coverage_columns = [column for (_, column, *_) in self._conn.execute("PRAGMA table_info(rollup_coverage)")]
+            if coverage_columns and 'digest' not in coverage_columns:
+                # Days covered before their inputs were digested are recomputed on the next ingest
+                self._conn.execute("DROP TABLE rollup_coverage")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_rollup (
+                    userName TEXT NOT NULL,
+                    windowDate TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    s_name TEXT NOT NULL,
+                    valueType TEXT NOT NULL,
+                    valueGeneratedAt TEXT,
+                    type TEXT,
+                    unit TEXT,
+                    value REAL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (userName, s_name, windowDate, date, valueType)
+                ) WITHOUT ROWID""")
+            # Window days that were computed, including days that produced no rows, with the digest of their input rows
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_coverage (
+                    userName TEXT NOT NULL,
+                    s_name TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    digest INTEGER,
+                    PRIMARY KEY (userName, s_name, date)
+                ) WITHOUT ROWID""")
+
+    def _stage_classes(self, stages=None):
+        # Imported on first ingest so lookups do not pay for loading every pillar
+        from processing.pillars.registry import stage_class
+        return {s_name: stage_class(s_name) for s_name in self.ROLLUP_STAGES if stages is None or s_name in stages}
+
+    def _calories_rollup(self, googleFit_df, *args):
+        from processing.pillars.vitality.dataStream.v_totalCaloriesBurned import VTotalCalories
+        return VTotalCalories(googleFit_df, *args).daily_totals()
+
+    def _stored_digests(self, user_name, s_name):
+        with self._lock:
+            rows = self._conn.execute("SELECT date, digest FROM rollup_coverage WHERE userName = ? AND s_name = ?",
+                                      (user_name, s_name)).fetchall()
+        return dict(rows)
+
+    @staticmethod
+    def _changed_runs(days):
+        """Split sorted days into runs of consecutive days."""
+        runs = []
+        for day in days:
+            if runs and day - runs[-1][-1] == timedelta(days=1):
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        return runs
+
+    def _stage_rollup(self, user_name, s_name, compute, stage_df, starts, changed_days, digests):
+        """Compute and store the changed days of one user-stage; a stage that raises is recorded in failures and those days left uncovered.
+
+        Each computation is given only the stage rows starting on its days (starts is their sorted
+        naive startDate), which is all a window of those days reads.
+        """
+        def rows_of(first_day, last_day):
+            lo, hi = np.searchsorted(starts, [np.datetime64(first_day, 'ns'),
+                                              np.datetime64(last_day + timedelta(days=1), 'ns')])
+            return stage_df.iloc[lo:hi]
+
+        try:
+            if s_name in self.WINDOW_DEPENDENT_STAGES:
+                return sum(self.upsert(user_name, s_name, compute(rows_of(day, day), day), [day], window_day=day,
+                                       digests=digests) for day in changed_days)
+            return sum(self.upsert(user_name, s_name, compute(rows_of(run[0], run[-1]), run[0], run[-1]), run,
+                                   digests=digests) for run in self._changed_runs(changed_days))
+        except Exception as error:
+            self.failures[(user_name, s_name)] = f'{type(error).__name__}: {error}'
+            # Rows stored by an earlier ingest may no longer match the bronze data, so those days are recomputed on lookup
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM rollup_coverage WHERE userName = ? AND s_name = ? AND date = ?",
+                                       [(user_name, s_name, str(day)) for day in changed_days])
+            return 0
+
+    def ingest(self, googleFit_df, stages=None):
+        """Recompute and upsert the rollup rows of the user-days in a bronze frame whose data changed.
+
+        A day is recomputed per stage when the stage's input rows starting on it (its registry data
+        sources) differ from those of the previous ingest, or when it was never covered; other days
+        keep their stored rows, so re-ingesting a full export only pays for the new days. stages
+        limits the refresh to those stages, for a frame that only holds their data sources; the other
+        stages keep their stored rows. A stage that raises is recorded in failures (keyed by user
+        and stage) and the rest are still stored.
+        """
+        if googleFit_df.empty or 'userName' not in googleFit_df.columns:
+            return 0
+        from processing.pillars.registry import STAGE_REGISTRY
+
+        stage_classes = self._stage_classes(stages)
+        computes = {s_name: (lambda rows_df, *window, stage_cls=stage_cls: stage_cls(rows_df, *map(str, window)).process())
+                    for s_name, stage_cls in stage_classes.items()}
+        if stages is None or self.CALORIES_S_NAME in stages:
+            computes[self.CALORIES_S_NAME] = lambda rows_df, *window: self._calories_rollup(rows_df, *map(str, window))
+
+        start_dates = pd.to_datetime(googleFit_df['startDate']).dt.tz_localize(None).to_numpy()
+        start_days = start_dates.astype('datetime64[D]')
+        data_source = googleFit_df['data_source'].to_numpy() if 'data_source' in googleFit_df.columns else None
+        # Summed per day, so a day's digest does not depend on the order of its rows
+        row_hashes = pd.util.hash_pandas_object(googleFit_df, index=False).to_numpy()
+        written = 0
+        for user_name, user_positions in googleFit_df.groupby('userName').indices.items():
+            covered_days = window_dates(start_dates[user_positions].min(), start_dates[user_positions].max())
+            for s_name, compute in computes.items():
+                self.failures.pop((user_name, s_name), None)
+                positions = user_positions
+                data_sources = STAGE_REGISTRY[s_name]['data_sources']
+                if data_sources is not None and data_source is not None:
+                    positions = positions[np.isin(data_source[positions], data_sources)]
+
+                day_digests = pd.Series(row_hashes[positions]).groupby(start_days[positions]).sum()
+                # SQLite integers are signed 64-bit
+                digests = dict(zip(map(str, day_digests.index.date), day_digests.to_numpy().view('int64').tolist()))
+                digests.update({str(day): 0 for day in covered_days if str(day) not in digests})
+                stored = self._stored_digests(user_name, s_name)
+                changed_days = [day for day in covered_days if stored.get(str(day)) != digests[str(day)]]
+                if not changed_days:
+                    continue
+
+                # take() keeps df.attrs, and sorting by startDate keeps a conforming frame conforming
+                positions = positions[np.argsort(start_dates[positions], kind='stable')]
+                written += self._stage_rollup(user_name, s_name, compute, googleFit_df.take(positions),
+                                              start_dates[positions], changed_days, digests)
+        return written
+
+    def upsert(self, user_name, s_name, agg_df, covered_days, window_day=None, digests=None):
+        """Replace the stored rows of one user-stage for the given window days with agg_df.
+
+        Rows are keyed by their own date, or all by window_day for a stage computed on that one day,
+        and keep their position in agg_df so lookups return them in the aggregate's order.
+        digests maps a day to the digest of its input rows; days without one are recomputed on the next ingest.
+        """
+        day_keys = [str(day) for day in covered_days]
+        rows = [
+            (user_name, str(window_day or row.date), str(row.date), s_name, row.valueType, str(row.valueGeneratedAt),
+             row.type, row.unit, None if pd.isna(row.value) else float(row.value), position)
+            for position, row in enumerate(agg_df[AGG_COLUMNS].itertuples(index=False))
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM daily_rollup WHERE userName = ? AND s_name = ? AND windowDate = ?",
+                                   [(user_name, s_name, day) for day in day_keys])
+            self._conn.executemany("INSERT OR REPLACE INTO daily_rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO rollup_coverage VALUES (?, ?, ?, ?)",
+                                   [(user_name, s_name, day, (digests or {}).get(day)) for day in day_keys])
+        return len(rows)
+
+    def lookup(self, user_name, s_name, *args):
+        """Return the stored aggregate rows for a date window, or None if the store cannot answer it exactly.
+
+        That is when a day of the window was never computed, or for a window-dependent stage, when
+        the window is wider than one day.
+        """
+        days = window_dates(*args)
+        if not days or (s_name in self.WINDOW_DEPENDENT_STAGES and len(days) > 1):
+            return None
+        day_keys = [str(day) for day in days]
+        start_key, end_key = day_keys[0], day_keys[-1]
+
+        with self._lock:
+            covered = self._conn.execute(
+                "SELECT date FROM rollup_coverage WHERE userName = ? AND s_name = ? AND date BETWEEN ? AND ?",
+                (user_name, s_name, start_key, end_key)).fetchall()
+            if not set(day_keys).issubset({date for (date,) in covered}):
+                return None
+            rows = self._conn.execute(
+                "SELECT windowDate, userName, valueGeneratedAt, s_name, date, type, unit, valueType, value FROM daily_rollup "
+                "WHERE userName = ? AND s_name = ? AND windowDate BETWEEN ? AND ? ORDER BY windowDate DESC, position",
+                (user_name, s_name, start_key, end_key)).fetchall()
+
+        rollup_df = pd.DataFrame(rows, columns=['windowDate'] + AGG_COLUMNS)
+        rollup_df = rollup_df[rollup_df['windowDate'].isin(day_keys)][AGG_COLUMNS]
+        rollup_df['date'] = pd.to_datetime(rollup_df['date']).dt.date
+        rollup_df['value'] = rollup_df['value'].astype('float64')
+        return rollup_df.reset_index(drop=True)
+
+    def compute(self, googleFit_df, s_name, *args):
+        """The aggregate rows of a rollup stage for a window, computed from googleFit_df as the store computes them."""
+        if s_name == self.CALORIES_S_NAME:
+            return self._calories_rollup(googleFit_df, *args)
+        return self._stage_classes([s_name])[s_name](googleFit_df, *args).process()
+
+    def parity(self, googleFit_df, user_name, s_name, *args):
+        """Rows where the stored answer for a window and the aggregate computed from googleFit_df disagree.
+
+        Compared on date, valueType, type, unit and value; an empty frame means the store answers
+        the window exactly. None when the store does not answer it (see lookup).
+        """
+        stored_df = self.lookup(user_name, s_name, *args)
+        if stored_df is None:
+            return None
+        computed_df = self.compute(googleFit_df[googleFit_df['userName'] == user_name], s_name, *args)
+
+        keys = ['date', 'valueType', 'type', 'unit', 'value']
+        frames = []
+        for name, agg_df in (('stored', stored_df), ('computed', computed_df)):
+            agg_df = agg_df.reindex(columns=keys).assign(date=lambda df: pd.to_datetime(df['date']).dt.date,
+                                                         value=lambda df: pd.to_numeric(df['value']).round(1))
+            # Numbered within equal keys, so repeated rows (S_SleepType) are matched one to one
+            frames.append(agg_df.assign(occurrence=agg_df.groupby(keys, dropna=False).cumcount()))
+        compared = frames[0].merge(frames[1], on=keys + ['occurrence'], how='outer', indicator='side')
+        compared = compared[compared['side'] != 'both']
+        compared['side'] = compared['side'].map({'left_only': 'stored', 'right_only': 'computed'})
+        return compared.drop(columns='occurrence').reset_index(drop=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,30 @@
+import os
+import warnings
+
+import pytest
+
+from data_source.parseData.googleFitDataParsing import ParseData
+
+FIT_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'local_files', 'Fit')
+USER_NAME = 'u1'
+
+
+@pytest.fixture(scope='session')
+def user_name():
+    return USER_NAME
+
+
+@pytest.fixture(scope='session')
+def googleFit_df():
+    """The sample All Data export as a bronze frame of one user."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ParseData().allData_json(os.path.join(FIT_FOLDER, 'All Data'), user_name=USER_NAME)
+
+
+@pytest.fixture(scope='session')
+def googleFit_activitiesData():
+    """The sample TCX activities of the same user."""
+    activities_df = ParseData().activities_tcx(os.path.join(FIT_FOLDER, 'Activities'))
+    activities_df['userName'] = USER_NAME
+    return activities_df
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from data_source.parseData.bronzeContract import is_conforming
+from processing.engine.pillarRunner import PillarRunner
+
+
+@pytest.fixture(scope='module')
+def runs(googleFit_df, googleFit_activitiesData):
+    slow_df = googleFit_df.copy()
+    slow_df.attrs = {}
+    assert is_conforming(googleFit_df) and not is_conforming(slow_df)
+    window = ('2024-09-16', '2024-09-30')
+    return (PillarRunner(googleFit_df, googleFit_activitiesData, *window).process(),
+            PillarRunner(slow_df, googleFit_activitiesData, *window).process())
+
+
+def test_fast_path_runs_every_stage(runs):
+    fast, _ = runs
+    assert all(stage_df.attrs['stageTiming']['error'] is None for stage_df in fast.values())
+
+
+def test_fast_path_matches_the_defensive_path(runs):
+    fast, slow = runs
+    assert fast.keys() == slow.keys()
+    for s_name in fast:
+        pd.testing.assert_frame_equal(fast[s_name].drop(columns='valueGeneratedAt', errors='ignore').reset_index(drop=True),
+                                      slow[s_name].drop(columns='valueGeneratedAt', errors='ignore').reset_index(drop=True),
+                                      obj=s_name)
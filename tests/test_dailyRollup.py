@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from processing.pillars.registry import STAGE_REGISTRY, load_class
+from processing.rollup.dailyRollup import DailyRollupStore, window_dates
+
+STAGES = DailyRollupStore.ROLLUP_STAGES + (DailyRollupStore.CALORIES_S_NAME,)
+DAYS = [str(day) for day in window_dates('2024-09-15', '2024-10-07')]
+
+
+@pytest.fixture(scope='module')
+def rollup_store(googleFit_df):
+    store = DailyRollupStore()
+    store.ingest(googleFit_df)
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('s_name', STAGES)
+def test_every_day_matches_the_computed_aggregate(rollup_store, googleFit_df, user_name, s_name):
+    assert rollup_store.failures == {}
+    for day in DAYS:
+        assert rollup_store.parity(googleFit_df, user_name, s_name, day).empty, day
+
+
+@pytest.mark.parametrize('s_name', [s_name for s_name in STAGES if s_name not in DailyRollupStore.WINDOW_DEPENDENT_STAGES])
+@pytest.mark.parametrize('window', [('2024-09-16', '2024-09-22'), (['2024-09-18', '2024-09-21'],), ('2024-09-24', 3, '-')])
+def test_additive_stages_answer_any_window(rollup_store, googleFit_df, user_name, s_name, window):
+    assert rollup_store.parity(googleFit_df, user_name, s_name, *window).empty
+
+
+@pytest.mark.parametrize('s_name', DailyRollupStore.WINDOW_DEPENDENT_STAGES)
+def test_window_dependent_stages_only_answer_single_days(rollup_store, user_name, s_name):
+    assert rollup_store.lookup(user_name, s_name, '2024-09-16', '2024-09-22') is None
+
+
+@pytest.mark.parametrize('s_name', DailyRollupStore.ROLLUP_STAGES)
+def test_aggregates_return_the_same_rows_with_a_store(rollup_store, googleFit_df, s_name):
+    aggregate_cls = load_class(STAGE_REGISTRY[s_name]['aggregate'])
+    for window in [('2024-09-20',), ('2024-09-16', '2024-09-22')]:
+        direct = aggregate_cls(googleFit_df, *window).process()
+        stored = aggregate_cls(googleFit_df, *window, rollup_store=rollup_store).process()
+        columns = ['date', 'valueType', 'type', 'unit']
+        pd.testing.assert_frame_equal(stored[columns].reset_index(drop=True), direct[columns].reset_index(drop=True))
+        pd.testing.assert_series_equal(pd.to_numeric(stored['value']).reset_index(drop=True),
+                                       pd.to_numeric(direct['value']).astype('float64').reset_index(drop=True),
+                                       check_names=False, check_exact=True)
+
+
+def test_ingest_only_recomputes_changed_days(googleFit_df, user_name):
+    store = DailyRollupStore()
+    assert store.ingest(googleFit_df) > 0
+    assert store.ingest(googleFit_df) == 0
+
+    changed_df = googleFit_df.copy()
+    steps = changed_df.index[(changed_df['startDate'].dt.date == pd.Timestamp('2024-09-20').date())
+                             & changed_df['data_source'].str.contains('estimated_steps')]
+    changed_df.loc[steps[0], 'fit_value'] += 1000
+    assert 0 < store.ingest(changed_df) < 20
+    assert store.parity(changed_df, user_name, 'A_StepCount', '2024-09-15', '2024-10-07').empty
+    store.close()
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from data_source.storage.hrStore import HeartRateStore
+from processing.pillars.vitality.dataAggregate.v_hr_aggFunc import VHRagg
+from processing.pillars.vitality.dataStream.v_hr_types import VHeartRate
+
+WINDOWS = [('2024-09-20',), ('2024-09-15', '2024-10-07'), (['2024-09-20', '2024-09-25'],), ('2024-09-25', 3, '-')]
+
+
+@pytest.fixture(scope='module')
+def hr_store(googleFit_df, tmp_path_factory):
+    store = HeartRateStore(str(tmp_path_factory.mktemp('hr')))
+    store.write(googleFit_df)
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_stream_reads_the_same_heart_rate_from_the_store(googleFit_df, hr_store, window):
+    direct = VHeartRate(googleFit_df, *window).process()
+    stored = VHeartRate(googleFit_df, *window, hr_store=hr_store).process()
+    columns = ['fit_value', 'sleep', 'activity', 'workout', 'resting', 'originDataSourceId']
+    pd.testing.assert_frame_equal(stored[columns].reset_index(drop=True), direct[columns].reset_index(drop=True),
+                                  check_dtype=False)
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_aggregate_is_unchanged_by_the_store(googleFit_df, hr_store, window):
+    columns = ['date', 'valueType', 'value']
+    direct = VHRagg(googleFit_df, *window).process()
+    stored = VHRagg(googleFit_df, *window, hr_store=hr_store).process()
+    pd.testing.assert_frame_equal(stored[columns].reset_index(drop=True), direct[columns].reset_index(drop=True))
+
+
+def test_rewriting_the_same_history_is_a_no_op(googleFit_df, hr_store, user_name):
+    before = hr_store.read(user_name, '2024-09-15', '2024-10-07')
+    hr_store.write(googleFit_df)
+    pd.testing.assert_frame_equal(hr_store.read(user_name, '2024-09-15', '2024-10-07'), before)
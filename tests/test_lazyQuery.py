@@ -0,0 +1,22 @@
+import pytest
+
+from processing.pillars.registry import STAGE_REGISTRY, load_class
+from processing.query.lazyQuery import PillarQuery
+
+
+def _comparable(df):
+    return df.drop(columns='valueGeneratedAt', errors='ignore').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('s_name', [s_name for s_name, entry in STAGE_REGISTRY.items() if entry['source'] == 'allData'])
+@pytest.mark.parametrize('window', [('2024-10-03',), ('2024-09-20', '2024-10-03')])
+def test_query_matches_direct_construction(googleFit_df, user_name, s_name, window):
+    """The pushed-down scan keeps every row a stage reads, including its padding days."""
+    queried = PillarQuery(googleFit_df).for_user(user_name).window(*window).stream(s_name).collect()
+    direct = load_class(STAGE_REGISTRY[s_name]['stream'])(googleFit_df, *window).process()
+    assert _comparable(queried).equals(_comparable(direct))
+
+
+def test_padded_stage_reads_its_history(googleFit_df, user_name):
+    queried = PillarQuery(googleFit_df).for_user(user_name).window('2024-10-03').stream('B_BodyMetrics').collect()
+    assert queried[['weightKg', 'heightM', 'bmrKcalPerDay']].notna().all().all()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing.kernels.numpyKernels import (
+    daily_additive_totals, group_quantile, group_reduce, interval_overlap_mask, nearest_lookup,
+    resolve_additive_intervals, sliding_extreme,
+)
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+
+def test_interval_overlap_mask_matches_pandas_intervals(rng):
+    starts = rng.integers(0, 1000, 200)
+    ends = starts + rng.integers(0, 30, 200)
+    event_starts = rng.integers(0, 1000, 40)
+    event_ends = event_starts + rng.integers(0, 30, 40)
+
+    intervals = pd.arrays.IntervalArray.from_arrays(starts, ends, closed='both')
+    expected = np.zeros(len(starts), dtype=bool)
+    for event_start, event_end in zip(event_starts, event_ends):
+        expected |= intervals.overlaps(pd.Interval(event_start, event_end, closed='both'))
+
+    np.testing.assert_array_equal(interval_overlap_mask(starts, ends, event_starts, event_ends), expected)
+    assert not interval_overlap_mask(starts, ends, [], []).any()
+
+
+@pytest.mark.parametrize('how', ['min', 'max', 'sum', 'mean', 'count'])
+def test_group_reduce_matches_groupby(rng, how):
+    n_groups = 12
+    codes = rng.integers(-1, n_groups + 1, 500)
+    values = rng.normal(70, 10, 500)
+    values[rng.random(500) < 0.1] = np.nan
+    codes[codes == 5] = 6  # group 5 stays empty
+
+    in_range = (codes >= 0) & (codes < n_groups)
+    expected = pd.Series(values[in_range]).groupby(codes[in_range]).agg(how).reindex(range(n_groups))
+    if how == 'count':
+        expected = expected.fillna(0)
+    elif how == 'sum':
+        # pandas sums an all-NaN group to 0; the kernel leaves groups without values NaN
+        expected[pd.Series(values[in_range]).groupby(codes[in_range]).count().reindex(range(n_groups)).fillna(0) == 0] = np.nan
+
+    np.testing.assert_allclose(group_reduce(codes, values, n_groups, how), expected.to_numpy())
+
+
+def test_group_reduce_rejects_unknown_reducer():
+    with pytest.raises(ValueError):
+        group_reduce([0], [1.0], 1, 'median')
+
+
+@pytest.mark.parametrize('how', ['max', 'min'])
+@pytest.mark.parametrize('window', [1, 3, 7, 50])
+def test_sliding_extreme_matches_rolling(rng, how, window):
+    values = rng.normal(0, 1, 300)
+    values[rng.random(300) < 0.2] = np.nan
+    expected = getattr(pd.Series(values).rolling(window, min_periods=1), how)()
+    np.testing.assert_allclose(sliding_extreme(values, window, how), expected.to_numpy())
+
+
+def test_resolve_additive_intervals_counts_every_instant_once():
+    starts, ends, values = resolve_additive_intervals([0, 0, 5, 20, 30], [10, 10, 15, 25, 30], [10.0, 10.0, 20.0, 5.0, 3.0])
+    # The repeated interval is kept once, the overlap goes to the earlier interval, and the
+    # instantaneous point keeps its value on a 1 ns extent
+    np.testing.assert_array_equal(starts, [0, 10, 20, 30])
+    np.testing.assert_array_equal(ends, [10, 15, 25, 31])
+    np.testing.assert_allclose(values, [10.0, 10.0, 5.0, 3.0])
+
+
+def test_daily_additive_totals_split_across_midnight(rng):
+    day_starts = np.arange(5) * DAY_NS
+    starts = np.sort(rng.choice(np.arange(0, 5 * DAY_NS - 3 * 60 * 60 * 10**9, 60 * 60 * 10**9), 40, replace=False))
+    ends = starts + rng.integers(1, 3 * 60 * 60 * 10**9, 40)
+    values = rng.uniform(1, 500, 40)
+
+    resolved = pd.DataFrame(dict(zip(('start', 'end', 'value'), resolve_additive_intervals(starts, ends, values))))
+    expected = []
+    for day_start in day_starts:
+        kept = (resolved['end'].clip(upper=day_start + DAY_NS) - resolved['start'].clip(lower=day_start)).clip(lower=0)
+        expected.append((resolved['value'] * kept / (resolved['end'] - resolved['start'])).sum())
+
+    totals, has_data = daily_additive_totals(starts, ends, values, day_starts)
+    np.testing.assert_allclose(totals, expected)
+    np.testing.assert_array_equal(has_data, np.array(expected) > 0)
+    assert np.isclose(totals.sum(), resolved['value'].sum())
+
+
+@pytest.mark.parametrize('q', [0.0, 0.1, 0.5, 0.9, 1.0])
+def test_group_quantile_matches_groupby(rng, q):
+    n_groups = 8
+    codes = rng.integers(0, n_groups, 400)
+    values = rng.normal(60, 15, 400)
+    values[rng.random(400) < 0.1] = np.nan
+    codes[codes == 3] = 4
+
+    expected = pd.Series(values).groupby(codes).quantile(q).reindex(range(n_groups))
+    np.testing.assert_allclose(group_quantile(codes, values, n_groups, q), expected.to_numpy())
+
+
+def test_nearest_lookup_matches_merge_asof(rng):
+    times = np.sort(rng.choice(np.arange(0, 10**6, 7), 300, replace=False))
+    values = rng.normal(80, 5, 300)
+    query = rng.integers(-50, 10**6 + 50, 500)
+    tolerance = 20
+
+    expected = pd.merge_asof(pd.DataFrame({'t': query}).reset_index().sort_values('t'),
+                             pd.DataFrame({'t': times, 'value': values}),
+                             on='t', direction='nearest', tolerance=tolerance).set_index('index').sort_index()['value']
+    np.testing.assert_allclose(nearest_lookup(times, values, query, tolerance), expected.to_numpy())
+    assert np.isnan(nearest_lookup([], [], query, tolerance)).all()
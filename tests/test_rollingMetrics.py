@@ -0,0 +1,23 @@
+import pandas as pd
+
+from insights.rollingMetrics import RollingMetrics
+from processing.rollup.dailyRollup import DailyRollupStore
+
+WINDOW = ('2024-09-15', '2024-10-07')
+
+
+def _comparable(df):
+    return df.drop(columns='valueGeneratedAt').reset_index(drop=True)
+
+
+def test_from_rollup_matches_the_window_aggregates(googleFit_df, user_name):
+    store = DailyRollupStore()
+    store.ingest(googleFit_df)
+    s_names = dict.fromkeys(s_name for s_name, _, _ in RollingMetrics.METRICS.values())
+    expected = RollingMetrics(pd.concat([store.compute(googleFit_df, s_name, *WINDOW) for s_name in s_names])).process()
+
+    assert _comparable(RollingMetrics.from_rollup(store, user_name, *WINDOW, googleFit_df=googleFit_df).process()).equals(
+        _comparable(expected))
+    # Without the bronze frame only the additive metrics can be built
+    assert set(RollingMetrics.from_rollup(store, user_name, *WINDOW).process()['type']) == {'steps'}
+    store.close()